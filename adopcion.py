@@ -1,12 +1,22 @@
 # adopcion.py
+from collections import Counter
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from sqlmodel import select
+from sqlalchemy import insert, tuple_, update
 from sqlalchemy.exc import IntegrityError
 
-from db import SessionDep
+from bulk import BulkReport, lotes_validados
+from cache import invalidate
+from db import ReadSessionDep, SessionDep
+from etag import condicional, registrar_cambio
+from export import export_response
+from fastjson import responder, seleccionar
+from loader import LoaderDep
 from models import Adopcion, AdopcionCreate, Mascota, Refugio
+from pagination import check_paging, decode_fecha_id_cursor, set_next_cursor
+from rollups import mover_mascota, registrar_adopcion, registrar_mascota
 
 router = APIRouter(prefix="/adopciones", tags=["adopciones"])
 
@@ -17,36 +27,139 @@ router = APIRouter(prefix="/adopciones", tags=["adopciones"])
     status_code=201,
     summary="Registrar una adopción",
 )
-async def create_adopcion(new_adopcion: AdopcionCreate, session: SessionDep):
-    mascota = await session.get(Mascota, new_adopcion.mascota_id)
-    refugio = await session.get(Refugio, new_adopcion.refugio_id)
-
-    if not mascota:
-        raise HTTPException(status_code=404, detail="Mascota no encontrada")
-    if not refugio:
-        raise HTTPException(status_code=404, detail="Refugio no encontrado")
-
-    if not mascota.estado:
+async def create_adopcion(new_adopcion: AdopcionCreate, session: SessionDep, loader: LoaderDep):
+    # Todo ocurre en una sola transacción:
+    # 1) reservar la mascota con un UPDATE condicional; si dos requests compiten
+    #    por la misma mascota, solo una ve estado=True y obtiene la fila
+    result = await session.exec(
+        update(Mascota)
+        .where(Mascota.id == new_adopcion.mascota_id, Mascota.estado == True)
+        .values(estado=False)
+        .returning(Mascota.refugio_id, Mascota.especie)
+    )
+    reservada = result.first()
+
+    if reservada is None:
+        await session.rollback()
+        (mascotas,) = await loader.existentes((Mascota.id, [new_adopcion.mascota_id]))
+        if not mascotas:
+            raise HTTPException(status_code=404, detail="Mascota no encontrada")
         raise HTTPException(status_code=400, detail="La mascota ya no está disponible para adopción")
 
+    # 2) insertar la adopción y actualizar los resúmenes
     adopcion = Adopcion.model_validate(new_adopcion)
     session.add(adopcion)
-
+    refugio_mascota, especie = reservada
+    await mover_mascota(
+        session, (refugio_mascota, especie, True), (refugio_mascota, especie, False)
+    )
+    await registrar_adopcion(session, adopcion.refugio_id, adopcion.fecha_adopcion)
+    await registrar_cambio(session, "adopcion", "mascota")
+
+    # 3) commit: la FK de refugio y el índice único sobre adopcion.mascota_id
+    #    (migración 002) son la última garantía
     try:
         await session.commit()
     except IntegrityError:
         await session.rollback()
+        (refugios,) = await loader.existentes((Refugio.id, [new_adopcion.refugio_id]))
+        if not refugios:
+            raise HTTPException(status_code=404, detail="Refugio no encontrado")
         raise HTTPException(status_code=400, detail="La mascota ya tiene una adopción registrada")
 
-    await session.refresh(adopcion)
+    invalidate("adopcion", "mascota")
+    return adopcion
+
 
-    # marcar mascota como no disponible
-    mascota.estado = False
-    session.add(mascota)
-    await session.commit()
-    await session.refresh(mascota)
+@router.post(
+    "/bulk",
+    summary="Carga masiva de adopciones (NDJSON o CSV en streaming)",
+)
+async def bulk_adopciones(request: Request, session: SessionDep, loader: LoaderDep):
+    report = BulkReport()
+
+    async for lote in lotes_validados(request, AdopcionCreate, report):
+        # Refugios existentes y mascotas ya adoptadas: un solo viaje a la base
+        refugios, ya_adoptadas = await loader.existentes(
+            (Refugio.id, {a.refugio_id for _, a in lote}),
+            (Adopcion.mascota_id, {a.mascota_id for _, a in lote}),
+        )
 
-    return adopcion
+        candidatas: dict[int, tuple[int, AdopcionCreate]] = {}
+        for fila, a in lote:
+            if a.refugio_id not in refugios:
+                report.error(fila, "Refugio no encontrado")
+            elif a.mascota_id in ya_adoptadas or a.mascota_id in candidatas:
+                report.error(fila, "La mascota ya tiene una adopción registrada")
+            else:
+                candidatas[a.mascota_id] = (fila, a)
+
+        if not candidatas:
+            continue
+
+        # Marcar como no disponibles solo las que siguen disponibles
+        result = await session.exec(
+            update(Mascota)
+            .where(Mascota.id.in_(candidatas), Mascota.estado == True)
+            .values(estado=False)
+            .returning(Mascota.id, Mascota.refugio_id, Mascota.especie)
+        )
+        adoptadas = {
+            mascota_id: (refugio_id, especie) for mascota_id, refugio_id, especie in result.all()
+        }
+
+        filas = []
+        numeros = []
+        movidas: Counter = Counter()
+        por_mes: Counter = Counter()
+        for mascota_id, (fila, a) in candidatas.items():
+            if mascota_id not in adoptadas:
+                report.error(fila, "Mascota no encontrada o no disponible para adopción")
+                continue
+            filas.append(a.model_dump())
+            numeros.append(fila)
+            movidas[adoptadas[mascota_id]] += 1
+            por_mes[(a.refugio_id, a.fecha_adopcion.replace(day=1))] += 1
+
+        if not filas:
+            await session.rollback()
+            continue
+        await session.exec(insert(Adopcion), params=filas)
+        for (refugio_id, especie), total in movidas.items():
+            await registrar_mascota(session, refugio_id, especie, True, delta=-total)
+            await registrar_mascota(session, refugio_id, especie, False, delta=total)
+        for (refugio_id, mes), total in por_mes.items():
+            await registrar_adopcion(session, refugio_id, mes, delta=total)
+        await registrar_cambio(session, "adopcion", "mascota")
+
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Otra petición adoptó alguna de estas mascotas a la vez: se revierte el lote
+            await session.rollback()
+            for fila in numeros:
+                report.error(fila, "Conflicto con otra adopción simultánea; lote revertido")
+            continue
+        report.insertadas += len(filas)
+
+    if report.insertadas:
+        invalidate("adopcion", "mascota")
+    return report.as_dict()
+
+
+def _filtrar(stmt, anio, refugio_id, mascota_id):
+    """Filtros comunes al listado y a la exportación."""
+    if anio is not None:
+        stmt = stmt.where(
+            Adopcion.fecha_adopcion.between(f"{anio}-01-01", f"{anio}-12-31")
+        )
+
+    if refugio_id is not None:
+        stmt = stmt.where(Adopcion.refugio_id == refugio_id)
+
+    if mascota_id is not None:
+        stmt = stmt.where(Adopcion.mascota_id == mascota_id)
+    return stmt
 
 
 @router.get(
@@ -54,27 +167,48 @@ async def create_adopcion(new_adopcion: AdopcionCreate, session: SessionDep):
     response_model=List[Adopcion],
     summary="Listar adopciones con filtros",
 )
+@condicional("adopcion")
 async def list_adopciones(
-    session: SessionDep,
+    request: Request,
+    session: ReadSessionDep,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: str | None = Query(None, description="Cursor devuelto en X-Next-Cursor"),
     anio: int | None = Query(None, description="Filtrar por año"),
     refugio_id: int | None = Query(None, description="Filtrar por refugio"),
     mascota_id: int | None = Query(None, description="Filtrar por mascota"),
 ):
-    stmt = select(Adopcion)
-
-    if anio is not None:
-        stmt = stmt.where(
-            Adopcion.fecha_adopcion.between(f"{anio}-01-01", f"{anio}-12-31")
-        )
+    check_paging(skip, cursor)
+    # Orden estable: más recientes primero, desempate por id
+    stmt = seleccionar(Adopcion).order_by(Adopcion.fecha_adopcion.desc(), Adopcion.id.desc())
 
-    if refugio_id is not None:
-        stmt = stmt.where(Adopcion.refugio_id == refugio_id)
-
-    if mascota_id is not None:
-        stmt = stmt.where(Adopcion.mascota_id == mascota_id)
+    if cursor is not None:
+        fecha, last_id = decode_fecha_id_cursor(cursor, "adopciones")
+        stmt = stmt.where(tuple_(Adopcion.fecha_adopcion, Adopcion.id) < (fecha, last_id))
 
+    stmt = _filtrar(stmt, anio, refugio_id, mascota_id)
     stmt = stmt.offset(skip).limit(limit)
     result = await session.exec(stmt)
-    return result.all()
+    adopciones = result.all()
+    set_next_cursor(
+        response, adopciones, limit, "adopciones", lambda a: (a.fecha_adopcion, a.id)
+    )
+    return responder(adopciones, response)
+
+
+@router.get(
+    "/export",
+    summary="Exportar adopciones (CSV o NDJSON en streaming)",
+)
+async def export_adopciones(
+    formato: str = Query("csv", description="csv o ndjson"),
+    anio: int | None = Query(None, description="Filtrar por año"),
+    refugio_id: int | None = Query(None, description="Filtrar por refugio"),
+    mascota_id: int | None = Query(None, description="Filtrar por mascota"),
+):
+    stmt = select(*Adopcion.__table__.columns).order_by(
+        Adopcion.fecha_adopcion.desc(), Adopcion.id.desc()
+    )
+    stmt = _filtrar(stmt, anio, refugio_id, mascota_id)
+    return export_response(stmt, formato, "adopciones")
@@ -0,0 +1,65 @@
+# arranque.py
+"""
+Tiempos de arranque del worker.
+
+`main.py` importa este módulo antes que nada y marca el fin de cada fase
+(imports, construcción de la app, pasos del lifespan). Al terminar el
+lifespan el reporte se registra en el logger "arranque" y queda disponible
+en `GET /health/startup`.
+
+Para ver el detalle módulo por módulo de los imports:
+
+    python -X importtime -c "import main" 2> importtime.log
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("arranque")
+
+_inicio = time.perf_counter()
+_ultimo = _inicio
+_fases: list[tuple[str, float]] = []
+_listo: float | None = None
+
+
+def marcar(fase: str) -> None:
+    """Registra el tiempo transcurrido desde la marca anterior como `fase`."""
+    global _ultimo
+    ahora = time.perf_counter()
+    _fases.append((fase, ahora - _ultimo))
+    _ultimo = ahora
+
+
+@contextmanager
+def medir(fase: str):
+    """Registra la duración del bloque como `fase`."""
+    global _ultimo
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _ultimo = time.perf_counter()
+        _fases.append((fase, _ultimo - inicio))
+
+
+def reporte() -> dict:
+    fin = _listo if _listo is not None else time.perf_counter()
+    return {
+        "listo": _listo is not None,
+        "total_ms": round((fin - _inicio) * 1000, 1),
+        "fases": [{"fase": fase, "ms": round(duracion * 1000, 1)} for fase, duracion in _fases],
+    }
+
+
+def listo() -> None:
+    """Fin del arranque: cierra el reporte y lo registra."""
+    global _listo
+    _listo = time.perf_counter()
+    datos = reporte()
+    logger.info(
+        "arranque en %.1f ms: %s",
+        datos["total_ms"],
+        ", ".join(f"{f['fase']}={f['ms']:.1f}ms" for f in datos["fases"]),
+        extra={"startup_ms": datos["total_ms"], "fases": datos["fases"]},
+    )
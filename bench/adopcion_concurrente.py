@@ -0,0 +1,95 @@
+# bench/adopcion_concurrente.py
+"""
+Benchmark de concurrencia para POST /adopciones/.
+
+Crea un refugio y una mascota y dispara N adopciones en paralelo sobre esa
+misma mascota. Exactamente una debe responder 201; el resto 400. Repite el
+proceso varias rondas e informa la latencia observada.
+
+    uvicorn main:app --workers 4
+    python bench/adopcion_concurrente.py --url http://127.0.0.1:8000 -n 50 --rondas 10
+
+Sale con código 1 si alguna ronda no tiene exactamente una adopción exitosa.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+
+async def _crear_mascota(client: httpx.AsyncClient, refugio_id: int, ronda: int) -> int:
+    r = await client.post(
+        "/mascotas/",
+        json={
+            "nombre": f"bench-{ronda}",
+            "especie": "Dog",
+            "edad": 1,
+            "sexo": "M",
+            "refugio_id": refugio_id,
+        },
+    )
+    r.raise_for_status()
+    return r.json()["id"]
+
+
+async def _adoptar(client: httpx.AsyncClient, mascota_id: int, refugio_id: int, i: int):
+    inicio = time.perf_counter()
+    r = await client.post(
+        "/adopciones/",
+        json={
+            "mascota_id": mascota_id,
+            "refugio_id": refugio_id,
+            "adoptante": f"adoptante-{i}",
+            "fecha_adopcion": "2024-01-01",
+        },
+    )
+    return r.status_code, time.perf_counter() - inicio
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("-n", type=int, default=50, help="adopciones simultáneas por ronda")
+    parser.add_argument("--rondas", type=int, default=5)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.n, max_keepalive_connections=args.n)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        r = await client.post("/refugios/", json={"nombre": "bench", "ubicacion": "bench"})
+        r.raise_for_status()
+        refugio_id = r.json()["id"]
+
+        latencias: list[float] = []
+        fallos = 0
+        for ronda in range(args.rondas):
+            mascota_id = await _crear_mascota(client, refugio_id, ronda)
+            resultados = await asyncio.gather(
+                *(_adoptar(client, mascota_id, refugio_id, i) for i in range(args.n))
+            )
+            codigos = [codigo for codigo, _ in resultados]
+            latencias.extend(t for _, t in resultados)
+
+            exitos = codigos.count(201)
+            inesperados = [c for c in codigos if c not in (201, 400)]
+            estado = "OK" if exitos == 1 and not inesperados else "FALLO"
+            if estado != "OK":
+                fallos += 1
+            print(
+                f"ronda {ronda + 1}: mascota={mascota_id} 201={exitos} "
+                f"400={codigos.count(400)} otros={inesperados} -> {estado}"
+            )
+
+    latencias.sort()
+    p95 = latencias[int(len(latencias) * 0.95) - 1]
+    print(
+        f"\n{len(latencias)} requests | p50={statistics.median(latencias) * 1000:.1f} ms "
+        f"p95={p95 * 1000:.1f} ms max={latencias[-1] * 1000:.1f} ms"
+    )
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
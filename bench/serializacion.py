@@ -0,0 +1,142 @@
+# bench/serializacion.py
+"""
+Micro-benchmark de serialización de los listados.
+
+Para cada router compara, sobre una base SQLite en memoria con filas de
+prueba, el camino actual (objetos ORM + validación de `response_model` +
+json de la biblioteca estándar) con el camino rápido de fastjson.py
+(columnas + orjson). Mide consulta y serialización, no la red.
+
+    python bench/serializacion.py --filas 100 --repeticiones 200
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlmodel import Session, SQLModel, select  # noqa: E402
+
+import adopcion  # noqa: E402
+import historial  # noqa: E402
+import mascota  # noqa: E402
+import refugio  # noqa: E402
+from fastjson import ORJSON_DISPONIBLE, FastJSONResponse  # noqa: E402
+from models import Adopcion, HistorialCuidado, Mascota, Refugio  # noqa: E402
+
+# router -> (ruta del listado, modelo)
+CASOS = {
+    "refugios": (refugio.router, "/refugios/", Refugio),
+    "mascotas": (mascota.router, "/mascotas/", Mascota),
+    "adopciones": (adopcion.router, "/adopciones/", Adopcion),
+    "historial": (historial.router, "/historial/mascota/{mascota_id}", HistorialCuidado),
+}
+
+
+def _poblar(session: Session, n: int) -> None:
+    hoy = datetime.date(2024, 1, 1)
+    session.exec(
+        insert(Refugio),
+        params=[
+            {"nombre": f"Refugio {i}", "ubicacion": "Ciudad", "activo": True,
+             "foto_url": f"https://cdn.example/{i}.jpg"}
+            for i in range(n)
+        ],
+    )
+    session.exec(
+        insert(Mascota),
+        params=[
+            {"nombre": f"Mascota {i}", "especie": "Dog", "raza": "Mestizo", "edad": i % 15,
+             "sexo": "M", "estado": True, "refugio_id": 1 + i % n}
+            for i in range(n)
+        ],
+    )
+    session.exec(
+        insert(Adopcion),
+        params=[
+            {"mascota_id": 1 + i, "refugio_id": 1 + i % n, "adoptante": f"Persona {i}",
+             "fecha_adopcion": hoy + datetime.timedelta(days=i)}
+            for i in range(n)
+        ],
+    )
+    session.exec(
+        insert(HistorialCuidado),
+        params=[
+            {"mascota_id": 1, "tipo_evento": "Vacuna", "costo": 12.5,
+             "fecha": hoy + datetime.timedelta(days=i)}
+            for i in range(n)
+        ],
+    )
+    session.commit()
+
+
+def _ruta(router, path: str):
+    return next(r for r in router.routes if r.path == path and "GET" in r.methods)
+
+
+async def _actual(session: Session, model, field, n: int) -> bytes:
+    # Sin identity map: cada request real construye sus objetos desde cero
+    session.expunge_all()
+    objetos = session.exec(select(model).limit(n)).all()
+    contenido = await serialize_response(field=field, response_content=objetos)
+    return JSONResponse(contenido).body
+
+
+async def _rapido(session: Session, model, n: int) -> bytes:
+    filas = session.exec(select(*model.__table__.columns).limit(n)).all()
+    return FastJSONResponse([fila._asdict() for fila in filas]).body
+
+
+async def _medir(fn, repeticiones: int) -> list[float]:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        await fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--filas", type=int, default=100, help="filas por página")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    print(f"orjson: {'sí' if ORJSON_DISPONIBLE else 'no (json estándar)'}\n")
+    print(f"{'router':<12} {'actual p50':>12} {'rápido p50':>12} {'x':>6}  bytes")
+
+    with Session(engine) as session:
+        _poblar(session, args.filas)
+        for nombre, (router, path, model) in CASOS.items():
+            field = _ruta(router, path).response_field
+            # Ambos caminos deben producir el mismo JSON (salvo espacios)
+            assert json.loads(await _actual(session, model, field, args.filas)) == json.loads(
+                await _rapido(session, model, args.filas)
+            ), nombre
+
+            actual = await _medir(
+                lambda: _actual(session, model, field, args.filas), args.repeticiones
+            )
+            rapido = await _medir(lambda: _rapido(session, model, args.filas), args.repeticiones)
+            p50_actual = statistics.median(actual) * 1000
+            p50_rapido = statistics.median(rapido) * 1000
+            tamano = len(await _rapido(session, model, args.filas))
+            print(
+                f"{nombre:<12} {p50_actual:>9.2f} ms {p50_rapido:>9.2f} ms "
+                f"{p50_actual / p50_rapido:>5.1f}x  {tamano}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,165 @@
+# bulk.py
+"""
+Utilidades para la carga masiva (endpoints POST .../bulk).
+
+El cuerpo se lee en streaming, en NDJSON (un objeto JSON por línea) o CSV
+(primera línea con los nombres de columna), según el Content-Type. Las filas
+se validan con los modelos *Create existentes y se entregan en lotes de
+BULK_CHUNK_SIZE para que cada router verifique claves foráneas una vez por
+lote e inserte con una sola sentencia multi-fila.
+"""
+import csv
+import json
+import os
+from typing import AsyncIterator, Type
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlmodel import SQLModel
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+# Máximo de errores detallados en la respuesta (el total se cuenta siempre)
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "1000"))
+
+
+class BulkReport:
+    """Acumula el resultado de una carga masiva."""
+
+    def __init__(self):
+        self.recibidas = 0
+        self.insertadas = 0
+        self.total_errores = 0
+        self.errores: list[dict] = []
+
+    def error(self, fila: int, detalle: str) -> None:
+        self.total_errores += 1
+        if len(self.errores) < BULK_MAX_ERRORS:
+            self.errores.append({"fila": fila, "error": detalle})
+
+    def as_dict(self) -> dict:
+        return {
+            "recibidas": self.recibidas,
+            "insertadas": self.insertadas,
+            "con_error": self.total_errores,
+            "errores": sorted(self.errores, key=lambda e: e["fila"]),
+        }
+
+
+def _formato(request: Request) -> str:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if content_type in ("", "application/x-ndjson", "application/ndjson", "application/jsonl"):
+        return "ndjson"
+    raise HTTPException(
+        status_code=415,
+        detail="Formato no soportado: use application/x-ndjson o text/csv",
+    )
+
+
+_NO_UTF8 = "La línea no es UTF-8 válido (guarde el archivo como UTF-8)"
+
+
+def _decodificar(linea: bytes) -> str | None:
+    try:
+        return linea.decode("utf-8", errors="strict").rstrip("\r")
+    except UnicodeDecodeError:
+        return None
+
+
+async def _lineas(request: Request) -> AsyncIterator[str | None]:
+    """
+    Devuelve el cuerpo línea a línea sin cargarlo entero en memoria. Una
+    línea que no es UTF-8 se devuelve como None (error de esa fila).
+    """
+    pendiente = b""
+    async for chunk in request.stream():
+        pendiente += chunk
+        *lineas, pendiente = pendiente.split(b"\n")
+        for linea in lineas:
+            yield _decodificar(linea)
+    if pendiente:
+        yield _decodificar(pendiente)
+
+
+async def _registros_csv(lineas: AsyncIterator[str | None]) -> AsyncIterator[dict | str]:
+    columnas: list[str] | None = None
+    registro = ""
+    async for linea in lineas:
+        if linea is None:
+            if columnas is None:
+                # Sin encabezado no hay filas que validar: nada llegó a guardarse
+                raise HTTPException(status_code=400, detail=f"Encabezado del CSV: {_NO_UTF8}")
+            registro = ""
+            yield _NO_UTF8
+            continue
+        registro = f"{registro}\n{linea}" if registro else linea
+        # Un campo entre comillas puede contener saltos de línea
+        if registro.count('"') % 2 == 1:
+            continue
+        valores = next(csv.reader([registro]))
+        registro = ""
+        if not valores:
+            continue
+        if columnas is None:
+            columnas = [c.strip() for c in valores]
+            continue
+        if len(valores) != len(columnas):
+            yield f"Se esperaban {len(columnas)} columnas y hay {len(valores)}"
+            continue
+        # En CSV una celda vacía significa "sin valor": se omite y vale el
+        # default del modelo (None en los campos opcionales)
+        yield {c: v for c, v in zip(columnas, valores) if v != ""}
+    if registro:
+        yield "Comillas sin cerrar al final del CSV"
+
+
+async def _registros_ndjson(lineas: AsyncIterator[str | None]) -> AsyncIterator[dict | str]:
+    async for linea in lineas:
+        if linea is None:
+            yield _NO_UTF8
+            continue
+        if not linea.strip():
+            continue
+        try:
+            valor = json.loads(linea)
+        except ValueError as e:
+            yield f"JSON inválido: {e}"
+            continue
+        yield valor if isinstance(valor, dict) else "Cada línea debe ser un objeto JSON"
+
+
+def _describir(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc']) or 'fila'}: {e['msg']}" for e in error.errors()
+    )
+
+
+async def lotes_validados(
+    request: Request, model: Type[SQLModel], report: BulkReport
+) -> AsyncIterator[list[tuple[int, SQLModel]]]:
+    """
+    Valida cada fila con `model` y produce lotes de (número_de_fila, objeto).
+    Las filas inválidas se anotan en `report` y no llegan al lote.
+    """
+    formato = _formato(request)
+    lineas = _lineas(request)
+    registros = _registros_csv(lineas) if formato == "csv" else _registros_ndjson(lineas)
+
+    lote: list[tuple[int, SQLModel]] = []
+    async for registro in registros:
+        report.recibidas += 1
+        fila = report.recibidas
+        if isinstance(registro, str):
+            report.error(fila, registro)
+            continue
+        try:
+            lote.append((fila, model.model_validate(registro)))
+        except ValidationError as e:
+            report.error(fila, _describir(e))
+            continue
+        if len(lote) >= BULK_CHUNK_SIZE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
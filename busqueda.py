@@ -0,0 +1,184 @@
+# busqueda.py
+"""
+Búsqueda por texto para /mascotas/buscar y /refugios/buscar.
+
+El texto buscable (mascota: nombre + raza; refugio: nombre + ubicación) se
+normaliza a minúsculas y sin acentos. Un resultado coincide si el término
+aparece en el texto o si se parece lo suficiente a alguna de sus palabras
+(similitud por trigramas, tolera errores de tipeo). Se ordena así:
+
+1. coincidencias al inicio de una palabra (búsqueda por prefijo),
+2. mayor similitud,
+3. id.
+
+En PostgreSQL se usa pg_trgm con los índices GIN de la migración 006. En
+otros motores (SQLite en desarrollo y pruebas) se mantiene un índice
+invertido de trigramas en memoria, que se reconstruye cuando cambia la
+versión de la tabla (ver etag.py).
+"""
+import asyncio
+import unicodedata
+
+from sqlalchemy import case, func, or_
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from etag import versiones
+
+# Mismo umbral por defecto que pg_trgm.word_similarity_threshold
+UMBRAL_SIMILITUD = 0.6
+
+
+def normalizar(texto: str | None) -> str:
+    """Minúsculas, sin acentos y con los espacios colapsados."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.split())
+
+
+def trigramas(texto: str) -> set[str]:
+    """Trigramas como los de pg_trgm: cada palabra con dos espacios delante y uno detrás."""
+    resultado: set[str] = set()
+    for palabra in texto.split():
+        relleno = f"  {palabra} "
+        resultado.update(relleno[i : i + 3] for i in range(len(relleno) - 2))
+    return resultado
+
+
+def _similitud(consulta: set[str], texto: str) -> float:
+    """Aproximación de word_similarity(): la mejor palabra del texto."""
+    if not consulta:
+        return 0.0
+    return max(
+        (len(consulta & trigramas(palabra)) / len(consulta) for palabra in texto.split()),
+        default=0.0,
+    )
+
+
+def _es_prefijo(termino: str, texto: str) -> bool:
+    return texto.startswith(termino) or f" {termino}" in texto
+
+
+def _escapar_like(termino: str) -> str:
+    return termino.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class _IndiceInvertido:
+    """trigrama -> ids, más el texto normalizado de cada fila."""
+
+    def __init__(self):
+        self.version: int | None = None
+        self.textos: dict[int, str] = {}
+        self.por_trigrama: dict[str, set[int]] = {}
+        self.lock = asyncio.Lock()
+
+    def cargar(self, filas) -> None:
+        self.textos = {}
+        self.por_trigrama = {}
+        for fila_id, *campos in filas:
+            texto = normalizar(" ".join(c for c in campos if c))
+            self.textos[fila_id] = texto
+            for trigrama in trigramas(texto):
+                self.por_trigrama.setdefault(trigrama, set()).add(fila_id)
+
+    def buscar(self, termino: str) -> list[tuple[tuple, int]]:
+        consulta = trigramas(termino)
+        candidatos: set[int] = set()
+        for trigrama in consulta:
+            candidatos |= self.por_trigrama.get(trigrama, set())
+
+        resultado = []
+        for fila_id in candidatos:
+            texto = self.textos[fila_id]
+            similitud = _similitud(consulta, texto)
+            if termino not in texto and similitud < UMBRAL_SIMILITUD:
+                continue
+            clave = (0 if _es_prefijo(termino, texto) else 1, -similitud, fila_id)
+            resultado.append((clave, fila_id))
+        resultado.sort()
+        return resultado
+
+
+class Buscador:
+    """
+    `campos`: columnas de texto del modelo, en el mismo orden que los
+    parámetros de `funcion_sql` (la función de la migración 006).
+    """
+
+    def __init__(
+        self, model: type[SQLModel], entidad: str, funcion_sql: str, campos: tuple[str, ...]
+    ):
+        self.model = model
+        self.entidad = entidad
+        self.funcion_sql = funcion_sql
+        self.campos = campos
+        self._indice = _IndiceInvertido()
+
+    async def buscar(self, session: AsyncSession, stmt, q: str, skip: int, limit: int) -> list:
+        """
+        `stmt` es un `select(model)` con los filtros del listado ya aplicados;
+        se le agregan la condición de búsqueda, el orden y la paginación.
+        """
+        termino = normalizar(q)
+        if not termino:
+            return []
+        if session.bind.dialect.name == "postgresql":
+            return await self._buscar_pg(session, stmt, termino, skip, limit)
+        return await self._buscar_en_memoria(session, stmt, termino, skip, limit)
+
+    async def _buscar_pg(self, session: AsyncSession, stmt, termino: str, skip: int, limit: int):
+        texto = getattr(func, self.funcion_sql)(*(getattr(self.model, c) for c in self.campos))
+        patron = _escapar_like(termino)
+        prefijo = or_(
+            texto.like(f"{patron}%", escape="\\"),
+            texto.like(f"% {patron}%", escape="\\"),
+        )
+        stmt = (
+            stmt.where(
+                or_(
+                    texto.like(f"%{patron}%", escape="\\"),
+                    # termino <% texto: similitud con alguna palabra (usa el índice GIN)
+                    texto.op("%>")(termino),
+                )
+            )
+            .order_by(
+                case((prefijo, 0), else_=1),
+                func.word_similarity(termino, texto).desc(),
+                self.model.id,
+            )
+            .offset(skip)
+            .limit(limit)
+        )
+        result = await session.exec(stmt)
+        return result.all()
+
+    async def _indice_actual(self, session: AsyncSession) -> _IndiceInvertido:
+        actual = await versiones(session, (self.entidad,))
+        version = actual[self.entidad].version if self.entidad in actual else 0
+        indice = self._indice
+        async with indice.lock:
+            if indice.version != version:
+                columnas = [self.model.id, *(getattr(self.model, c) for c in self.campos)]
+                result = await session.exec(select(*columnas))
+                indice.cargar(result.all())
+                indice.version = version
+        return indice
+
+    async def _buscar_en_memoria(
+        self, session: AsyncSession, stmt, termino: str, skip: int, limit: int
+    ):
+        indice = await self._indice_actual(session)
+        ranking = indice.buscar(termino)
+        if not ranking:
+            return []
+
+        # Los filtros del listado se resuelven en la base; el orden, aquí
+        permitidos = set((await session.exec(stmt.with_only_columns(self.model.id))).all())
+        pagina = [fila_id for _, fila_id in ranking if fila_id in permitidos][skip : skip + limit]
+        if not pagina:
+            return []
+        result = await session.exec(select(self.model).where(self.model.id.in_(pagina)))
+        por_id = {obj.id: obj for obj in result.all()}
+        return [por_id[fila_id] for fila_id in pagina if fila_id in por_id]
@@ -0,0 +1,247 @@
+# cache.py
+"""
+Caché de respuestas en memoria para las vistas HTML y las estadísticas.
+
+Las entradas se indexan por ruta + query string y llevan etiquetas con las
+entidades de las que dependen ("refugio", "mascota", "adopcion",
+"historial"). Los routers llaman a `invalidate(...)` después de cada commit,
+y eso borra todas las entradas de esa entidad. Además cada entrada caduca
+por TTL y el total está acotado por LRU.
+
+El backend es intercambiable (`set_backend`) para poder compartir la caché
+entre workers más adelante (p. ej. con Redis).
+"""
+import functools
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterable
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "si", "on")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+
+
+class CacheBackend(ABC):
+    """Interfaz mínima que debe implementar un backend de caché."""
+
+    @abstractmethod
+    def get(self, key: str) -> Any | None:
+        ...
+
+    @abstractmethod
+    def generation(self, tags: Iterable[str]) -> tuple:
+        """Versión actual de las etiquetas (cambia con cada invalidación)."""
+
+    @abstractmethod
+    def set(
+        self, key: str, value: Any, tags: Iterable[str], ttl: float, generation: tuple | None = None
+    ) -> None:
+        ...
+
+    @abstractmethod
+    def invalidate(self, *tags: str) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class MemoryCache(CacheBackend):
+    """LRU con TTL, local al proceso."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any, tuple[str, ...]]] = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value, _ = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, tags: Iterable[str]) -> tuple:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def set(
+        self, key: str, value: Any, tags: Iterable[str], ttl: float, generation: tuple | None = None
+    ) -> None:
+        tags = tuple(tags)
+        with self._lock:
+            # Si hubo una escritura mientras se calculaba, el valor ya es viejo
+            if generation is not None and generation != tuple(
+                self._generations.get(tag, 0) for tag in tags
+            ):
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags: str) -> None:
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._tags.pop(tag, ())):
+                    if key in self._entries:
+                        self._drop(key)
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": CACHE_TTL,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+_backend: CacheBackend = MemoryCache()
+
+
+def get_backend() -> CacheBackend:
+    return _backend
+
+
+def set_backend(backend: CacheBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def invalidate(*entities: str) -> None:
+    """Llamar después del commit de una escritura sobre esas entidades."""
+    _backend.invalidate(*entities)
+
+
+def cache_stats() -> dict:
+    return {"enabled": CACHE_ENABLED, **_backend.stats()}
+
+
+def request_key(request: Request) -> str:
+    query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+    return f"{request.method}:{request.url.path}?{query}"
+
+
+def _key(request: Request) -> str:
+    # Con @condicional encima, la clave incluye las versiones de las tablas:
+    # una escritura hecha en otro worker también deja la entrada vieja sin uso
+    etag = getattr(request.state, "etag", None)
+    return f"{request_key(request)}#{etag}" if etag else request_key(request)
+
+
+def _freeze(result: Any, body: bytes | None = None) -> Any:
+    """Guarda las Response como (status, body, headers, media_type)."""
+    if isinstance(result, Response):
+        headers = [
+            (k, v) for k, v in result.headers.items() if k.lower() != "content-length"
+        ]
+        body = result.body if body is None else body
+        return ("response", result.status_code, body, headers, result.media_type)
+    return ("value", result)
+
+
+def _store_when_done(
+    result: StreamingResponse, key: str, tags: tuple, ttl: float, generation: tuple
+) -> AsyncIterator[bytes]:
+    """Deja pasar el streaming y, al terminar, guarda el cuerpo completo."""
+    original = result.body_iterator
+    # Las cabeceras se toman ahora, igual que para una Response normal
+    frozen = _freeze(result, b"")
+
+    async def body_iterator():
+        chunks = []
+        async for chunk in original:
+            chunk = chunk if isinstance(chunk, bytes) else chunk.encode(result.charset)
+            chunks.append(chunk)
+            yield chunk
+        _backend.set(key, (*frozen[:2], b"".join(chunks), *frozen[3:]), tags, ttl, generation)
+
+    return body_iterator()
+
+
+def _thaw(entry: Any) -> Any:
+    if entry[0] == "response":
+        _, status_code, body, headers, media_type = entry
+        response = Response(content=body, status_code=status_code, media_type=media_type)
+        for k, v in headers:
+            if k.lower() != "content-type":
+                response.headers[k] = v
+        return response
+    return entry[1]
+
+
+def cached(*tags: str, ttl: float | None = None):
+    """
+    Decorador para endpoints que reciben `request: Request`.
+    Cachea la respuesta (o el valor devuelto) si fue exitosa.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Request | None = kwargs.get("request")
+            if not CACHE_ENABLED or request is None:
+                return await func(*args, **kwargs)
+
+            key = _key(request)
+            entry = _backend.get(key)
+            if entry is not None:
+                return _thaw(entry)
+
+            generation = _backend.generation(tags)
+            result = await func(*args, **kwargs)
+            entry_ttl = CACHE_TTL if ttl is None else ttl
+            if isinstance(result, StreamingResponse):
+                if result.status_code == 200:
+                    result.body_iterator = _store_when_done(
+                        result, key, tags, entry_ttl, generation
+                    )
+            elif not isinstance(result, Response) or result.status_code == 200:
+                _backend.set(key, _freeze(result), tags, entry_ttl, generation)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,440 @@
+# cola_historial.py
+"""
+Escritura diferida (write-behind) de los eventos de cuidado.
+
+Con HISTORIAL_WRITE_BEHIND=true, `POST /historial/` y `/web/historial/registrar`
+no abren una transacción por evento:
+
+1. El evento se valida (incluida la mascota) y se agrega al journal local del
+   worker (NDJSON con fsync, en HISTORIAL_JOURNAL_DIR). Recién entonces se
+   responde 202: el evento ya no se pierde aunque el proceso se caiga.
+2. Una tarea de fondo guarda los eventos en lotes cada HISTORIAL_FLUSH_MS o al
+   juntar HISTORIAL_FLUSH_MAX: un INSERT multi-fila, los resúmenes (rollups),
+   la versión de la tabla y el checkpoint del journal (`historial_journal`),
+   todo en la misma transacción.
+3. Con HISTORIAL_QUEUE_MAX eventos sin guardar, los requests nuevos esperan
+   hasta HISTORIAL_QUEUE_TIMEOUT segundos a que se libere lugar y si no,
+   reciben 503 (back-pressure).
+
+Al arrancar se reprocesan los journals que dejó un worker caído (solo los
+eventos posteriores a su checkpoint, así no se duplican) y al apagar se
+guardan los pendientes antes de cerrar las conexiones (ver `main.lifespan`).
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import db
+from cache import invalidate
+from etag import registrar_cambio
+from models import HistorialCuidado, HistorialCuidadoCreate, HistorialJournal, Mascota
+from rollups import registrar_historial
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo de archivos entre workers
+    fcntl = None
+
+logger = logging.getLogger("historial.cola")
+
+HISTORIAL_WRITE_BEHIND = os.getenv("HISTORIAL_WRITE_BEHIND", "false").strip().lower() in (
+    "1", "true", "yes", "si", "on"
+)
+HISTORIAL_FLUSH_MS = int(os.getenv("HISTORIAL_FLUSH_MS", "200"))
+HISTORIAL_FLUSH_MAX = int(os.getenv("HISTORIAL_FLUSH_MAX", "500"))
+# Eventos aceptados y todavía sin guardar en la base (por worker)
+HISTORIAL_QUEUE_MAX = int(os.getenv("HISTORIAL_QUEUE_MAX", "10000"))
+HISTORIAL_QUEUE_TIMEOUT = float(os.getenv("HISTORIAL_QUEUE_TIMEOUT", "2"))
+HISTORIAL_JOURNAL_DIR = os.getenv("HISTORIAL_JOURNAL_DIR", ".historial_journal")
+# false: más rápido, pero una caída del sistema operativo puede perder lo último
+HISTORIAL_JOURNAL_FSYNC = os.getenv("HISTORIAL_JOURNAL_FSYNC", "true").strip().lower() in (
+    "1", "true", "yes", "si", "on"
+)
+
+# Con todo guardado, el journal se vacía cuando supera este tamaño
+_JOURNAL_TRUNCAR_BYTES = 1024 * 1024
+# Espera antes de reintentar un lote si la base falla
+_REINTENTO_SEGUNDOS = 1.0
+# Intentos de un lote que la base rechaza (restricción, dato inválido) antes de apartarlo
+_REINTENTOS_MAX = 5
+
+
+def _bloquear(archivo) -> bool:
+    """Lock exclusivo sin esperar: False si otro worker (vivo) ya tiene el journal."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _agregar_archivo(ruta: Path, datos: bytes) -> None:
+    with open(ruta, "ab") as archivo:
+        archivo.write(datos)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+
+
+def _leer_journal(archivo, nombre: str) -> list[tuple[int, HistorialCuidadoCreate]]:
+    eventos = []
+    for n, linea in enumerate(archivo, start=1):
+        try:
+            datos = json.loads(linea)
+            seq = datos.pop("seq")
+            eventos.append((seq, HistorialCuidadoCreate.model_validate(datos)))
+        except (ValueError, KeyError):
+            # Línea cortada por una caída a mitad de escritura (nunca se confirmó)
+            logger.warning("Journal %s: línea %d ilegible, se ignora", nombre, n)
+    return eventos
+
+
+async def _leer_checkpoint(journal: str) -> int:
+    async with db.async_session_maker() as session:
+        fila = await session.get(HistorialJournal, journal)
+        return fila.seq if fila else 0
+
+
+async def _guardar_checkpoint(session: AsyncSession, journal: str, seq: int) -> None:
+    stmt = db.dialect_insert(session, HistorialJournal).values(journal=journal, seq=seq)
+    stmt = stmt.on_conflict_do_update(index_elements=["journal"], set_={"seq": seq})
+    await session.exec(stmt)
+
+
+async def _borrar_checkpoint(journal: str) -> None:
+    async with db.async_session_maker() as session:
+        await session.exec(delete(HistorialJournal).where(HistorialJournal.journal == journal))
+        await session.commit()
+
+
+async def _insertar(journal: str, seq: int, eventos: list[HistorialCuidadoCreate]) -> None:
+    """INSERT multi-fila + rollups + versión + checkpoint, en una sola transacción."""
+    async with db.async_session_maker() as session:
+        if eventos:
+            await session.exec(insert(HistorialCuidado), params=[e.model_dump() for e in eventos])
+            await registrar_historial(session, eventos)
+            await registrar_cambio(session, "historial")
+        await _guardar_checkpoint(session, journal, seq)
+        await session.commit()
+    if eventos:
+        invalidate("historial")
+
+
+class ColaHistorial:
+    def __init__(self, directorio: str = HISTORIAL_JOURNAL_DIR):
+        self.directorio = Path(directorio)
+        self.nombre = ""
+        self._archivo = None
+        self._seq = 0
+        # Escritos en el journal y pendientes de guardar, en orden de seq
+        self._pendientes: list[tuple[int, HistorialCuidadoCreate]] = []
+        # Esperando el próximo fsync del journal (group commit)
+        self._por_escribir: list[tuple[int, HistorialCuidadoCreate, asyncio.Future]] = []
+        self._escritor: asyncio.Task | None = None
+        self._tarea: asyncio.Task | None = None
+        self._cerrando = False
+        self.guardados = 0
+        self.lotes = 0
+        self.rechazados = 0
+        self.descartados = 0
+        self.apartados = 0
+        self.reprocesados = 0
+
+    @property
+    def activa(self) -> bool:
+        return self._tarea is not None
+
+    def _ruta(self, nombre: str) -> Path:
+        return self.directorio / f"{nombre}.ndjson"
+
+    async def iniciar(self) -> None:
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self._lugares = asyncio.Semaphore(HISTORIAL_QUEUE_MAX)
+        self._hay_eventos = asyncio.Event()
+        self._lote_lleno = asyncio.Event()
+        self._archivo_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._cerrando = False
+
+        # El nombre se elige aquí y no al importar: con workers hechos por fork
+        # el pid del import sería el mismo para todos.
+        # Se crea con otro nombre y se renombra ya bloqueado, para que el
+        # reprocesado de otro worker nunca lo tome por huérfano.
+        self.nombre = f"historial-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        temporal = self.directorio / f".{self.nombre}.tmp"
+        self._archivo = open(temporal, "ab")
+        _bloquear(self._archivo)
+        os.replace(temporal, self._ruta(self.nombre))
+
+        await self.reprocesar()
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def reprocesar(self) -> int:
+        """Guarda los eventos de journals huérfanos (workers caídos) y los borra."""
+        total = 0
+        for ruta in sorted(self.directorio.glob("historial-*.ndjson")):
+            if ruta.stem == self.nombre:
+                continue
+            try:
+                archivo = open(ruta, "rb")
+            except FileNotFoundError:
+                continue  # otro worker lo terminó de reprocesar
+            with archivo:
+                # Lo tiene un worker vivo, o ya se reprocesó y borró mientras esperábamos
+                if not _bloquear(archivo) or os.fstat(archivo.fileno()).st_nlink == 0:
+                    continue
+                try:
+                    checkpoint = await _leer_checkpoint(ruta.stem)
+                    eventos = [
+                        (seq, e) for seq, e in _leer_journal(archivo, ruta.stem) if seq > checkpoint
+                    ]
+                    for i in range(0, len(eventos), HISTORIAL_FLUSH_MAX):
+                        await self._guardar(ruta.stem, eventos[i:i + HISTORIAL_FLUSH_MAX])
+                    await _borrar_checkpoint(ruta.stem)
+                except Exception:
+                    logger.exception(
+                        "No se pudo reprocesar el journal %s; queda para el próximo arranque",
+                        ruta.name,
+                    )
+                    continue
+                ruta.unlink()
+            if eventos:
+                logger.info("Journal %s reprocesado: %d eventos", ruta.name, len(eventos))
+            total += len(eventos)
+        self.reprocesados += total
+        return total
+
+    # -----------------------------
+    # Alta de eventos
+    # -----------------------------
+
+    async def encolar(self, evento: HistorialCuidadoCreate) -> dict:
+        """
+        Agrega el evento al journal (durable) y a la cola. La mascota ya tiene
+        que estar validada. Devuelve el evento con su posición en el journal.
+        """
+        try:
+            await asyncio.wait_for(self._lugares.acquire(), HISTORIAL_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rechazados += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Hay demasiados eventos de cuidado en cola; reintenta en unos segundos",
+                headers={"Retry-After": str(max(1, round(HISTORIAL_FLUSH_MS / 1000)))},
+            )
+
+        self._seq += 1
+        seq = self._seq
+        futuro = asyncio.get_running_loop().create_future()
+        self._por_escribir.append((seq, evento, futuro))
+        if self._escritor is None or self._escritor.done():
+            self._escritor = asyncio.create_task(self._escribir_journal())
+        try:
+            await futuro
+        except Exception:
+            self._lugares.release()
+            raise
+        return {"journal": self.nombre, "seq": seq, **evento.model_dump(mode="json")}
+
+    def _vaciar_archivo(self) -> None:
+        self._archivo.truncate(0)
+        self._archivo.seek(0)
+
+    def _append(self, datos: bytes) -> None:
+        self._archivo.write(datos)
+        self._archivo.flush()
+        if HISTORIAL_JOURNAL_FSYNC:
+            os.fsync(self._archivo.fileno())
+
+    async def _escribir_journal(self) -> None:
+        # Un fsync por tanda: los eventos que llegan mientras tanto van en la siguiente
+        while self._por_escribir:
+            tanda, self._por_escribir = self._por_escribir, []
+            datos = b"".join(
+                json.dumps({"seq": seq, **evento.model_dump(mode="json")}).encode() + b"\n"
+                for seq, evento, _ in tanda
+            )
+            try:
+                async with self._archivo_lock:
+                    await asyncio.to_thread(self._append, datos)
+            except Exception as e:
+                logger.exception("No se pudo escribir el journal %s", self.nombre)
+                for _, _, futuro in tanda:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+
+            for seq, evento, futuro in tanda:
+                self._pendientes.append((seq, evento))
+                if not futuro.done():
+                    futuro.set_result(None)
+            self._hay_eventos.set()
+            if len(self._pendientes) >= HISTORIAL_FLUSH_MAX:
+                self._lote_lleno.set()
+
+    # -----------------------------
+    # Guardado en la base
+    # -----------------------------
+
+    async def _bucle(self) -> None:
+        while not self._cerrando:
+            await self._hay_eventos.wait()
+            try:
+                await asyncio.wait_for(self._lote_lleno.wait(), HISTORIAL_FLUSH_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            if self._cerrando:
+                break
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception(
+                    "No se pudo guardar un lote de historial (%d pendientes); se reintenta",
+                    len(self._pendientes),
+                )
+                await asyncio.sleep(_REINTENTO_SEGUNDOS)
+
+    async def _guardar(self, journal: str, lote: list[tuple[int, HistorialCuidadoCreate]]) -> None:
+        seq = lote[-1][0]
+        eventos = [e for _, e in lote]
+        intentos = 0
+        while True:
+            try:
+                await _insertar(journal, seq, eventos)
+                break
+            except (IntegrityError, DataError) as e:
+                error = e
+            if isinstance(error, IntegrityError):
+                # Una mascota se borró después de aceptar sus eventos: se descartan esos
+                async with db.async_session_maker() as session:
+                    ids = {e.mascota_id for e in eventos}
+                    result = await session.exec(select(Mascota.id).where(Mascota.id.in_(ids)))
+                    existentes = set(result.all())
+                validos = [e for e in eventos if e.mascota_id in existentes]
+                if len(validos) < len(eventos):
+                    logger.warning(
+                        "Journal %s: %d eventos descartados (mascota inexistente)",
+                        journal,
+                        len(eventos) - len(validos),
+                    )
+                    self.descartados += len(eventos) - len(validos)
+                    eventos = validos
+                    continue
+            # El lote en sí no entra (otra restricción, dato inválido): tras
+            # _REINTENTOS_MAX intentos se aparta para no frenar al resto de la cola
+            intentos += 1
+            if intentos >= _REINTENTOS_MAX:
+                await self._apartar(journal, seq, eventos, error)
+                return
+            logger.warning(
+                "Journal %s: no se pudo guardar el lote hasta seq %d (intento %d de %d): %s",
+                journal,
+                seq,
+                intentos,
+                _REINTENTOS_MAX,
+                error.orig,
+            )
+            await asyncio.sleep(_REINTENTO_SEGUNDOS)
+        self.guardados += len(eventos)
+        self.lotes += 1
+
+    async def _apartar(
+        self, journal: str, seq: int, eventos: list[HistorialCuidadoCreate], error: Exception
+    ) -> None:
+        """Copia el lote a apartados-<journal>.ndjson y avanza el checkpoint sin guardarlo."""
+        ruta = self.directorio / f"apartados-{journal}.ndjson"
+        datos = b"".join(
+            json.dumps({"journal": journal, **e.model_dump(mode="json")}).encode() + b"\n"
+            for e in eventos
+        )
+        await asyncio.to_thread(_agregar_archivo, ruta, datos)
+        await _insertar(journal, seq, [])
+        logger.error(
+            "Journal %s: %d eventos hasta seq %d apartados en %s tras %d intentos: %s",
+            journal,
+            len(eventos),
+            seq,
+            ruta,
+            _REINTENTOS_MAX,
+            error.orig,
+        )
+        self.apartados += len(eventos)
+
+    async def flush(self) -> int:
+        """Guarda ahora todos los eventos pendientes. Devuelve cuántos había."""
+        async with self._flush_lock:
+            total = 0
+            while self._pendientes:
+                lote = self._pendientes[:HISTORIAL_FLUSH_MAX]
+                await self._guardar(self.nombre, lote)
+                del self._pendientes[:len(lote)]
+                for _ in lote:
+                    self._lugares.release()
+                total += len(lote)
+            self._hay_eventos.clear()
+            self._lote_lleno.clear()
+            await self._truncar()
+            return total
+
+    async def _truncar(self) -> None:
+        if self._archivo is None or self._archivo.tell() < _JOURNAL_TRUNCAR_BYTES:
+            return
+        async with self._archivo_lock:
+            # Todo lo escrito ya está en la base; el checkpoint sigue valiendo
+            # porque los seq no se reinician
+            if not self._pendientes:
+                await asyncio.to_thread(self._vaciar_archivo)
+
+    async def detener(self) -> None:
+        """Guarda los pendientes y cierra el journal (lifespan, al apagar)."""
+        if self._tarea is None:
+            return
+        self._cerrando = True
+        self._hay_eventos.set()
+        self._lote_lleno.set()
+        await self._tarea
+        self._tarea = None
+        if self._escritor is not None:
+            await self._escritor
+
+        try:
+            guardados = await self.flush()
+        except Exception:
+            logger.exception(
+                "No se pudo guardar el historial pendiente; queda en %s para el próximo arranque",
+                self._ruta(self.nombre),
+            )
+            self._archivo.close()
+            return
+        self._archivo.close()
+        await _borrar_checkpoint(self.nombre)
+        self._ruta(self.nombre).unlink()
+        if guardados:
+            logger.info("Historial pendiente guardado al apagar: %d eventos", guardados)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": HISTORIAL_WRITE_BEHIND,
+            "journal": self.nombre if self.activa else None,
+            "pendientes": len(self._pendientes) + len(self._por_escribir),
+            "capacidad": HISTORIAL_QUEUE_MAX,
+            "guardados": self.guardados,
+            "lotes": self.lotes,
+            "rechazados": self.rechazados,
+            "descartados": self.descartados,
+            "apartados": self.apartados,
+            "reprocesados": self.reprocesados,
+        }
+
+
+cola = ColaHistorial()
@@ -1,17 +1,42 @@
 # db.py
+import asyncio
+import itertools
+import logging
 import os
-from typing import Annotated
+import time
+from contextlib import asynccontextmanager
+from typing import Annotated, AsyncIterator
 
 from dotenv import load_dotenv
-from fastapi import Depends
+from fastapi import Depends, Request
 from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool  # <- NUEVO
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 # 1. Cargar variables de entorno desde .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "si", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
 # 2. Construir la URL de conexión a Clever Cloud
 CLEVER_DB = (
     f"postgresql+asyncpg://{os.getenv('POSTGRESQL_ADDON_USER')}:"
@@ -20,16 +45,92 @@ CLEVER_DB = (
     f"{os.getenv('POSTGRESQL_ADDON_PORT')}/"
     f"{os.getenv('POSTGRESQL_ADDON_DB')}"
 )
+# DATABASE_URL reemplaza a la base de Clever Cloud (p. ej. un PostgreSQL local
+# para las pruebas de carga de bench/carga.py)
+DATABASE_URL = os.getenv("DATABASE_URL") or CLEVER_DB
 
-# 3. Crear el engine asíncrono, sin pool persistente
-engine: AsyncEngine = create_async_engine(
-    CLEVER_DB,
-    echo=True,
-    future=True,
-    poolclass=NullPool,   # <- aquí la clave
-)
+# 3. Configuración del pool (por worker de uvicorn)
+#    DB_POOL=queue -> pool persistente (por defecto)
+#    DB_POOL=null  -> una conexión nueva por request (comportamiento anterior)
+DB_POOL = os.getenv("DB_POOL", "queue").strip().lower()
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_CACHE_SIZE = _env_int("DB_STATEMENT_CACHE_SIZE", 100)
+DB_ECHO = _env_bool("DB_ECHO", False)
+# Aplicar migraciones pendientes al arrancar (ver migrate.py)
+DB_AUTO_MIGRATE = _env_bool("DB_AUTO_MIGRATE", True)
+# Omitir create_all y migraciones si la huella del esquema guardada coincide (ver migrate.py)
+DB_SCHEMA_FINGERPRINT = _env_bool("DB_SCHEMA_FINGERPRINT", True)
+
+# Réplicas de solo lectura (ver ReadSessionDep), separadas por coma
+DATABASE_REPLICA_URLS = [
+    u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()
+]
+# "round_robin" o "least_busy" (la réplica con menos conexiones en uso)
+DB_REPLICA_STRATEGY = os.getenv("DB_REPLICA_STRATEGY", "round_robin").strip().lower()
+# Segundos que un cliente lee del primario después de escribir (0 = desactivado)
+DB_READ_YOUR_WRITES_SECONDS = _env_int("DB_READ_YOUR_WRITES_SECONDS", 5)
+# Segundos que una réplica caída queda fuera de la rotación
+DB_REPLICA_RETRY_SECONDS = _env_int("DB_REPLICA_RETRY_SECONDS", 30)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Pool de conexiones que además acumula cuánto tiempo esperan los requests
+    para obtener una conexión (útil para dimensionar pool_size/max_overflow).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_total += elapsed
+            if elapsed > self.wait_max:
+                self.wait_max = elapsed
+
+
+def _build_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
 
-# 4. Crear el sessionmaker para AsyncSession
+    if DB_POOL == "null":
+        return create_async_engine(
+            url,
+            echo=DB_ECHO,
+            poolclass=NullPool,
+            connect_args=connect_args,
+        )
+
+    return create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+# 4. Crear el engine asíncrono
+engine: AsyncEngine = _build_engine()
+
+# 5. Crear el sessionmaker para AsyncSession
 async_session_maker = sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -39,16 +140,188 @@ async_session_maker = sessionmaker(
 )
 
 
-# 5. Función para crear tablas al inicio de la app
+# 6. Función para crear tablas al inicio de la app
 async def create_tables() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
 
 
-# 6. Dependencia para obtener una sesión por request
+def dialect_insert(session: AsyncSession, model):
+    """INSERT del dialecto de la sesión (PostgreSQL o SQLite), para usar on_conflict_*."""
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+# 7. Dependencia para obtener una sesión por request
 async def get_session() -> AsyncSession:
     async with async_session_maker() as session:
         yield session
 
 
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
+
+
+# 8. Sesiones de lectura: réplicas con respaldo en el primario
+class Replica:
+    def __init__(self, url: str):
+        self.engine = _build_engine(url)
+        self.caida_hasta = 0.0
+        self.fallos = 0
+        self.sesiones = 0
+
+    def disponible(self) -> bool:
+        return time.monotonic() >= self.caida_hasta
+
+    def en_uso(self) -> int:
+        pool = self.engine.sync_engine.pool
+        return pool.checkedout() if isinstance(pool, TimedQueuePool) else 0
+
+
+replicas: list[Replica] = [Replica(url) for url in DATABASE_REPLICA_URLS]
+_turno = itertools.count()
+
+# Cookie con el instante (epoch) hasta el que el cliente lee del primario
+READ_YOUR_WRITES_COOKIE = "db_primario"
+
+
+def _candidatas() -> list[Replica]:
+    """Réplicas disponibles en el orden en que se probarán."""
+    vivas = [r for r in replicas if r.disponible()]
+    if not vivas:
+        return []
+    # La rotación reparte también los empates de least_busy
+    inicio = next(_turno) % len(vivas)
+    vivas = vivas[inicio:] + vivas[:inicio]
+    if DB_REPLICA_STRATEGY == "least_busy":
+        vivas.sort(key=Replica.en_uso)
+    return vivas
+
+
+@asynccontextmanager
+async def read_session(primario: bool = False) -> AsyncIterator[AsyncSession]:
+    """
+    Sesión para consultas de solo lectura: una réplica si hay alguna
+    configurada y disponible; si no, el primario. Una réplica que no responde
+    queda fuera de la rotación DB_REPLICA_RETRY_SECONDS segundos.
+    """
+    if not primario:
+        for replica in _candidatas():
+            session = async_session_maker(bind=replica.engine)
+            try:
+                # Conectar ya para poder pasar a otra réplica si esta no responde
+                await session.connection()
+            except (OSError, asyncio.TimeoutError, SQLAlchemyError) as e:
+                await session.close()
+                replica.fallos += 1
+                replica.caida_hasta = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+                logger.warning(
+                    "réplica %s no disponible (%s); fuera de rotación %s s",
+                    replica.engine.url.render_as_string(hide_password=True),
+                    e.__class__.__name__,
+                    DB_REPLICA_RETRY_SECONDS,
+                )
+                continue
+            replica.sesiones += 1
+            async with session:
+                yield session
+            return
+
+    async with async_session_maker() as session:
+        yield session
+
+
+def _escribio_hace_poco(request: Request) -> bool:
+    if not DB_READ_YOUR_WRITES_SECONDS:
+        return False
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_session(request: Request) -> AsyncSession:
+    # Un cliente que acaba de escribir lee del primario (read-your-writes)
+    async with read_session(primario=_escribio_hace_poco(request)) as session:
+        yield session
+
+
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
+
+
+class ReadYourWritesMiddleware:
+    """
+    Marca con una cookie a los clientes que escribieron (POST/PUT/PATCH/DELETE
+    exitoso) para que sus lecturas vayan al primario durante
+    DB_READ_YOUR_WRITES_SECONDS, hasta que las réplicas se pongan al día.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] in ("GET", "HEAD", "OPTIONS")
+            or not replicas
+            or not DB_READ_YOUR_WRITES_SECONDS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def enviar(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(raw=message["headers"])
+                hasta = time.time() + DB_READ_YOUR_WRITES_SECONDS
+                headers.append(
+                    "Set-Cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}={hasta:.0f}; Max-Age={DB_READ_YOUR_WRITES_SECONDS}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, enviar)
+
+
+async def dispose_engines() -> None:
+    await engine.dispose()
+    for replica in replicas:
+        await replica.engine.dispose()
+
+
+# 9. Métricas del pool de este proceso
+def _estado_pool(engine: AsyncEngine) -> dict:
+    pool = engine.sync_engine.pool
+    status = {"status": pool.status()}
+    if isinstance(pool, TimedQueuePool):
+        status.update(
+            {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checkouts": pool.checkouts,
+                "wait_total_ms": round(pool.wait_total * 1000, 3),
+                "wait_avg_ms": round(pool.wait_total * 1000 / pool.checkouts, 3)
+                if pool.checkouts
+                else 0.0,
+                "wait_max_ms": round(pool.wait_max * 1000, 3),
+            }
+        )
+    return status
+
+
+def pool_status() -> dict:
+    status = {"pid": os.getpid(), "pool": DB_POOL, **_estado_pool(engine)}
+    if replicas:
+        status["replicas"] = [
+            {
+                "url": r.engine.url.render_as_string(hide_password=True),
+                "disponible": r.disponible(),
+                "sesiones": r.sesiones,
+                "fallos": r.fallos,
+                **_estado_pool(r.engine),
+            }
+            for r in replicas
+        ]
+    return status
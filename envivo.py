@@ -0,0 +1,204 @@
+# envivo.py
+"""
+Dashboards en vivo (Server-Sent Events).
+
+Las escrituras ya actualizan las tablas de resumen en su transacción (ver
+rollups.py); al hacerlo anotan en la sesión lo que cambia en los gráficos
+("+1 mascota en el refugio 3", "+1 adopción en 2026-10"). Cuando la
+transacción hace commit, ese delta se envía a todas las pantallas conectadas
+a `GET /web/dashboards/eventos`, que lo suman a sus gráficos sin volver a
+pedir los agregados: N pantallas no cuestan N consultas.
+
+- En PostgreSQL el delta viaja con `pg_notify` dentro de la misma transacción
+  (solo se entrega si hace commit) y cada worker lo recibe con LISTEN, así
+  llega también a las pantallas conectadas a otros workers.
+- Con otros motores se publica en el mismo proceso, después del commit.
+
+Una pantalla atrasada (cola llena) recibe el evento `resync` y vuelve a leer
+`GET /web/dashboards/datos`, que pasa por la caché de respuestas.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("envivo")
+
+DASHBOARD_PUSH = os.getenv("DASHBOARD_PUSH", "true").strip().lower() in (
+    "1", "true", "yes", "si", "on"
+)
+# Comentario cada N segundos para que proxies y navegador no corten la conexión
+DASHBOARD_PUSH_HEARTBEAT = float(os.getenv("DASHBOARD_PUSH_HEARTBEAT", "15"))
+# El servidor cierra cada stream después de N segundos y el navegador se
+# reconecta solo: así un worker que se apaga no queda esperando a las pantallas
+DASHBOARD_PUSH_MAX_SECONDS = float(os.getenv("DASHBOARD_PUSH_MAX_SECONDS", "300"))
+
+CANAL = "dashboards"
+_CLAVE = "envivo"
+# pg_notify acepta hasta 8000 bytes; un delta más grande pide resincronizar
+_MAX_NOTIFY_BYTES = 7900
+_COLA_MAX = 256
+_RESYNC = {"resync": True}
+
+_suscriptores: set[asyncio.Queue] = set()
+_escucha: asyncio.Task | None = None
+
+
+def anotar(session, grafico: str, clave, delta: int) -> None:
+    """Suma `delta` al punto `clave` de `grafico` ("mascotas" por refugio, "adopciones" por mes)."""
+    if not DASHBOARD_PUSH or not delta:
+        return
+    deltas = session.info.setdefault(_CLAVE, defaultdict(int))
+    deltas[grafico, clave] += delta
+
+
+def _armar(deltas: dict) -> dict | None:
+    datos: dict[str, list] = {}
+    for (grafico, clave), delta in deltas.items():
+        if delta:
+            datos.setdefault(grafico, []).append({"clave": clave, "delta": delta})
+    return datos or None
+
+
+def publicar(datos: dict) -> None:
+    """Entrega `datos` a las pantallas conectadas a este worker."""
+    for cola in list(_suscriptores):
+        try:
+            cola.put_nowait(datos)
+        except asyncio.QueueFull:
+            # Pantalla atrasada: se descarta lo pendiente y se le pide resincronizar
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait(_RESYNC)
+
+
+def suscriptores() -> int:
+    return len(_suscriptores)
+
+
+# -----------------------------
+# Eventos de la sesión
+# -----------------------------
+
+def _es_postgres(session: Session) -> bool:
+    bind = session.get_bind()
+    return bind is not None and bind.dialect.name == "postgresql"
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_del_commit(session: Session) -> None:
+    if _CLAVE not in session.info or not _es_postgres(session):
+        return
+    datos = _armar(session.info.pop(_CLAVE))
+    if datos is None:
+        return
+    payload = json.dumps(datos, separators=(",", ":"))
+    if len(payload.encode()) > _MAX_NOTIFY_BYTES:
+        payload = json.dumps(_RESYNC)
+    session.execute(text("SELECT pg_notify(:canal, :datos)"), {"canal": CANAL, "datos": payload})
+
+
+@event.listens_for(Session, "after_commit")
+def _despues_del_commit(session: Session) -> None:
+    deltas = session.info.pop(_CLAVE, None)
+    datos = _armar(deltas) if deltas else None
+    if datos is not None:
+        publicar(datos)
+
+
+@event.listens_for(Session, "after_rollback")
+def _despues_del_rollback(session: Session) -> None:
+    session.info.pop(_CLAVE, None)
+
+
+# -----------------------------
+# LISTEN (PostgreSQL)
+# -----------------------------
+
+def _recibir(conexion, pid: int, canal: str, payload: str) -> None:
+    try:
+        publicar(json.loads(payload))
+    except ValueError:
+        logger.warning("Notificación inválida en el canal %s: %r", canal, payload[:200])
+
+
+async def _escuchar(engine: AsyncEngine) -> None:
+    while True:
+        try:
+            async with engine.connect() as conn:
+                raw = (await conn.get_raw_connection()).driver_connection
+                await raw.add_listener(CANAL, _recibir)
+                try:
+                    # Mientras no se escuchaba pudo haber cambios
+                    publicar(_RESYNC)
+                    while not raw.is_closed():
+                        await asyncio.sleep(DASHBOARD_PUSH_HEARTBEAT)
+                        await raw.execute("SELECT 1")
+                finally:
+                    # No devolver al pool una conexión con LISTEN activo
+                    await conn.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Se perdió la conexión LISTEN de los dashboards; reintentando")
+            await asyncio.sleep(5)
+
+
+async def iniciar(engine: AsyncEngine) -> None:
+    global _escucha
+    if DASHBOARD_PUSH and engine.dialect.name == "postgresql":
+        _escucha = asyncio.create_task(_escuchar(engine))
+
+
+async def detener() -> None:
+    global _escucha
+    if _escucha is None:
+        return
+    _escucha.cancel()
+    try:
+        await _escucha
+    except asyncio.CancelledError:
+        pass
+    _escucha = None
+
+
+# -----------------------------
+# Server-Sent Events
+# -----------------------------
+
+def _evento(nombre: str, datos: dict) -> bytes:
+    return f"event: {nombre}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n".encode()
+
+
+async def _stream() -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    cola: asyncio.Queue = asyncio.Queue(_COLA_MAX)
+    _suscriptores.add(cola)
+    fin = loop.time() + DASHBOARD_PUSH_MAX_SECONDS
+    try:
+        # Un primer trozo enseguida: las cabeceras salen sin esperar al primer cambio
+        yield b"retry: 3000\n: conectado\n\n"
+        while (restante := fin - loop.time()) > 0:
+            try:
+                datos = await asyncio.wait_for(cola.get(), min(DASHBOARD_PUSH_HEARTBEAT, restante))
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield _evento("resync" if datos.get("resync") else "delta", datos)
+    finally:
+        _suscriptores.discard(cola)
+
+
+def respuesta_eventos() -> StreamingResponse:
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
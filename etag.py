@@ -0,0 +1,129 @@
+# etag.py
+"""
+GET condicional (ETag / Last-Modified) para listados y vistas HTML.
+
+Cada entidad ("refugio", "mascota", "adopcion", "historial") tiene una fila
+en `tabla_version` con un contador y la fecha del último cambio. Los routers
+llaman a `registrar_cambio(...)` antes de su `commit()`, así la versión sube
+en la misma transacción que los datos y es la misma para todos los workers.
+
+El decorador `condicional(...)` lee esas versiones (una consulta por clave
+primaria), arma el ETag con la ruta + query string y, si coincide con
+`If-None-Match` (o no hubo cambios desde `If-Modified-Since`), responde 304
+sin ejecutar el endpoint: ni la consulta del listado ni el template.
+"""
+import datetime
+import functools
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import request_key
+from db import async_session_maker, dialect_insert
+from models import TablaVersion
+
+
+def _ahora() -> datetime.datetime:
+    # Last-Modified tiene resolución de segundos
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+def _utc(fecha: datetime.datetime) -> datetime.datetime:
+    if fecha.tzinfo is None:
+        return fecha.replace(tzinfo=datetime.timezone.utc)
+    return fecha.astimezone(datetime.timezone.utc)
+
+
+async def registrar_cambio(session: AsyncSession, *tablas: str) -> None:
+    """Sube la versión de `tablas`. Llamar antes del commit de la escritura."""
+    ahora = _ahora()
+    for tabla in sorted(tablas):
+        stmt = dialect_insert(session, TablaVersion).values(
+            tabla=tabla, version=1, modificado=ahora
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["tabla"],
+            set_={"version": TablaVersion.version + 1, "modificado": ahora},
+        )
+        await session.exec(stmt)
+
+
+async def versiones(session: AsyncSession, tablas: tuple[str, ...]) -> dict[str, TablaVersion]:
+    result = await session.exec(select(TablaVersion).where(TablaVersion.tabla.in_(tablas)))
+    return {v.tabla: v for v in result.all()}
+
+
+def _etag(request: Request, tablas: tuple[str, ...], actuales: dict[str, TablaVersion]) -> str:
+    firma = ",".join(f"{t}:{actuales[t].version if t in actuales else 0}" for t in tablas)
+    digest = hashlib.sha256(f"{request_key(request)}|{firma}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _coincide(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Para If-None-Match la comparación es débil: se ignora el prefijo W/
+    candidatos = (c.strip().removeprefix("W/") for c in if_none_match.split(","))
+    return etag in candidatos
+
+
+def _sin_cambios(request: Request, etag: str, modificado: datetime.datetime | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _coincide(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or modificado is None:
+        return False
+    try:
+        desde = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return modificado <= _utc(desde)
+
+
+def condicional(*tablas: str):
+    """
+    Decorador para endpoints GET que reciben `request: Request` y, si devuelven
+    un valor en lugar de una Response, `response: Response` para las cabeceras.
+    Va por encima de `@cached`.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Request | None = kwargs.get("request")
+            if request is None or request.method not in ("GET", "HEAD"):
+                return await func(*args, **kwargs)
+
+            session: AsyncSession | None = kwargs.get("session")
+            if session is not None:
+                actuales = await versiones(session, tablas)
+            else:
+                async with async_session_maker() as own:
+                    actuales = await versiones(own, tablas)
+
+            etag = _etag(request, tablas, actuales)
+            modificado = max((_utc(v.modificado) for v in actuales.values()), default=None)
+            headers = {"ETag": etag}
+            if modificado is not None:
+                headers["Last-Modified"] = format_datetime(modificado, usegmt=True)
+
+            if _sin_cambios(request, etag, modificado):
+                return Response(status_code=304, headers=headers)
+
+            # La caché de respuestas usa el ETag en su clave: una entrada
+            # calculada con versiones viejas no se sirve con el ETag nuevo
+            request.state.etag = etag
+            result = await func(*args, **kwargs)
+            destino = result if isinstance(result, Response) else kwargs.get("response")
+            if destino is not None and destino.status_code in (None, 200):
+                destino.headers.update(headers)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,221 @@
+# fastjson.py
+"""
+Camino rápido de serialización para los listados y compresión de respuestas.
+
+Con FAST_JSON=true los listados seleccionan las columnas de la tabla (sin
+construir objetos ORM) y devuelven las filas tal cual con orjson, sin pasar
+por la validación de `response_model`: las filas ya tienen la forma del
+modelo porque salen de su propia tabla. La documentación OpenAPI no cambia.
+
+`CompressionMiddleware` comprime con brotli o gzip (según `Accept-Encoding`
+y lo que esté instalado) las respuestas de más de COMPRESS_MIN_BYTES,
+incluidas las que van en streaming.
+"""
+import datetime
+import enum
+import importlib.util
+import json
+import os
+import zlib
+from typing import Any
+
+from fastapi import Response
+from sqlmodel import SQLModel, select
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+FAST_JSON = os.getenv("FAST_JSON", "false").strip().lower() in ("1", "true", "yes", "si", "on")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL_GZIP = int(os.getenv("COMPRESS_LEVEL_GZIP", "6"))
+COMPRESS_LEVEL_BROTLI = int(os.getenv("COMPRESS_LEVEL_BROTLI", "4"))
+
+ORJSON_DISPONIBLE = importlib.util.find_spec("orjson") is not None
+BROTLI_DISPONIBLE = importlib.util.find_spec("brotli") is not None
+
+# Tipos que vale la pena comprimir (las imágenes ya vienen comprimidas)
+COMPRIMIBLES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/",
+    "application/javascript",
+    "image/svg+xml",
+)
+
+
+# -----------------------------
+# Serialización
+# -----------------------------
+
+def _default(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} no es serializable a JSON")
+
+
+if ORJSON_DISPONIBLE:
+    import orjson
+
+    def dumps(content: Any) -> bytes:
+        # orjson ya entiende date, datetime y Enum; _default cubre el resto
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+else:
+
+    def dumps(content: Any) -> bytes:
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def seleccionar(model: type[SQLModel]):
+    """`select(model)`, o solo sus columnas si el camino rápido está activo."""
+    if FAST_JSON:
+        return select(*model.__table__.columns)
+    return select(model)
+
+
+def responder(filas: list, response: Response) -> Any:
+    """
+    Devuelve `filas` para que FastAPI las valide con `response_model`, o con
+    FAST_JSON una FastJSONResponse que conserva las cabeceras ya puestas en
+    `response` (p. ej. X-Next-Cursor).
+    """
+    if not FAST_JSON:
+        return filas
+    rapida = FastJSONResponse([fila._asdict() for fila in filas])
+    for key, value in response.headers.items():
+        if key.lower() not in ("content-length", "content-type"):
+            rapida.headers[key] = value
+    return rapida
+
+
+# -----------------------------
+# Compresión
+# -----------------------------
+
+def _elegir_codificacion(accept_encoding: str) -> str | None:
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, params = parte.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip()] = q
+    if BROTLI_DISPONIBLE and aceptadas.get("br", 0) > 0:
+        return "br"
+    if aceptadas.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compresor:
+    def __init__(self, codificacion: str):
+        self.brotli = codificacion == "br"
+        if self.brotli:
+            import brotli
+
+            self._c = brotli.Compressor(quality=COMPRESS_LEVEL_BROTLI)
+        else:
+            # wbits=31: formato gzip (cabecera + CRC)
+            self._c = zlib.compressobj(COMPRESS_LEVEL_GZIP, zlib.DEFLATED, 31)
+
+    def parcial(self, data: bytes) -> bytes:
+        if self.brotli:
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def final(self, data: bytes) -> bytes:
+        if self.brotli:
+            return self._c.process(data) + self._c.finish()
+        return self._c.compress(data) + self._c.flush()
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI. Si el cuerpo completo cabe en el primer mensaje y es
+    menor que `minimum_size`, se envía sin tocar. Las respuestas en streaming
+    se comprimen por bloques (con flush, así el cliente las recibe a medida
+    que se generan). Un ETag fuerte pasa a débil al comprimir, porque el
+    cuerpo ya no es byte a byte el mismo.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codificacion = _elegir_codificacion(Headers(scope=scope).get("accept-encoding", ""))
+        inicio: Message | None = None
+        compresor: _Compresor | None = None
+        directo = False
+
+        async def enviar(message: Message) -> None:
+            nonlocal inicio, compresor, directo
+
+            if message["type"] == "http.response.start":
+                # Se retiene hasta ver el primer bloque del cuerpo
+                inicio = message
+                return
+            if directo or message["type"] != "http.response.body":
+                if inicio is not None:
+                    await send(inicio)
+                    inicio = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compresor is None:
+                headers = MutableHeaders(raw=inicio["headers"])
+                comprimible = (
+                    inicio["status"] not in (204, 304)
+                    and headers.get("content-type", "").startswith(COMPRIMIBLES)
+                    and "content-encoding" not in headers
+                )
+                if comprimible:
+                    headers.add_vary_header("Accept-Encoding")
+                if (
+                    not comprimible
+                    or codificacion is None
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    directo = True
+                    await send(inicio)
+                    inicio = None
+                    await send(message)
+                    return
+
+                compresor = _Compresor(codificacion)
+                headers["Content-Encoding"] = codificacion
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await send(inicio)
+                inicio = None
+
+            if more_body:
+                body = compresor.parcial(body)
+            else:
+                body = compresor.final(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, enviar)
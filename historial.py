@@ -1,11 +1,29 @@
 # historial.py
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from sqlmodel import select
+from sqlalchemy import insert, tuple_
 
-from db import SessionDep
-from models import HistorialCuidado, HistorialCuidadoCreate, Mascota
+from bulk import BulkReport, lotes_validados
+from cache import invalidate
+from cola_historial import cola
+from db import ReadSessionDep, SessionDep
+from etag import condicional, registrar_cambio
+from export import export_response
+from fastjson import FAST_JSON, responder, seleccionar
+from loader import LoaderDep
+from models import (
+    HistorialCuidado,
+    HistorialCuidadoCreate,
+    HistorialResumen,
+    HistorialTipoConteo,
+    Mascota,
+)
+from pagination import check_paging, decode_fecha_id_cursor, set_next_cursor
+from particiones import leer_archivados
+from rollups import registrar_historial
 
 router = APIRouter(prefix="/historial", tags=["historial"])
 
@@ -15,58 +33,161 @@ router = APIRouter(prefix="/historial", tags=["historial"])
     response_model=HistorialCuidado,
     status_code=201,
     summary="Registrar un evento de cuidado",
+    responses={
+        202: {"description": "En cola (HISTORIAL_WRITE_BEHIND), se guarda en el próximo lote"},
+        503: {"description": "Cola de eventos llena; reintentar después de Retry-After"},
+    },
 )
-async def create_historial(new_historial: HistorialCuidadoCreate, session: SessionDep):
-    mascota = await session.get(Mascota, new_historial.mascota_id)
-    if not mascota:
+async def create_historial(
+    new_historial: HistorialCuidadoCreate, session: SessionDep, loader: LoaderDep
+):
+    (mascotas,) = await loader.existentes((Mascota.id, [new_historial.mascota_id]))
+    if not mascotas:
         raise HTTPException(status_code=404, detail="Mascota no encontrada")
 
+    if cola.activa:
+        # Escritura diferida: queda en el journal y se inserta con el próximo lote
+        return JSONResponse(await cola.encolar(new_historial), status_code=202)
+
     historial = HistorialCuidado.model_validate(new_historial)
     session.add(historial)
+    await registrar_historial(session, [historial])
+    await registrar_cambio(session, "historial")
     await session.commit()
+    invalidate("historial")
     await session.refresh(historial)
     return historial
 
 
+@router.post(
+    "/bulk",
+    summary="Carga masiva de eventos de cuidado (NDJSON o CSV en streaming)",
+)
+async def bulk_historial(request: Request, session: SessionDep, loader: LoaderDep):
+    report = BulkReport()
+
+    async for lote in lotes_validados(request, HistorialCuidadoCreate, report):
+        (existentes,) = await loader.existentes((Mascota.id, {h.mascota_id for _, h in lote}))
+
+        validos = []
+        for fila, h in lote:
+            if h.mascota_id not in existentes:
+                report.error(fila, "Mascota no encontrada")
+                continue
+            validos.append(h)
+
+        if not validos:
+            continue
+        filas = [h.model_dump() for h in validos]
+        await session.exec(insert(HistorialCuidado), params=filas)
+        await registrar_historial(session, validos)
+        await registrar_cambio(session, "historial")
+        await session.commit()
+        report.insertadas += len(filas)
+
+    if report.insertadas:
+        invalidate("historial")
+    return report.as_dict()
+
+
+@router.get(
+    "/export",
+    summary="Exportar historial de cuidados (CSV o NDJSON en streaming)",
+)
+async def export_historial(
+    formato: str = Query("csv", description="csv o ndjson"),
+    anio: int | None = Query(None, description="Filtrar por año"),
+    refugio_id: int | None = Query(None, description="Filtrar por refugio de la mascota"),
+    mascota_id: int | None = Query(None, description="Filtrar por mascota"),
+):
+    stmt = select(*HistorialCuidado.__table__.columns).order_by(
+        HistorialCuidado.fecha.desc(), HistorialCuidado.id.desc()
+    )
+    if anio is not None:
+        stmt = stmt.where(HistorialCuidado.fecha.between(f"{anio}-01-01", f"{anio}-12-31"))
+    if mascota_id is not None:
+        stmt = stmt.where(HistorialCuidado.mascota_id == mascota_id)
+    if refugio_id is not None:
+        stmt = stmt.join(Mascota, HistorialCuidado.mascota_id == Mascota.id).where(
+            Mascota.refugio_id == refugio_id
+        )
+    return export_response(stmt, formato, "historial")
+
+
 @router.get(
     "/mascota/{mascota_id}",
     response_model=List[HistorialCuidado],
     summary="Ver historial de una mascota",
 )
+@condicional("historial")
 async def historial_by_mascota(
+    request: Request,
     mascota_id: int,
-    session: SessionDep,
+    session: ReadSessionDep,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    archivo: bool = Query(False, description="Seguir con los eventos archivados (ver particiones.py)"),
 ):
+    check_paging(skip, cursor)
+    if archivo and skip:
+        raise HTTPException(status_code=400, detail="Con 'archivo' se pagina con 'cursor', no con 'skip'")
+    antes = None
     stmt = (
-        select(HistorialCuidado)
+        seleccionar(HistorialCuidado)
         .where(HistorialCuidado.mascota_id == mascota_id)
-        .order_by(HistorialCuidado.fecha.desc())
-        .offset(skip)
-        .limit(limit)
+        .order_by(HistorialCuidado.fecha.desc(), HistorialCuidado.id.desc())
     )
+    if cursor is not None:
+        antes = decode_fecha_id_cursor(cursor, "historial")
+        stmt = stmt.where(tuple_(HistorialCuidado.fecha, HistorialCuidado.id) < antes)
+
+    stmt = stmt.offset(skip).limit(limit)
     result = await session.exec(stmt)
-    return result.all()
+    eventos = result.all()
+    if archivo:
+        # Un evento cargado con fecha atrasada queda en la base aunque su mes ya
+        # esté archivado: se mezclan las dos fuentes por (fecha, id). Con la
+        # página llena solo importan los archivos que llegan hasta su última fecha.
+        piso = eventos[-1].fecha if len(eventos) == limit else None
+        archivados = await leer_archivados(session, mascota_id, antes, limit, piso)
+        if archivados:
+            if not FAST_JSON:
+                archivados = [HistorialCuidado(**fila._asdict()) for fila in archivados]
+            eventos = sorted([*eventos, *archivados], key=lambda h: (h.fecha, h.id), reverse=True)
+            eventos = eventos[:limit]
+    set_next_cursor(response, eventos, limit, "historial", lambda h: (h.fecha, h.id))
+    return responder(eventos, response)
 
 
 @router.get(
     "/mascota/{mascota_id}/costo-total",
     summary="Ver costo total de cuidado de una mascota",
 )
-async def costo_total_mascota(mascota_id: int, session: SessionDep):
-    mascota = await session.get(Mascota, mascota_id)
-    if not mascota:
+async def costo_total_mascota(mascota_id: int, session: ReadSessionDep):
+    # Lee el resumen mantenido en historial_resumen: no recorre los eventos
+    result = await session.exec(
+        select(Mascota.nombre, HistorialResumen)
+        .outerjoin(HistorialResumen, HistorialResumen.mascota_id == Mascota.id)
+        .where(Mascota.id == mascota_id)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Mascota no encontrada")
+    nombre, resumen = row
 
-    stmt = select(HistorialCuidado).where(HistorialCuidado.mascota_id == mascota_id)
-    result = await session.exec(stmt)
-    eventos = result.all()
-    total = sum(e.costo for e in eventos)
+    tipos = await session.exec(
+        select(HistorialTipoConteo.tipo_evento, HistorialTipoConteo.total).where(
+            HistorialTipoConteo.mascota_id == mascota_id, HistorialTipoConteo.total > 0
+        )
+    )
 
     return {
         "mascota_id": mascota_id,
-        "mascota_nombre": mascota.nombre,
-        "total_eventos": len(eventos),
-        "costo_total": total,
+        "mascota_nombre": nombre,
+        "total_eventos": resumen.total_eventos if resumen else 0,
+        "costo_total": resumen.costo_total if resumen else 0,
+        "ultima_fecha": resumen.ultima_fecha if resumen else None,
+        "eventos_por_tipo": dict(tipos.all()),
     }
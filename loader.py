@@ -0,0 +1,161 @@
+# loader.py
+"""
+Carga por clave primaria agrupada (dataloader) con alcance de request.
+
+- `load(model, id)`: las llamadas hechas en el mismo ciclo del event loop
+  (p. ej. con asyncio.gather) se resuelven con un solo `WHERE id IN (...)`.
+- `load_many(model, ids)`: una consulta para toda la lista, en el mismo
+  orden y con None para los que no existen.
+- `existentes(...)`: comprueba claves de varias tablas en un único viaje a
+  la base (UNION ALL), para validar claves foráneas antes de escribir.
+
+Los objetos que ya están en la sesión no se vuelven a pedir.
+"""
+import asyncio
+from typing import Annotated, Any, Iterable
+
+from fastapi import Depends, HTTPException, Response
+from sqlalchemy import inspect, literal, union_all
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import ReadSessionDep, SessionDep
+
+# Cabecera con los IDs pedidos en `?ids=` que no existen
+MISSING_IDS_HEADER = "X-Missing-Ids"
+MAX_IDS = 100
+# Tamaño máximo de cada IN (...), por debajo del límite de parámetros del driver
+IN_CHUNK_SIZE = 1000
+
+
+def _pk(model: type[SQLModel]):
+    columnas = inspect(model).primary_key
+    if len(columnas) != 1:
+        raise TypeError(f"{model.__name__} no tiene una clave primaria simple")
+    return getattr(model, columnas[0].key)
+
+
+class EntityLoader:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self._pendientes: dict[type[SQLModel], dict[Any, list[asyncio.Future]]] = {}
+        self._despacho: asyncio.Task | None = None
+
+    def _en_sesion(self, model: type[SQLModel], pk: Any) -> SQLModel | None:
+        return self.session.identity_map.get(self.session.identity_key(model, pk))
+
+    async def _consultar(self, model: type[SQLModel], ids: list) -> dict[Any, SQLModel]:
+        columna = _pk(model)
+        encontrados: dict[Any, SQLModel] = {}
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            result = await self.session.exec(
+                select(model).where(columna.in_(ids[i : i + IN_CHUNK_SIZE]))
+            )
+            for obj in result.all():
+                encontrados[getattr(obj, columna.key)] = obj
+        return encontrados
+
+    async def load(self, model: type[SQLModel], pk: Any) -> SQLModel | None:
+        obj = self._en_sesion(model, pk)
+        if obj is not None:
+            return obj
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pendientes.setdefault(model, {}).setdefault(pk, []).append(future)
+        if self._despacho is None:
+            self._despacho = loop.create_task(self._despachar())
+        return await future
+
+    async def _despachar(self) -> None:
+        # Deja que el resto de corutinas del mismo ciclo encolen sus claves
+        await asyncio.sleep(0)
+        self._despacho = None
+        pendientes, self._pendientes = self._pendientes, {}
+
+        # La sesión no admite consultas concurrentes: un modelo por vez
+        for model, por_id in pendientes.items():
+            try:
+                encontrados = await self._consultar(model, list(por_id))
+            except Exception as e:
+                for futures in por_id.values():
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                continue
+            for pk, futures in por_id.items():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(encontrados.get(pk))
+
+    async def load_many(self, model: type[SQLModel], ids: Iterable) -> list[SQLModel | None]:
+        ids = list(ids)
+        faltan = [pk for pk in dict.fromkeys(ids) if self._en_sesion(model, pk) is None]
+        encontrados = await self._consultar(model, faltan) if faltan else {}
+        return [encontrados.get(pk) or self._en_sesion(model, pk) for pk in ids]
+
+    async def existentes(self, *consultas: tuple[Any, Iterable]) -> list[set]:
+        """
+        `consultas`: pares (columna, valores). Devuelve, en el mismo orden, el
+        conjunto de valores que existen en cada columna. Un solo SELECT.
+        """
+        valores = [set(v) for _, v in consultas]
+        partes = [
+            select(literal(i).label("n"), columna.label("v")).where(columna.in_(vals))
+            for i, ((columna, _), vals) in enumerate(zip(consultas, valores))
+            if vals
+        ]
+        resultado: list[set] = [set() for _ in consultas]
+        if not partes:
+            return resultado
+        stmt = partes[0] if len(partes) == 1 else union_all(*partes)
+        result = await self.session.exec(stmt)
+        for n, valor in result.all():
+            resultado[n].add(valor)
+        return resultado
+
+
+def get_loader(session: SessionDep) -> EntityLoader:
+    # FastAPI reutiliza la misma sesión para todas las dependencias del request
+    return EntityLoader(session)
+
+
+LoaderDep = Annotated[EntityLoader, Depends(get_loader)]
+
+
+def get_read_loader(session: ReadSessionDep) -> EntityLoader:
+    # Para los GET: usa la misma sesión de lectura (réplica) que el endpoint
+    return EntityLoader(session)
+
+
+ReadLoaderDep = Annotated[EntityLoader, Depends(get_read_loader)]
+
+
+def parse_ids(ids: str) -> list[int]:
+    """`"3,1,2"` -> [3, 1, 2]. Lanza 400 si hay valores inválidos o demasiados."""
+    try:
+        valores = [int(v) for v in ids.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids debe ser una lista de enteros separados por coma"
+        )
+    if not valores:
+        raise HTTPException(status_code=400, detail="ids no puede estar vacío")
+    if len(valores) > MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Como máximo {MAX_IDS} ids por petición")
+    return valores
+
+
+async def multi_get(
+    loader: EntityLoader, model: type[SQLModel], ids: str, response: Response
+) -> list[SQLModel]:
+    """
+    Respuesta de `GET /...?ids=`: los encontrados en el orden pedido (sin
+    repetir) y los que faltan en la cabecera X-Missing-Ids.
+    """
+    pedidos = list(dict.fromkeys(parse_ids(ids)))
+    objetos = await loader.load_many(model, pedidos)
+    faltantes = [pk for pk, obj in zip(pedidos, objetos) if obj is None]
+    if faltantes:
+        response.headers[MISSING_IDS_HEADER] = ",".join(str(pk) for pk in faltantes)
+    return [obj for obj in objetos if obj is not None]
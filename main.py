@@ -1,34 +1,95 @@
 # main.py
+# Primero: mide los tiempos de arranque desde aquí (ver GET /health/startup)
+import arranque
+
 from contextlib import asynccontextmanager
 from typing import Optional
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Query, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 
 from sqlmodel import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func, extract
+from sqlalchemy import func, tuple_
 import datetime
 
+arranque.marcar("import: fastapi, sqlalchemy, sqlmodel")
+
 import refugio
 import mascota
 import historial
 import adopcion
+import envivo
+import particiones
+import stats
+import thumbnails
+import upload
+
+from cache import cache_stats, cached
+from cola_historial import HISTORIAL_WRITE_BEHIND, cola as cola_historial
+from db import (
+    engine, create_tables, dispose_engines, pool_status, ReadSessionDep, ReadYourWritesMiddleware,
+    SessionDep, DB_AUTO_MIGRATE, DB_SCHEMA_FINGERPRINT,
+)
+from etag import condicional
+from fastjson import CompressionMiddleware
+from loader import LoaderDep
+from migrate import (
+    bloqueo_esquema, run_migrations, schema_fingerprint, store_fingerprint, stored_fingerprint,
+)
+from pagination import (
+    WEB_PAGE_SIZE, WEB_TABLE_PAGE_SIZE, decode_fecha_id_cursor, decode_id_cursor, web_next_page,
+)
+from particiones import HISTORIAL_PARTICIONES
+from plantillas import fragmentos_stats, render, templates
+from sqlstats import SQLStatsMiddleware
+from supa.supabase import UploadLimitMiddleware
+from models import (
+    Refugio, Mascota, Adopcion, HistorialCuidado, AdopcionCreate, HistorialCuidadoCreate,
+    AdopcionMensual, MascotaConteo, HistorialResumen,
+)
 
-from db import create_tables, SessionDep
-from models import Refugio, Mascota, Adopcion, HistorialCuidado, AdopcionCreate, HistorialCuidadoCreate
-
-
-templates = Jinja2Templates(directory="templates")
+arranque.marcar("import: módulos de la app")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Crear tablas en Clever Cloud si no existen
-    await create_tables()
+    # Si el esquema no cambió desde el último arranque no hace falta DDL
+    with arranque.medir("lifespan: huella del esquema"):
+        huella = schema_fingerprint(include_migrations=DB_AUTO_MIGRATE)
+        sin_cambios = DB_SCHEMA_FINGERPRINT and await stored_fingerprint() == huella
+    if not sin_cambios:
+        # Workers arrancando a la vez: uno crea y migra, los demás esperan y ven la huella nueva
+        async with bloqueo_esquema():
+            if not (DB_SCHEMA_FINGERPRINT and await stored_fingerprint() == huella):
+                # Crear tablas en Clever Cloud si no existen
+                with arranque.medir("lifespan: create_all"):
+                    await create_tables()
+                # Aplicar migraciones pendientes (índices, columnas nuevas, ...)
+                if DB_AUTO_MIGRATE:
+                    with arranque.medir("lifespan: migraciones"):
+                        await run_migrations()
+                await store_fingerprint(huella)
+    # Escritura diferida del historial: reprocesar journals de workers caídos
+    if HISTORIAL_WRITE_BEHIND:
+        with arranque.medir("lifespan: journal del historial"):
+            await cola_historial.iniciar()
+    # Particiones de historialcuidado para los próximos meses (solo PostgreSQL)
+    if HISTORIAL_PARTICIONES:
+        with arranque.medir("lifespan: particiones del historial"):
+            await particiones.iniciar()
+    # Cambios de los dashboards de otros workers (LISTEN, solo PostgreSQL)
+    await envivo.iniciar(engine)
+    arranque.listo()
     yield
+    await envivo.detener()
+    await particiones.detener()
+    # Guardar los eventos de historial en cola antes de cerrar las conexiones
+    await cola_historial.detener()
+    # Terminar el pool de procesos de miniaturas y cerrar las conexiones del pool de este worker
+    thumbnails.shutdown()
+    await dispose_engines()
 
 
 app = FastAPI(
@@ -38,6 +99,18 @@ app = FastAPI(
     description="API para gestionar refugios, mascotas, historiales de cuidado y adopciones.",
 )
 
+# Compresión gzip / brotli de las respuestas grandes
+app.add_middleware(CompressionMiddleware)
+
+# Consultas, filas y tiempo de SQL por request (Server-Timing, N+1, consultas lentas)
+app.add_middleware(SQLStatsMiddleware)
+
+# Lecturas del primario durante unos segundos después de escribir (si hay réplicas)
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Subidas de imágenes: 413 antes de copiar a disco un cuerpo demasiado grande
+app.add_middleware(UploadLimitMiddleware)
+
 # Archivos estáticos (CSS, imágenes locales, etc.)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -46,6 +119,40 @@ app.include_router(refugio.router)
 app.include_router(mascota.router)
 app.include_router(historial.router)
 app.include_router(adopcion.router)
+app.include_router(stats.router)
+app.include_router(upload.router)
+
+
+@app.get("/health/db-pool", tags=["health"])
+async def db_pool_health():
+    """
+    Uso del pool de conexiones de este worker (conexiones en uso, overflow y espera).
+    """
+    return pool_status()
+
+
+@app.get("/health/cache", tags=["health"])
+async def cache_health():
+    """
+    Contadores de la caché de respuestas y de fragmentos HTML de este worker.
+    """
+    return {**cache_stats(), "fragmentos": fragmentos_stats()}
+
+
+@app.get("/health/historial-queue", tags=["health"])
+async def historial_queue_health():
+    """
+    Estado de la escritura diferida del historial en este worker (pendientes, lotes, rechazos).
+    """
+    return cola_historial.stats()
+
+
+@app.get("/health/startup", tags=["health"])
+async def startup_health():
+    """
+    Tiempos de arranque de este worker: imports, app y pasos del lifespan.
+    """
+    return arranque.reporte()
 
 
 # -------------------------------------------------------------------
@@ -63,11 +170,13 @@ async def home(request: Request):
         "subtitle": "Gestión de refugios, mascotas, cuidados y adopciones",
         "active_page": "home",
     }
-    return templates.TemplateResponse("home.html", context)
+    return render(request, "home.html", context)
 
 
 @app.get("/web/refugios", response_class=HTMLResponse, tags=["web"])
-async def refugios_web(request: Request, session: SessionDep):
+@condicional("refugio")
+@cached("refugio")
+async def refugios_web(request: Request, session: ReadSessionDep):
     """
     Vista web: listado de refugios.
     """
@@ -79,54 +188,98 @@ async def refugios_web(request: Request, session: SessionDep):
         "refugios": refugios,
         "active_page": "refugios",
     }
-    return templates.TemplateResponse("refugios_list.html", context)
+    return render(request, "refugios_list.html", context)
 
 
-@app.get("/web/mascotas", response_class=HTMLResponse, tags=["web"])
-async def mascotas_web(
-    request: Request,
-    session: SessionDep,
-    refugio_id: Optional[int] = None,
-):
-    """
-    Vista web: listado de mascotas. Puede filtrarse opcionalmente por refugio.
-    """
+async def _pagina_mascotas(
+    request: Request, session, refugio_id: Optional[int], cursor: Optional[str]
+) -> dict:
     stmt = (
         select(Mascota)
         .options(selectinload(Mascota.refugio))
         .order_by(Mascota.id)
+        .limit(WEB_PAGE_SIZE)
     )
-
     if refugio_id is not None:
         stmt = stmt.where(Mascota.refugio_id == refugio_id)
+    if cursor is not None:
+        stmt = stmt.where(Mascota.id > decode_id_cursor(cursor, "web-mascotas"))
 
     result = await session.execute(stmt)
     mascotas = result.scalars().all()
-    refugio_result = await session.execute(select(Refugio).order_by(Refugio.nombre))
-    refugios = refugio_result.scalars().all()
-
-    context = {
+    return {
         "request": request,
         "mascotas": mascotas,
-        "refugio_id": refugio_id,
-        "refugios": refugios,
-        "active_page": "mascotas",
+        **web_next_page(
+            request, mascotas, WEB_PAGE_SIZE, "web-mascotas", lambda m: (m.id,),
+            "/web/mascotas", "/web/mascotas/fragmento",
+        ),
     }
-    return templates.TemplateResponse("mascotas.html", context)
 
 
-@app.get("/web/historial", response_class=HTMLResponse, tags=["web"])
-async def historial_web(request: Request, session: SessionDep):
+@app.get("/web/mascotas", response_class=HTMLResponse, tags=["web"])
+@condicional("mascota", "refugio")
+@cached("mascota", "refugio")
+async def mascotas_web(
+    request: Request,
+    session: ReadSessionDep,
+    refugio_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
     """
-    Vista web: historial de cuidados (listado simple).
+    Vista web: listado de mascotas, paginado (la primera página y un enlace a
+    la siguiente). Puede filtrarse opcionalmente por refugio.
     """
+    context = await _pagina_mascotas(request, session, refugio_id, cursor)
+
+    # Totales desde la tabla de resumen, sin contar las filas
+    q_totales = select(MascotaConteo.estado, func.sum(MascotaConteo.total)).group_by(
+        MascotaConteo.estado
+    )
+    if refugio_id is not None:
+        q_totales = q_totales.where(MascotaConteo.refugio_id == refugio_id)
+    totales = {estado: int(total or 0) for estado, total in (await session.execute(q_totales)).all()}
+
+    context.update(
+        {
+            "total": sum(totales.values()),
+            "activas": totales.get(True, 0),
+            "inactivas": totales.get(False, 0),
+            "refugio_id": refugio_id,
+            "refugio_filtro": await session.get(Refugio, refugio_id) if refugio_id is not None else None,
+            "active_page": "mascotas",
+        }
+    )
+    return render(request, "mascotas.html", context)
+
+
+@app.get("/web/mascotas/fragmento", response_class=HTMLResponse, tags=["web"])
+@condicional("mascota", "refugio")
+@cached("mascota", "refugio")
+async def mascotas_fragmento_web(
+    request: Request,
+    session: ReadSessionDep,
+    cursor: str,
+    refugio_id: Optional[int] = None,
+):
+    """
+    Fragmento HTML con la página siguiente de tarjetas (scroll infinito).
+    """
+    context = await _pagina_mascotas(request, session, refugio_id, cursor)
+    return render(request, "_mascota_cards.html", context)
+
+
+async def _pagina_historial(request: Request, session, cursor: Optional[str]) -> dict:
     stmt = (
         select(HistorialCuidado, Mascota.nombre, Refugio.nombre)
         .join(Mascota, HistorialCuidado.mascota_id == Mascota.id)
         .join(Refugio, Mascota.refugio_id == Refugio.id)
-        .order_by(HistorialCuidado.fecha.desc())
-        .limit(50)
+        .order_by(HistorialCuidado.fecha.desc(), HistorialCuidado.id.desc())
+        .limit(WEB_TABLE_PAGE_SIZE)
     )
+    if cursor is not None:
+        fecha, last_id = decode_fecha_id_cursor(cursor, "web-historial")
+        stmt = stmt.where(tuple_(HistorialCuidado.fecha, HistorialCuidado.id) < (fecha, last_id))
     result = await session.execute(stmt)
     rows = result.all()
 
@@ -142,33 +295,56 @@ async def historial_web(request: Request, session: SessionDep):
         }
         for hc, mascota_nombre, refugio_nombre in rows
     ]
-
-    masc_result = await session.execute(select(Mascota).order_by(Mascota.nombre))
-    mascotas = masc_result.scalars().all()
-
-    context = {
+    return {
         "request": request,
         "historial": registros,
-        "mascotas": mascotas,
-        "ok": request.query_params.get("ok"),
-        "error": request.query_params.get("error"),
-        "active_page": "historial",
+        **web_next_page(
+            request, registros, WEB_TABLE_PAGE_SIZE, "web-historial",
+            lambda r: (r["fecha"], r["id"]), "/web/historial", "/web/historial/fragmento",
+        ),
     }
-    return templates.TemplateResponse("historial.html", context)
 
 
-@app.get("/web/adopciones", response_class=HTMLResponse, tags=["web"])
-async def adopciones_web(request: Request, session: SessionDep):
+@app.get("/web/historial", response_class=HTMLResponse, tags=["web"])
+@condicional("historial", "mascota", "refugio")
+@cached("historial", "mascota", "refugio")
+async def historial_web(request: Request, session: ReadSessionDep, cursor: Optional[str] = None):
+    """
+    Vista web: historial de cuidados, paginado del más reciente al más antiguo.
     """
-    Vista web: listado de adopciones (simple).
+    context = await _pagina_historial(request, session, cursor)
+    context.update(
+        {
+            "ok": request.query_params.get("ok"),
+            "error": request.query_params.get("error"),
+            "active_page": "historial",
+        }
+    )
+    return render(request, "historial.html", context)
+
+
+@app.get("/web/historial/fragmento", response_class=HTMLResponse, tags=["web"])
+@condicional("historial", "mascota", "refugio")
+@cached("historial", "mascota", "refugio")
+async def historial_fragmento_web(request: Request, session: ReadSessionDep, cursor: str):
+    """
+    Fragmento HTML con las filas de la página siguiente del historial.
     """
+    context = await _pagina_historial(request, session, cursor)
+    return render(request, "_historial_filas.html", context)
+
+
+async def _pagina_adopciones(request: Request, session, cursor: Optional[str]) -> dict:
     stmt = (
         select(Adopcion, Mascota.nombre, Refugio.nombre)
         .join(Mascota, Adopcion.mascota_id == Mascota.id)
         .join(Refugio, Adopcion.refugio_id == Refugio.id)
-        .order_by(Adopcion.fecha_adopcion.desc())
-        .limit(50)
+        .order_by(Adopcion.fecha_adopcion.desc(), Adopcion.id.desc())
+        .limit(WEB_TABLE_PAGE_SIZE)
     )
+    if cursor is not None:
+        fecha, last_id = decode_fecha_id_cursor(cursor, "web-adopciones")
+        stmt = stmt.where(tuple_(Adopcion.fecha_adopcion, Adopcion.id) < (fecha, last_id))
     result = await session.execute(stmt)
     rows = result.all()
 
@@ -182,44 +358,116 @@ async def adopciones_web(request: Request, session: SessionDep):
         }
         for ad, mascota_nombre, refugio_nombre in rows
     ]
-
-    context = {
+    return {
         "request": request,
         "adopciones": adopciones,
-        "active_page": "adopciones",
-        "ok": request.query_params.get("ok"),
-        "error": request.query_params.get("error"),
+        **web_next_page(
+            request, adopciones, WEB_TABLE_PAGE_SIZE, "web-adopciones",
+            lambda a: (a["fecha_adopcion"], a["id"]), "/web/adopciones", "/web/adopciones/fragmento",
+        ),
     }
-    return templates.TemplateResponse("adopciones.html", context)
 
 
-@app.get("/web/dashboards", response_class=HTMLResponse, tags=["web"])
-async def dashboards_web(request: Request, session: SessionDep):
-    # A) Mascotas por refugio
+@app.get("/web/adopciones", response_class=HTMLResponse, tags=["web"])
+@condicional("adopcion", "mascota", "refugio")
+@cached("adopcion", "mascota", "refugio")
+async def adopciones_web(request: Request, session: ReadSessionDep, cursor: Optional[str] = None):
+    """
+    Vista web: listado de adopciones, paginado de la más reciente a la más antigua.
+    """
+    context = await _pagina_adopciones(request, session, cursor)
+    context.update(
+        {
+            "active_page": "adopciones",
+            "ok": request.query_params.get("ok"),
+            "error": request.query_params.get("error"),
+        }
+    )
+    return render(request, "adopciones.html", context)
+
+
+@app.get("/web/adopciones/fragmento", response_class=HTMLResponse, tags=["web"])
+@condicional("adopcion", "mascota", "refugio")
+@cached("adopcion", "mascota", "refugio")
+async def adopciones_fragmento_web(request: Request, session: ReadSessionDep, cursor: str):
+    """
+    Fragmento HTML con las filas de la página siguiente de adopciones.
+    """
+    context = await _pagina_adopciones(request, session, cursor)
+    return render(request, "_adopcion_filas.html", context)
+
+
+# -----------------------------
+# Type-ahead de los formularios web
+# -----------------------------
+AUTOCOMPLETAR_LIMITE = 10
+
+
+async def _autocompletar(session, buscador, q: str, condicion) -> list[dict]:
+    stmt = select(buscador.model)
+    if condicion is not None:
+        stmt = stmt.where(condicion)
+    encontrados = await buscador.buscar(session, stmt, q, 0, AUTOCOMPLETAR_LIMITE)
+    # Un número también busca por ID
+    if q.strip().isdigit():
+        exacto = (await session.execute(stmt.where(buscador.model.id == int(q)))).scalars().first()
+        if exacto is not None:
+            encontrados = [exacto, *(o for o in encontrados if o.id != exacto.id)]
+    return [{"id": o.id, "label": f"{o.nombre} (ID {o.id})"} for o in encontrados[:AUTOCOMPLETAR_LIMITE]]
+
+
+@app.get("/web/autocompletar/mascotas", tags=["web"])
+async def autocompletar_mascotas(
+    session: ReadSessionDep,
+    q: str = Query(..., min_length=1, max_length=100),
+    solo_activas: bool = Query(False, description="Si True, solo mascotas disponibles"),
+):
+    """
+    Sugerencias para el type-ahead de mascotas: `[{"id", "label"}]`.
+    """
+    return await _autocompletar(
+        session, mascota.buscador, q, Mascota.estado == True if solo_activas else None
+    )
+
+
+@app.get("/web/autocompletar/refugios", tags=["web"])
+async def autocompletar_refugios(
+    session: ReadSessionDep,
+    q: str = Query(..., min_length=1, max_length=100),
+    solo_activos: bool = Query(False, description="Si True, solo refugios activos"),
+):
+    """
+    Sugerencias para el type-ahead de refugios: `[{"id", "label"}]`.
+    """
+    return await _autocompletar(
+        session, refugio.buscador, q, Refugio.activo == True if solo_activos else None
+    )
+
+
+async def _datos_dashboards(session) -> dict:
+    # A) Mascotas por refugio (desde la tabla de resumen mascota_conteo)
     q_ref = (
-        select(Refugio.nombre, func.count(Mascota.id))
-        .join(Mascota, Mascota.refugio_id == Refugio.id, isouter=True)
-        .group_by(Refugio.nombre)
-        .order_by(Refugio.nombre)
+        select(Refugio.id, Refugio.nombre, func.coalesce(func.sum(MascotaConteo.total), 0))
+        .join(MascotaConteo, MascotaConteo.refugio_id == Refugio.id, isouter=True)
+        .group_by(Refugio.id, Refugio.nombre)
+        .order_by(Refugio.nombre, Refugio.id)
     )
     res_ref = await session.execute(q_ref)
+    # refugio_id: clave de los deltas que llegan por /web/dashboards/eventos
     data_mascotas_por_refugio = [
-        {"refugio": r[0] or "Sin nombre", "total": int(r[1] or 0)}
+        {"refugio_id": r[0], "refugio": r[1] or "Sin nombre", "total": int(r[2] or 0)}
         for r in res_ref.all()
     ]
 
-    # B) Adopciones por mes (ultimos 5 anos)
+    # B) Adopciones por mes (ultimos 5 anos, hasta el mes actual incluido), desde adopcion_mensual
     now = datetime.datetime.utcnow()
-    start = (now.replace(day=1) - datetime.timedelta(days=365 * 5)).replace(day=1)
+    primero = now.year * 12 + now.month - 1 - 59
+    start = datetime.date(primero // 12, primero % 12 + 1, 1)
     q_adop = (
-        select(
-            extract("year", Adopcion.fecha_adopcion).label("y"),
-            extract("month", Adopcion.fecha_adopcion).label("m"),
-            func.count(Adopcion.id),
-        )
-        .where(Adopcion.fecha_adopcion >= start.date())
-        .group_by("y", "m")
-        .order_by("y", "m")
+        select(AdopcionMensual.mes, func.sum(AdopcionMensual.total))
+        .where(AdopcionMensual.mes >= start)
+        .group_by(AdopcionMensual.mes)
+        .order_by(AdopcionMensual.mes)
     )
     res_adop = await session.execute(q_adop)
     raw = res_adop.all()
@@ -236,22 +484,50 @@ async def dashboards_web(request: Request, session: SessionDep):
         else:
             current = current.replace(month=current.month + 1)
 
-    totals_map = {f"{int(y):04d}-{int(m):02d}": int(c or 0) for y, m, c in raw}
+    totals_map = {f"{mes.year:04d}-{mes.month:02d}": int(c or 0) for mes, c in raw}
     data_adopciones_por_mes = [
         {"label": label, "total": totals_map.get(label, 0)} for label in months
     ]
 
-    context = {
-        "request": request,
+    return {
         "data_mascotas_por_refugio": data_mascotas_por_refugio,
         "data_adopciones_por_mes": data_adopciones_por_mes,
+    }
+
+
+@app.get("/web/dashboards", response_class=HTMLResponse, tags=["web"])
+@condicional("mascota", "adopcion", "refugio")
+@cached("mascota", "adopcion", "refugio")
+async def dashboards_web(request: Request, session: ReadSessionDep):
+    context = {
+        "request": request,
+        **await _datos_dashboards(session),
         "active_page": "dashboards",
     }
-    return templates.TemplateResponse("dashboards.html", context)
+    return render(request, "dashboards.html", context)
+
+
+@app.get("/web/dashboards/datos", tags=["web"])
+@condicional("mascota", "adopcion", "refugio")
+@cached("mascota", "adopcion", "refugio")
+async def dashboards_datos(request: Request, session: ReadSessionDep):
+    """
+    Datos de los gráficos de /web/dashboards (al conectar o al resincronizar la pantalla).
+    """
+    return await _datos_dashboards(session)
+
+
+@app.get("/web/dashboards/eventos", tags=["web"])
+async def dashboards_eventos():
+    """
+    Server-Sent Events con los cambios de los gráficos (`delta`) a medida que se confirman
+    las escrituras; `resync` pide volver a leer /web/dashboards/datos.
+    """
+    return envivo.respuesta_eventos()
 
 
 @app.post("/web/adopciones/crear", tags=["web"])
-async def crear_adopcion_web(request: Request, session: SessionDep):
+async def crear_adopcion_web(request: Request, session: SessionDep, loader: LoaderDep):
     form = await request.form()
     try:
         mascota_id = int(form.get("mascota_id", ""))
@@ -266,7 +542,7 @@ async def crear_adopcion_web(request: Request, session: SessionDep):
             adoptante=adoptante,
             fecha_adopcion=fecha_adopcion,
         )
-        await adopcion.create_adopcion(payload, session)
+        await adopcion.create_adopcion(payload, session, loader)
         target = request.url_for("adopciones_web")
         return RedirectResponse(f"{target}?ok=1", status_code=303)
     except HTTPException as exc:
@@ -275,7 +551,7 @@ async def crear_adopcion_web(request: Request, session: SessionDep):
 
 
 @app.post("/web/historial/registrar", tags=["web"])
-async def registrar_historial_web(request: Request, session: SessionDep):
+async def registrar_historial_web(request: Request, session: SessionDep, loader: LoaderDep):
     form = await request.form()
     try:
         mascota_id = int(form.get("mascota_id", ""))
@@ -290,7 +566,7 @@ async def registrar_historial_web(request: Request, session: SessionDep):
             costo=costo,
             fecha=fecha,
         )
-        await historial.create_historial(payload, session)
+        await historial.create_historial(payload, session, loader)
         target = request.url_for("historial_web")
         return RedirectResponse(f"{target}?ok=1", status_code=303)
     except HTTPException as exc:
@@ -299,7 +575,11 @@ async def registrar_historial_web(request: Request, session: SessionDep):
 
 
 @app.get("/web/historial/mascota/{mascota_id}", response_class=HTMLResponse, tags=["web"])
-async def historial_por_mascota_web(request: Request, mascota_id: int, session: SessionDep):
+@condicional("historial", "mascota", "refugio")
+@cached("historial", "mascota", "refugio")
+async def historial_por_mascota_web(
+    request: Request, mascota_id: int, session: ReadSessionDep, archivo: bool = False
+):
     stmt = (
         select(HistorialCuidado, Mascota.nombre, Refugio.nombre)
         .join(Mascota, HistorialCuidado.mascota_id == Mascota.id)
@@ -322,20 +602,38 @@ async def historial_por_mascota_web(request: Request, mascota_id: int, session:
         for hc, mascota_nombre, refugio_nombre in rows
     ]
 
-    costo_total = await session.execute(
-        select(HistorialCuidado).where(HistorialCuidado.mascota_id == mascota_id)
-    )
-    eventos_raw = costo_total.scalars().all()
-    total = sum(e.costo for e in eventos_raw)
+    hay_archivo = await particiones.hay_archivo(session)
+    if archivo and hay_archivo:
+        archivados = await particiones.leer_archivados(session, mascota_id)
+        if archivados:
+            nombres = (
+                await session.execute(
+                    select(Mascota.nombre, Refugio.nombre)
+                    .join(Refugio, Mascota.refugio_id == Refugio.id)
+                    .where(Mascota.id == mascota_id)
+                )
+            ).first()
+            mascota_nombre, refugio_nombre = nombres or (None, None)
+            eventos += [
+                {**fila._asdict(), "mascota": mascota_nombre, "refugio": refugio_nombre}
+                for fila in archivados
+            ]
+            # Puede haber eventos con fecha atrasada en la base: mismo orden que la API
+            eventos.sort(key=lambda e: (e["fecha"], e["id"]), reverse=True)
+
+    resumen = await session.get(HistorialResumen, mascota_id)
+    total = resumen.costo_total if resumen else 0
 
     context = {
         "request": request,
         "eventos": eventos,
         "total": total,
         "mascota_id": mascota_id,
+        "hay_archivo": hay_archivo,
+        "archivo": archivo,
         "active_page": "historial",
     }
-    return templates.TemplateResponse("historial_detalle.html", context)
+    return render(request, "historial_detalle.html", context)
 
 
 # Manejador de errores (HTML) sencillo
@@ -345,6 +643,7 @@ from fastapi import HTTPException
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     return templates.TemplateResponse(
+        request,
         "error.html",
         {
             "request": request,
@@ -353,3 +652,6 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         },
         status_code=exc.status_code,
     )
+
+
+arranque.marcar("app: rutas, middlewares y plantillas")
@@ -1,13 +1,25 @@
 # mascota.py
 import datetime
+from collections import Counter
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, Response, UploadFile, File
+from sqlalchemy import insert
 from sqlmodel import select
 
-from db import SessionDep
+from bulk import BulkReport, lotes_validados
+from busqueda import Buscador
+from cache import invalidate
+from db import ReadSessionDep, SessionDep
+from etag import condicional, registrar_cambio
+from export import export_response
+from fastjson import responder, seleccionar
+from loader import LoaderDep, ReadLoaderDep, multi_get
 from models import Mascota, MascotaCreate, MascotaUpdate, Refugio, Kind
-from supa.supabase import upload_to_bucket
+from pagination import check_paging, decode_id_cursor, set_next_cursor
+from rollups import clave_mascota, mover_mascota, registrar_mascota
+from supa.supabase import UploadRejected, store_upload
+from thumbnails import generar_variantes_mascota
 
 
 router = APIRouter(prefix="/mascotas", tags=["mascotas"])
@@ -22,18 +34,71 @@ router = APIRouter(prefix="/mascotas", tags=["mascotas"])
     status_code=201,
     summary="Crear una mascota (JSON)",
 )
-async def create_mascota(new_mascota: MascotaCreate, session: SessionDep):
-    refugio = await session.get(Refugio, new_mascota.refugio_id)
-    if not refugio:
+async def create_mascota(new_mascota: MascotaCreate, session: SessionDep, loader: LoaderDep):
+    (refugios,) = await loader.existentes((Refugio.id, [new_mascota.refugio_id]))
+    if not refugios:
         raise HTTPException(status_code=404, detail="Refugio no encontrado")
 
     mascota = Mascota.model_validate(new_mascota)
     session.add(mascota)
+    await registrar_mascota(session, *clave_mascota(mascota))
+    await registrar_cambio(session, "mascota")
     await session.commit()
+    invalidate("mascota")
     await session.refresh(mascota)
     return mascota
 
 
+# -----------------------------
+# Carga masiva (NDJSON / CSV)
+# -----------------------------
+@router.post(
+    "/bulk",
+    summary="Carga masiva de mascotas (NDJSON o CSV en streaming)",
+)
+async def bulk_mascotas(request: Request, session: SessionDep, loader: LoaderDep):
+    report = BulkReport()
+
+    async for lote in lotes_validados(request, MascotaCreate, report):
+        # Un solo SELECT por lote para validar los refugios
+        (existentes,) = await loader.existentes((Refugio.id, {m.refugio_id for _, m in lote}))
+
+        filas = []
+        conteos: Counter = Counter()
+        for fila, m in lote:
+            if m.refugio_id not in existentes:
+                report.error(fila, "Refugio no encontrado")
+                continue
+            filas.append(m.model_dump())
+            conteos[(m.refugio_id, m.especie, m.estado)] += 1
+
+        if not filas:
+            continue
+        await session.exec(insert(Mascota), params=filas)
+        for clave, total in conteos.items():
+            await registrar_mascota(session, *clave, delta=total)
+        await registrar_cambio(session, "mascota")
+        await session.commit()
+        report.insertadas += len(filas)
+
+    if report.insertadas:
+        invalidate("mascota")
+    return report.as_dict()
+
+
+def _filtrar(stmt, refugio_id, especie, solo_activas, solo_con_foto):
+    """Filtros comunes al listado y a la exportación."""
+    if refugio_id is not None:
+        stmt = stmt.where(Mascota.refugio_id == refugio_id)
+    if especie is not None:
+        stmt = stmt.where(Mascota.especie == especie)
+    if solo_activas:
+        stmt = stmt.where(Mascota.estado == True)
+    if solo_con_foto:
+        stmt = stmt.where(Mascota.foto_url.is_not(None))
+    return stmt
+
+
 # -----------------------------
 # Listar mascotas con filtros
 # -----------------------------
@@ -42,29 +107,84 @@ async def create_mascota(new_mascota: MascotaCreate, session: SessionDep):
     response_model=List[Mascota],
     summary="Listar mascotas",
 )
+@condicional("mascota")
 async def list_mascotas(
-    session: SessionDep,
+    request: Request,
+    session: ReadSessionDep,
+    loader: ReadLoaderDep,
+    response: Response,
+    ids: str | None = Query(
+        None, description="IDs separados por coma (máx. 100); ignora filtros y paginación"
+    ),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: str | None = Query(None, description="Cursor devuelto en X-Next-Cursor"),
     refugio_id: int | None = Query(None, description="Filtrar por refugio"),
     especie: Kind | None = Query(None, description="Filtrar por especie"),
     solo_activas: bool = Query(True, description="Si True, solo mascotas activas"),
     solo_con_foto: bool = Query(False, description="Si True, solo mascotas con foto"),
 ):
-    stmt = select(Mascota)
+    if ids is not None:
+        return await multi_get(loader, Mascota, ids, response)
 
-    if refugio_id is not None:
-        stmt = stmt.where(Mascota.refugio_id == refugio_id)
-    if especie is not None:
-        stmt = stmt.where(Mascota.especie == especie)
-    if solo_activas:
-        stmt = stmt.where(Mascota.estado == True)
-    if solo_con_foto:
-        stmt = stmt.where(Mascota.foto_url.is_not(None))
+    check_paging(skip, cursor)
+    stmt = seleccionar(Mascota).order_by(Mascota.id)
 
+    if cursor is not None:
+        stmt = stmt.where(Mascota.id > decode_id_cursor(cursor, "mascotas"))
+    stmt = _filtrar(stmt, refugio_id, especie, solo_activas, solo_con_foto)
     stmt = stmt.offset(skip).limit(limit)
     result = await session.exec(stmt)
-    return result.all()
+    mascotas = result.all()
+    set_next_cursor(response, mascotas, limit, "mascotas", lambda m: (m.id,))
+    return responder(mascotas, response)
+
+
+# -----------------------------
+# Buscar mascotas por nombre o raza
+# -----------------------------
+buscador = Buscador(Mascota, "mascota", "mascota_busqueda", ("nombre", "raza"))
+
+
+@router.get(
+    "/buscar",
+    response_model=List[Mascota],
+    summary="Buscar mascotas por nombre o raza (sin acentos, por prefijo y aproximada)",
+)
+@condicional("mascota")
+async def buscar_mascotas(
+    request: Request,
+    session: ReadSessionDep,
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=100, description="Texto a buscar"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    refugio_id: int | None = Query(None, description="Filtrar por refugio"),
+    especie: Kind | None = Query(None, description="Filtrar por especie"),
+    solo_activas: bool = Query(True, description="Si True, solo mascotas activas"),
+    solo_con_foto: bool = Query(False, description="Si True, solo mascotas con foto"),
+):
+    stmt = _filtrar(select(Mascota), refugio_id, especie, solo_activas, solo_con_foto)
+    return await buscador.buscar(session, stmt, q, skip, limit)
+
+
+# -----------------------------
+# Exportar mascotas (streaming)
+# -----------------------------
+@router.get(
+    "/export",
+    summary="Exportar mascotas (CSV o NDJSON en streaming)",
+)
+async def export_mascotas(
+    formato: str = Query("csv", description="csv o ndjson"),
+    refugio_id: int | None = Query(None, description="Filtrar por refugio"),
+    especie: Kind | None = Query(None, description="Filtrar por especie"),
+    solo_activas: bool = Query(True, description="Si True, solo mascotas activas"),
+    solo_con_foto: bool = Query(False, description="Si True, solo mascotas con foto"),
+):
+    stmt = select(*Mascota.__table__.columns).order_by(Mascota.id)
+    stmt = _filtrar(stmt, refugio_id, especie, solo_activas, solo_con_foto)
+    return export_response(stmt, formato, "mascotas")
 
 
 # -----------------------------
@@ -75,7 +195,7 @@ async def list_mascotas(
     response_model=Mascota,
     summary="Obtener una mascota por ID",
 )
-async def get_mascota(mascota_id: int, session: SessionDep):
+async def get_mascota(mascota_id: int, session: ReadSessionDep):
     mascota = await session.get(Mascota, mascota_id)
     if not mascota:
         raise HTTPException(status_code=404, detail="Mascota no encontrada")
@@ -94,21 +214,35 @@ async def update_mascota(
     mascota_id: int,
     mascota_update: MascotaUpdate,
     session: SessionDep,
+    loader: LoaderDep,
 ):
-    mascota_db = await session.get(Mascota, mascota_id)
+    # FOR UPDATE: la clave de resumen (refugio, especie, estado) de la que se
+    # resta no puede cambiar hasta el commit (p. ej. por una adopción en curso)
+    mascota_db = await session.get(
+        Mascota, mascota_id, with_for_update=True, populate_existing=True
+    )
     if not mascota_db:
         raise HTTPException(status_code=404, detail="Mascota no encontrada")
 
     data = mascota_update.model_dump(exclude_unset=True)
+    nuevo_refugio = data.get("refugio_id")
+    if nuevo_refugio is not None and nuevo_refugio != mascota_db.refugio_id:
+        (refugios,) = await loader.existentes((Refugio.id, [nuevo_refugio]))
+        if not refugios:
+            raise HTTPException(status_code=404, detail="Refugio no encontrado")
     if data:
         # no tenemos campo updated_at en modelo, pero aquí podrías añadirlo si lo creas
         pass
 
+    antes = clave_mascota(mascota_db)
     for key, value in data.items():
         setattr(mascota_db, key, value)
 
     session.add(mascota_db)
+    await mover_mascota(session, antes, clave_mascota(mascota_db))
+    await registrar_cambio(session, "mascota")
     await session.commit()
+    invalidate("mascota")
     await session.refresh(mascota_db)
     return mascota_db
 
@@ -122,13 +256,18 @@ async def update_mascota(
     summary="Inactivar mascota (soft delete)",
 )
 async def delete_mascota(mascota_id: int, session: SessionDep):
-    mascota = await session.get(Mascota, mascota_id)
+    # FOR UPDATE: ver update_mascota; si una adopción ya la inactivó, no hay nada que mover
+    mascota = await session.get(Mascota, mascota_id, with_for_update=True, populate_existing=True)
     if not mascota:
         raise HTTPException(status_code=404, detail="Mascota no encontrada")
 
+    antes = clave_mascota(mascota)
     mascota.estado = False
     session.add(mascota)
+    await mover_mascota(session, antes, clave_mascota(mascota))
+    await registrar_cambio(session, "mascota")
     await session.commit()
+    invalidate("mascota")
     await session.refresh(mascota)
     return mascota
 
@@ -142,6 +281,7 @@ async def delete_mascota(mascota_id: int, session: SessionDep):
 )
 async def upload_mascota_image(
     mascota_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     session: SessionDep = None,
 ):
@@ -151,18 +291,25 @@ async def upload_mascota_image(
 
     # Subir archivo a Supabase
     try:
-        foto_url = await upload_to_bucket(file)
+        stored = await store_upload(file, keep_local=True)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error subiendo imagen: {e}")
 
-    # Guardar URL en la BD
-    mascota.foto_url = foto_url
+    # Guardar URL en la BD; las variantes se regeneran en segundo plano
+    mascota.foto_url = stored.url
+    mascota.foto_thumb_url = None
+    mascota.foto_web_url = None
     session.add(mascota)
+    await registrar_cambio(session, "mascota")
     await session.commit()
+    invalidate("mascota")
     await session.refresh(mascota)
+    background_tasks.add_task(generar_variantes_mascota, mascota_id, stored)
 
     return {
         "mensaje": "Imagen de mascota subida/actualizada correctamente",
         "mascota_id": mascota_id,
-        "foto_url": foto_url,
+        "foto_url": stored.url,
     }
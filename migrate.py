@@ -0,0 +1,238 @@
+# migrate.py
+"""
+Runner de migraciones SQL versionadas.
+
+Cada archivo `migrations/NNN_descripcion.sql` es una versión. Las versiones
+aplicadas se registran en la tabla `schema_migrations`, así que cada archivo
+se ejecuta una sola vez. Se ejecuta al arrancar la app (ver `main.lifespan`)
+o desde la línea de comandos:
+
+    python migrate.py            # aplica las migraciones pendientes
+    python migrate.py --status   # muestra aplicadas / pendientes
+
+Para no ejecutar DDL en cada arranque, después de `create_all` y de las
+migraciones se guarda en `schema_fingerprint` una huella (SHA-256) del DDL
+de los modelos y de los checksums de las migraciones. Si al arrancar la
+huella calculada coincide con la guardada, no hay nada que crear ni migrar.
+Si no coincide, los workers que arrancan a la vez pasan de a uno por
+`bloqueo_esquema()` y vuelven a comparar: solo el primero ejecuta el DDL.
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlmodel import SQLModel
+
+import models  # noqa: F401  (registra las tablas en SQLModel.metadata)
+from db import DB_AUTO_MIGRATE, create_tables, engine
+
+logger = logging.getLogger("migrate")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+
+# Clave arbitraria para el advisory lock (evita que dos workers migren a la vez)
+_LOCK_KEY = 7_402_118
+# Otra clave para todo el arranque (huella -> create_all -> migraciones -> huella):
+# run_migrations toma _LOCK_KEY desde otras conexiones mientras esta se mantiene
+_LOCK_KEY_ESQUEMA = 7_402_117
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version     VARCHAR(255) PRIMARY KEY,
+    checksum    VARCHAR(64) NOT NULL,
+    applied_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+_CREATE_FINGERPRINT_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_fingerprint (
+    name        VARCHAR(64) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    updated_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+_FINGERPRINT_NAME = "app"
+
+
+def discover() -> list[tuple[str, Path]]:
+    """Lista (versión, ruta) de los .sql del directorio, en orden."""
+    files = sorted(MIGRATIONS_DIR.glob("*.sql"))
+    return [(path.stem, path) for path in files]
+
+
+def split_statements(sql: str) -> list[str]:
+    """
+    Separa un script en sentencias por ';'. Respeta bloques $$ ... $$
+    (funciones, DO) y comentarios de línea.
+    """
+    statements: list[str] = []
+    current: list[str] = []
+    in_dollar = False
+
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not in_dollar and (not stripped or stripped.startswith("--")):
+            continue
+        if line.count("$$") % 2 == 1:
+            in_dollar = not in_dollar
+        current.append(line)
+        if not in_dollar and stripped.endswith(";"):
+            statements.append("\n".join(current).rstrip().rstrip(";"))
+            current = []
+
+    if "".join(current).strip():
+        statements.append("\n".join(current))
+    return statements
+
+
+def _checksum(sql: str) -> str:
+    return hashlib.sha256(sql.encode()).hexdigest()
+
+
+async def _applied(conn: AsyncConnection) -> dict[str, str]:
+    await conn.execute(text(_CREATE_TABLE))
+    result = await conn.execute(text("SELECT version, checksum FROM schema_migrations"))
+    return {version: checksum for version, checksum in result.all()}
+
+
+async def run_migrations() -> list[str]:
+    """
+    Aplica, cada una en su propia transacción, las migraciones pendientes.
+    Devuelve las versiones aplicadas en esta ejecución.
+    """
+    applied_now: list[str] = []
+
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+        applied = await _applied(conn)
+
+    for version, path in discover():
+        sql = path.read_text(encoding="utf-8")
+        checksum = _checksum(sql)
+
+        if version in applied:
+            if applied[version] != checksum:
+                logger.warning("La migración %s cambió después de aplicarse", version)
+            continue
+
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+            # Otro worker pudo aplicarla mientras esperábamos el lock
+            done = await conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": version}
+            )
+            if done.first():
+                continue
+
+            for statement in split_statements(sql):
+                await conn.exec_driver_sql(statement)
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, checksum) VALUES (:v, :c)"),
+                {"v": version, "c": checksum},
+            )
+
+        logger.info("Migración aplicada: %s", version)
+        applied_now.append(version)
+
+    return applied_now
+
+
+def schema_fingerprint(include_migrations: bool = True) -> str:
+    """
+    Huella del esquema esperado: DDL de las tablas e índices de los modelos
+    (compilado para el dialecto del engine) y, si se aplican migraciones al
+    arrancar, versión y checksum de cada archivo de `migrations/`.
+    """
+    digest = hashlib.sha256()
+    for table in SQLModel.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode())
+    if include_migrations:
+        for version, path in discover():
+            digest.update(f"{version}:{_checksum(path.read_text(encoding='utf-8'))}".encode())
+    return digest.hexdigest()
+
+
+async def stored_fingerprint() -> str | None:
+    """Huella guardada, o None si todavía no hay (tabla inexistente incluida)."""
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT fingerprint FROM schema_fingerprint WHERE name = :n"),
+                {"n": _FINGERPRINT_NAME},
+            )
+            return result.scalar_one_or_none()
+    except SQLAlchemyError:
+        return None
+
+
+async def store_fingerprint(fingerprint: str) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text(_CREATE_FINGERPRINT_TABLE))
+        await conn.execute(
+            text(
+                "INSERT INTO schema_fingerprint (name, fingerprint) VALUES (:n, :f) "
+                "ON CONFLICT (name) DO UPDATE "
+                "SET fingerprint = excluded.fingerprint, updated_at = CURRENT_TIMESTAMP"
+            ),
+            {"n": _FINGERPRINT_NAME, "f": fingerprint},
+        )
+
+
+@asynccontextmanager
+async def bloqueo_esquema():
+    """
+    Serializa entre workers la comparación de la huella, create_all, las
+    migraciones y el guardado de la huella (advisory lock, solo PostgreSQL).
+    """
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY_ESQUEMA})
+        yield
+
+
+async def migration_status() -> list[dict]:
+    async with engine.begin() as conn:
+        applied = await _applied(conn)
+    return [
+        {"version": version, "aplicada": version in applied}
+        for version, _ in discover()
+    ]
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Migraciones de la base de datos")
+    parser.add_argument("--status", action="store_true", help="Solo mostrar el estado")
+    args = parser.parse_args()
+
+    try:
+        if args.status:
+            for row in await migration_status():
+                marca = "x" if row["aplicada"] else " "
+                print(f"[{marca}] {row['version']}")
+        else:
+            async with bloqueo_esquema():
+                # Las tablas nuevas de models.py deben existir antes de migrar datos
+                await create_tables()
+                aplicadas = await run_migrations()
+                # La misma variante que calcula la app al arrancar (ver main.lifespan)
+                await store_fingerprint(schema_fingerprint(include_migrations=DB_AUTO_MIGRATE))
+            print("Sin migraciones pendientes" if not aplicadas else "\n".join(aplicadas))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
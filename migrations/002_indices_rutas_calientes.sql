@@ -0,0 +1,21 @@
+-- Índices para los filtros y listados más usados
+-- (create_all no crea índices sobre claves foráneas ni columnas de filtro)
+
+-- /mascotas?refugio_id=&solo_activas=, /refugios/{id}/mascotas, dashboards
+CREATE INDEX IF NOT EXISTS ix_mascota_refugio_estado ON mascota (refugio_id, estado);
+
+-- /mascotas?especie=
+CREATE INDEX IF NOT EXISTS ix_mascota_especie ON mascota (especie);
+
+-- /adopciones?anio= y paginación por cursor (fecha_adopcion, id)
+CREATE INDEX IF NOT EXISTS ix_adopcion_fecha ON adopcion (fecha_adopcion, id);
+
+-- /adopciones?refugio_id=
+CREATE INDEX IF NOT EXISTS ix_adopcion_refugio ON adopcion (refugio_id);
+
+-- /historial/mascota/{id} ordenado por fecha desc (y cursor fecha, id)
+CREATE INDEX IF NOT EXISTS ix_historialcuidado_mascota_fecha
+    ON historialcuidado (mascota_id, fecha DESC, id DESC);
+
+-- Una mascota solo puede adoptarse una vez
+CREATE UNIQUE INDEX IF NOT EXISTS ux_adopcion_mascota ON adopcion (mascota_id);
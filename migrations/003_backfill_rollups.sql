@@ -0,0 +1,19 @@
+-- Backfill de las tablas de resumen de los dashboards
+-- (las tablas las crea create_all a partir de models.py; ver rollups.py)
+
+DELETE FROM mascota_conteo;
+
+INSERT INTO mascota_conteo (refugio_id, especie, estado, total)
+SELECT refugio_id, especie, estado, COUNT(*)
+FROM mascota
+GROUP BY refugio_id, especie, estado;
+
+DELETE FROM adopcion_mensual;
+
+INSERT INTO adopcion_mensual (refugio_id, mes, total)
+SELECT refugio_id, date_trunc('month', fecha_adopcion)::date, COUNT(*)
+FROM adopcion
+GROUP BY refugio_id, date_trunc('month', fecha_adopcion)::date;
+
+-- El dashboard filtra por rango de meses de todos los refugios
+CREATE INDEX IF NOT EXISTS ix_adopcion_mensual_mes ON adopcion_mensual (mes);
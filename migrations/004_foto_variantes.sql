@@ -0,0 +1,5 @@
+-- URLs de las variantes (miniatura / web) generadas a partir de foto_url
+ALTER TABLE refugio ADD COLUMN IF NOT EXISTS foto_thumb_url TEXT;
+ALTER TABLE refugio ADD COLUMN IF NOT EXISTS foto_web_url TEXT;
+ALTER TABLE mascota ADD COLUMN IF NOT EXISTS foto_thumb_url TEXT;
+ALTER TABLE mascota ADD COLUMN IF NOT EXISTS foto_web_url TEXT;
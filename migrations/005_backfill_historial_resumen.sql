@@ -0,0 +1,16 @@
+-- Backfill del resumen de cuidados por mascota
+-- (las tablas las crea create_all a partir de models.py; ver rollups.py)
+
+DELETE FROM historial_resumen;
+
+INSERT INTO historial_resumen (mascota_id, total_eventos, costo_total, ultima_fecha)
+SELECT mascota_id, COUNT(*), SUM(costo), MAX(fecha)
+FROM historialcuidado
+GROUP BY mascota_id;
+
+DELETE FROM historial_tipo_conteo;
+
+INSERT INTO historial_tipo_conteo (mascota_id, tipo_evento, total)
+SELECT mascota_id, tipo_evento, COUNT(*)
+FROM historialcuidado
+GROUP BY mascota_id, tipo_evento;
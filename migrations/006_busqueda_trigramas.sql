@@ -0,0 +1,26 @@
+-- Búsqueda por texto de /mascotas/buscar y /refugios/buscar (ver busqueda.py)
+-- Índices GIN de trigramas sobre el texto normalizado (minúsculas, sin acentos)
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() no es IMMUTABLE (depende del diccionario por defecto), así que no
+-- se puede usar directamente en un índice
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+$$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$;
+
+-- Las consultas llaman a estas mismas funciones para que el planner use el índice
+CREATE OR REPLACE FUNCTION mascota_busqueda(nombre text, raza text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS
+$$ SELECT f_unaccent(lower(coalesce(nombre, '') || ' ' || coalesce(raza, ''))) $$;
+
+CREATE OR REPLACE FUNCTION refugio_busqueda(nombre text, ubicacion text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS
+$$ SELECT f_unaccent(lower(coalesce(nombre, '') || ' ' || coalesce(ubicacion, ''))) $$;
+
+CREATE INDEX IF NOT EXISTS ix_mascota_busqueda_trgm
+    ON mascota USING gin (mascota_busqueda(nombre, raza) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_refugio_busqueda_trgm
+    ON refugio USING gin (refugio_busqueda(nombre, ubicacion) gin_trgm_ops);
@@ -48,6 +48,9 @@ class HistorialCuidadoBase(SQLModel):
 
 class Refugio(RefugioBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
+    # Variantes generadas en segundo plano a partir de foto_url (ver thumbnails.py)
+    foto_thumb_url: str | None = None
+    foto_web_url: str | None = None
 
     mascotas: list["Mascota"] = Relationship(back_populates="refugio")
     adopciones: list["Adopcion"] = Relationship(back_populates="refugio")
@@ -56,6 +59,9 @@ class Refugio(RefugioBase, table=True):
 class Mascota(MascotaBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     refugio_id: int = Field(foreign_key="refugio.id")
+    # Variantes generadas en segundo plano a partir de foto_url (ver thumbnails.py)
+    foto_thumb_url: str | None = None
+    foto_web_url: str | None = None
 
     refugio: Refugio = Relationship(back_populates="mascotas")
     historial: list["HistorialCuidado"] = Relationship(back_populates="mascota")
@@ -78,6 +84,91 @@ class HistorialCuidado(HistorialCuidadoBase, table=True):
     mascota: Mascota = Relationship(back_populates="historial")
 
 
+# ---------- TABLAS DE RESUMEN (ROLLUPS) ----------
+# Se mantienen en la misma transacción que las escrituras (ver rollups.py)
+
+class AdopcionMensual(SQLModel, table=True):
+    __tablename__ = "adopcion_mensual"
+
+    refugio_id: int = Field(foreign_key="refugio.id", primary_key=True)
+    mes: datetime.date = Field(primary_key=True, description="Primer día del mes")
+    total: int = 0
+
+
+class MascotaConteo(SQLModel, table=True):
+    __tablename__ = "mascota_conteo"
+
+    refugio_id: int = Field(foreign_key="refugio.id", primary_key=True)
+    especie: Kind = Field(primary_key=True)
+    estado: bool = Field(primary_key=True)
+    total: int = 0
+
+
+class HistorialResumen(SQLModel, table=True):
+    __tablename__ = "historial_resumen"
+
+    mascota_id: int = Field(foreign_key="mascota.id", primary_key=True)
+    total_eventos: int = 0
+    costo_total: float = 0.0
+    ultima_fecha: datetime.date | None = None
+
+
+class HistorialTipoConteo(SQLModel, table=True):
+    __tablename__ = "historial_tipo_conteo"
+
+    mascota_id: int = Field(foreign_key="mascota.id", primary_key=True)
+    tipo_evento: str = Field(primary_key=True)
+    total: int = 0
+
+
+# ---------- VERSIONES (GET CONDICIONAL) ----------
+# Una fila por entidad; sube con cada escritura (ver etag.py)
+
+class TablaVersion(SQLModel, table=True):
+    __tablename__ = "tabla_version"
+
+    tabla: str = Field(primary_key=True)
+    version: int = 0
+    modificado: datetime.datetime
+
+
+# ---------- JOURNAL DEL HISTORIAL (ESCRITURA DIFERIDA) ----------
+# Último evento de cada journal ya guardado; se actualiza en la misma
+# transacción que el INSERT del lote (ver cola_historial.py)
+
+class HistorialJournal(SQLModel, table=True):
+    __tablename__ = "historial_journal"
+
+    journal: str = Field(primary_key=True)
+    seq: int = 0
+
+
+# ---------- HISTORIAL ARCHIVADO ----------
+# Un archivo Parquet por mes (o rango) sacado de historialcuidado (ver particiones.py)
+
+class HistorialArchivo(SQLModel, table=True):
+    __tablename__ = "historial_archivo"
+
+    archivo: str = Field(primary_key=True, description="Nombre del archivo en HISTORIAL_ARCHIVO_DIR")
+    desde: datetime.date | None = Field(default=None, description="Primer día incluido (None: sin límite)")
+    hasta: datetime.date = Field(description="Primer día no incluido")
+    filas: int
+    creado: datetime.datetime
+
+
+# Eventos, costo y última fecha que se llevó cada archivo, por mascota y tipo:
+# rollups.py los suma a los de historialcuidado al verificar o reconstruir
+class HistorialArchivoConteo(SQLModel, table=True):
+    __tablename__ = "historial_archivo_conteo"
+
+    archivo: str = Field(foreign_key="historial_archivo.archivo", primary_key=True)
+    mascota_id: int = Field(foreign_key="mascota.id", primary_key=True)
+    tipo_evento: str = Field(primary_key=True)
+    total: int = 0
+    costo_total: float = 0.0
+    ultima_fecha: datetime.date
+
+
 # ---------- MODELOS DE ENTRADA / ACTUALIZACIÓN ----------
 
 class RefugioCreate(RefugioBase):
@@ -0,0 +1,95 @@
+# pagination.py
+import base64
+import datetime
+import json
+import os
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, Request, Response
+
+# Cabecera donde se devuelve el cursor de la siguiente página
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Tamaño de página de las vistas web: tarjetas (mascotas) y filas de tabla
+WEB_PAGE_SIZE = int(os.getenv("WEB_PAGE_SIZE", "24"))
+WEB_TABLE_PAGE_SIZE = int(os.getenv("WEB_TABLE_PAGE_SIZE", "50"))
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable en cursor: {type(value)!r}")
+
+
+def encode_cursor(kind: str, *values) -> str:
+    """
+    Codifica la clave de ordenación de la última fila en un token opaco.
+    `kind` identifica el listado, para no aceptar cursores de otro endpoint.
+    """
+    raw = json.dumps({"k": kind, "v": list(values)}, default=_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, kind: str, size: int) -> list:
+    """
+    Devuelve los valores de la clave guardados en el cursor.
+    Lanza 400 si el token está malformado o pertenece a otro listado.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = data["v"]
+        if data["k"] != kind or not isinstance(values, list) or len(values) != size:
+            raise ValueError
+        return values
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def decode_fecha_id_cursor(token: str, kind: str) -> tuple[datetime.date, int]:
+    fecha, row_id = decode_cursor(token, kind, 2)
+    try:
+        return datetime.date.fromisoformat(fecha), int(row_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def decode_id_cursor(token: str, kind: str) -> int:
+    (row_id,) = decode_cursor(token, kind, 1)
+    try:
+        return int(row_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def check_paging(skip: int, cursor: str | None) -> None:
+    if cursor is not None and skip:
+        raise HTTPException(status_code=400, detail="No se puede combinar 'skip' con 'cursor'")
+
+
+def set_next_cursor(response: Response, rows: list, limit: int, kind: str, key) -> str | None:
+    """
+    Si la página está completa, calcula el cursor a partir de la última fila
+    (`key(fila)` devuelve la tupla de ordenación) y lo deja en la cabecera.
+    """
+    if len(rows) < limit:
+        return None
+    token = encode_cursor(kind, *key(rows[-1]))
+    response.headers[NEXT_CURSOR_HEADER] = token
+    return token
+
+
+def web_next_page(
+    request: Request, rows: list, limit: int, kind: str, key, page_path: str, fragment_path: str
+) -> dict:
+    """
+    Enlaces a la página siguiente de una vista web: la página completa (sin
+    JavaScript) y el fragmento HTML para el scroll infinito. Conserva los
+    filtros de la query string. Vacío si no hay más filas.
+    """
+    if len(rows) < limit:
+        return {"siguiente_url": None, "fragmento_url": None}
+    params = {k: v for k, v in request.query_params.items() if k != "cursor"}
+    params["cursor"] = encode_cursor(kind, *key(rows[-1]))
+    query = urlencode(params)
+    return {"siguiente_url": f"{page_path}?{query}", "fragmento_url": f"{fragment_path}?{query}"}
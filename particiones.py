@@ -0,0 +1,582 @@
+# particiones.py
+"""
+Particionado por fecha y archivo en frío de `historialcuidado`.
+
+Particionado (solo PostgreSQL, opcional):
+
+    python particiones.py --convertir   # una vez: pasa la tabla a PARTITION BY RANGE (fecha)
+    python particiones.py               # crea las particiones de los próximos meses
+
+Cada mes es una partición (`historialcuidado_p2026_10`); `historialcuidado_antiguo`
+recibe las fechas anteriores a la primera y `historialcuidado_default` las que
+todavía no tienen partición. Con HISTORIAL_PARTICIONES=true la app crea al
+arrancar, y después una vez por día, las particiones de los próximos
+HISTORIAL_PARTICIONES_FUTURAS meses. Las consultas por mascota y fecha leen solo
+las particiones (y sus índices) del rango pedido.
+
+Archivo en frío (cualquier motor, requiere pyarrow):
+
+    python particiones.py --archivar    # pasa a Parquet los meses fuera de la retención
+    python particiones.py --estado      # particiones y archivos
+
+Los meses anteriores a HISTORIAL_RETENCION_MESES se escriben en
+HISTORIAL_ARCHIVO_DIR como Parquet (columnar, zstd, ordenado por mascota para
+que la lectura por mascota salte grupos de filas) y se sacan de la base: con
+particiones se desengancha y borra la partición entera, sin DELETE fila a fila
+(los eventos con fecha atrasada que cayeron en la partición por defecto se
+archivan por rango).
+Cada archivo queda en la tabla `historial_archivo` y sus totales por mascota y
+tipo en `historial_archivo_conteo`: los resúmenes (costo total, eventos por
+tipo) no cambian y `python rollups.py` los sigue contando al reconstruir.
+`GET /historial/mascota/{id}?archivo=true` sigue paginando hacia los eventos
+archivados cuando se acaban los de la base.
+"""
+import argparse
+import asyncio
+import datetime
+import importlib.util
+import logging
+import os
+import re
+import uuid
+from collections import namedtuple
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import db
+from cache import invalidate
+from etag import registrar_cambio
+from models import HistorialArchivo, HistorialArchivoConteo, HistorialCuidado
+
+logger = logging.getLogger("particiones")
+
+HISTORIAL_PARTICIONES = os.getenv("HISTORIAL_PARTICIONES", "false").strip().lower() in (
+    "1", "true", "yes", "si", "on"
+)
+HISTORIAL_PARTICIONES_FUTURAS = int(os.getenv("HISTORIAL_PARTICIONES_FUTURAS", "3"))
+HISTORIAL_RETENCION_MESES = int(os.getenv("HISTORIAL_RETENCION_MESES", "24"))
+HISTORIAL_ARCHIVO_DIR = os.getenv("HISTORIAL_ARCHIVO_DIR", "archivo")
+
+PYARROW_DISPONIBLE = importlib.util.find_spec("pyarrow") is not None
+
+TABLA = "historialcuidado"
+COLUMNAS = ("id", "mascota_id", "fecha", "tipo_evento", "costo")
+FilaArchivada = namedtuple("FilaArchivada", COLUMNAS)
+
+# Clave arbitraria para el advisory lock (distinta de la de migrate.py)
+_LOCK_KEY = 7_402_119
+# Filas por lote al exportar y por grupo de filas del Parquet
+_LOTE = 50_000
+
+_mantenimiento: asyncio.Task | None = None
+
+
+@dataclass
+class Particion:
+    nombre: str
+    desde: datetime.date | None  # None: MINVALUE
+    hasta: datetime.date | None  # None: partición por defecto
+    default: bool = False
+
+
+def _mes(fecha: datetime.date) -> datetime.date:
+    return fecha.replace(day=1)
+
+
+def _sumar_meses(fecha: datetime.date, n: int) -> datetime.date:
+    m = fecha.month - 1 + n
+    return datetime.date(fecha.year + m // 12, m % 12 + 1, 1)
+
+
+def nombre_particion(mes: datetime.date) -> str:
+    return f"{TABLA}_p{mes:%Y_%m}"
+
+
+# -----------------------------
+# Particionado (PostgreSQL)
+# -----------------------------
+
+_LIMITE = re.compile(r"FROM \((MINVALUE|'([\d-]+)')\) TO \('([\d-]+)'\)")
+
+
+async def esta_particionada(conn: AsyncConnection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :t AND pg_table_is_visible(c.oid)"
+        ),
+        {"t": TABLA},
+    )
+    return result.first() is not None
+
+
+async def listar_particiones(conn: AsyncConnection) -> list[Particion]:
+    result = await conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t AND pg_table_is_visible(p.oid) "
+            "ORDER BY c.relname"
+        ),
+        {"t": TABLA},
+    )
+    particiones = []
+    for nombre, limite in result.all():
+        if limite == "DEFAULT":
+            particiones.append(Particion(nombre, None, None, default=True))
+            continue
+        m = _LIMITE.search(limite)
+        if m is None:
+            logger.warning("Partición %s con límites inesperados: %s", nombre, limite)
+            continue
+        desde = datetime.date.fromisoformat(m.group(2)) if m.group(2) else None
+        particiones.append(Particion(nombre, desde, datetime.date.fromisoformat(m.group(3))))
+    return particiones
+
+
+async def _crear_particion(conn: AsyncConnection, desde: datetime.date, hay_default: bool) -> str:
+    """
+    Crea la partición del mes `desde`. Si la partición por defecto ya tiene
+    filas de ese mes, se mueven a la nueva (PostgreSQL no deja crearla si no).
+    """
+    hasta = _sumar_meses(desde, 1)
+    nombre = nombre_particion(desde)
+    # Fechas generadas aquí (no vienen del usuario): el DDL no acepta parámetros
+    rango = f"fecha >= '{desde.isoformat()}' AND fecha < '{hasta.isoformat()}'"
+    if hay_default:
+        await conn.execute(
+            text(f"CREATE TEMP TABLE _mover ON COMMIT DROP AS SELECT * FROM {TABLA}_default WHERE {rango}")
+        )
+        await conn.execute(text(f"DELETE FROM {TABLA}_default WHERE {rango}"))
+    await conn.execute(
+        text(
+            f"CREATE TABLE {nombre} PARTITION OF {TABLA} "
+            f"FOR VALUES FROM ('{desde.isoformat()}') TO ('{hasta.isoformat()}')"
+        )
+    )
+    if hay_default:
+        await conn.execute(text(f"INSERT INTO {TABLA} SELECT * FROM _mover"))
+        await conn.execute(text("DROP TABLE _mover"))
+    return nombre
+
+
+async def crear_futuras(meses: int = HISTORIAL_PARTICIONES_FUTURAS) -> list[str]:
+    """Crea las particiones del mes actual y de los `meses` siguientes que falten."""
+    creadas = []
+    async with db.engine.begin() as conn:
+        if not await esta_particionada(conn):
+            return creadas
+        # Varios workers arrancando a la vez: uno crea, los demás ven que ya están
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+        particiones = await listar_particiones(conn)
+        existentes = {p.desde for p in particiones if not p.default}
+        hay_default = any(p.default for p in particiones)
+        actual = _mes(datetime.date.today())
+        for i in range(meses + 1):
+            desde = _sumar_meses(actual, i)
+            if desde not in existentes:
+                creadas.append(await _crear_particion(conn, desde, hay_default))
+    for nombre in creadas:
+        logger.info("Partición creada: %s", nombre)
+    return creadas
+
+
+async def convertir() -> int:
+    """
+    Reescribe `historialcuidado` como tabla particionada por mes, con los
+    mismos datos, ids (misma secuencia), clave foránea e índice por mascota.
+    La clave primaria pasa a ser (id, fecha): PostgreSQL exige que incluya la
+    columna de partición. Bloquea la tabla mientras copia.
+    """
+    async with db.engine.begin() as conn:
+        if conn.dialect.name != "postgresql":
+            raise RuntimeError("El particionado requiere PostgreSQL")
+        if await esta_particionada(conn):
+            return 0
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+        await conn.execute(text(f"LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE"))
+
+        secuencia = (
+            await conn.execute(text(f"SELECT pg_get_serial_sequence('{TABLA}', 'id')"))
+        ).scalar_one()
+        minimo = (await conn.execute(text(f"SELECT min(fecha) FROM {TABLA}"))).scalar_one()
+        actual = _mes(datetime.date.today())
+        primero = min(_mes(minimo), actual) if minimo else actual
+
+        viejo = f"{TABLA}_sin_particionar"
+        await conn.execute(text(f"ALTER TABLE {TABLA} RENAME TO {viejo}"))
+        await conn.execute(
+            text(
+                f"CREATE TABLE {TABLA} (LIKE {viejo} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                "PARTITION BY RANGE (fecha)"
+            )
+        )
+        await conn.execute(
+            text(
+                f"CREATE TABLE {TABLA}_antiguo PARTITION OF {TABLA} "
+                f"FOR VALUES FROM (MINVALUE) TO ('{primero.isoformat()}')"
+            )
+        )
+        mes = primero
+        while mes <= _sumar_meses(actual, HISTORIAL_PARTICIONES_FUTURAS):
+            await _crear_particion(conn, mes, hay_default=False)
+            mes = _sumar_meses(mes, 1)
+        await conn.execute(text(f"CREATE TABLE {TABLA}_default PARTITION OF {TABLA} DEFAULT"))
+
+        copiadas = (
+            await conn.execute(text(f"INSERT INTO {TABLA} SELECT * FROM {viejo}"))
+        ).rowcount
+        if secuencia:
+            await conn.execute(text(f"ALTER SEQUENCE {secuencia} OWNED BY {TABLA}.id"))
+        # Los nombres de la clave primaria, la foránea y el índice quedan libres
+        await conn.execute(text(f"DROP TABLE {viejo}"))
+        await conn.execute(text(f"ALTER TABLE {TABLA} ADD PRIMARY KEY (id, fecha)"))
+        await conn.execute(
+            text(f"ALTER TABLE {TABLA} ADD FOREIGN KEY (mascota_id) REFERENCES mascota (id)")
+        )
+        await conn.execute(
+            text(
+                f"CREATE INDEX ix_historialcuidado_mascota_fecha "
+                f"ON {TABLA} (mascota_id, fecha DESC, id DESC)"
+            )
+        )
+    logger.info("historialcuidado particionada: %d filas copiadas", copiadas)
+    return copiadas
+
+
+async def _mantener() -> None:
+    while True:
+        await asyncio.sleep(24 * 3600)
+        try:
+            await crear_futuras()
+        except Exception:
+            logger.exception("No se pudieron crear las particiones futuras del historial")
+
+
+async def iniciar() -> None:
+    """Lifespan: particiones de los próximos meses y revisión diaria."""
+    global _mantenimiento
+    await crear_futuras()
+    _mantenimiento = asyncio.create_task(_mantener())
+
+
+async def detener() -> None:
+    global _mantenimiento
+    if _mantenimiento is None:
+        return
+    _mantenimiento.cancel()
+    try:
+        await _mantenimiento
+    except asyncio.CancelledError:
+        pass
+    _mantenimiento = None
+
+
+# -----------------------------
+# Archivo en frío
+# -----------------------------
+
+def _directorio() -> Path:
+    return Path(HISTORIAL_ARCHIVO_DIR)
+
+
+def _escribir_parquet(ruta: Path, lotes: list[list[tuple]]):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("mascota_id", pa.int64()),
+            ("fecha", pa.date32()),
+            ("tipo_evento", pa.string()),
+            ("costo", pa.float64()),
+        ]
+    )
+    with pq.ParquetWriter(ruta, esquema, compression="zstd") as writer:
+        for lote in lotes:
+            columnas = list(zip(*lote))
+            writer.write_table(
+                pa.Table.from_arrays([pa.array(c, t.type) for c, t in zip(columnas, esquema)], schema=esquema),
+                row_group_size=_LOTE,
+            )
+    return pq.ParquetFile(ruta).metadata.num_rows
+
+
+def _conteos(archivo: str, lotes: list[list[tuple]]) -> list[dict]:
+    """Totales por mascota y tipo de las filas archivadas (para los resúmenes)."""
+    conteos: dict[tuple[int, str], dict] = {}
+    for lote in lotes:
+        for _, mascota_id, fecha, tipo_evento, costo in lote:
+            c = conteos.setdefault(
+                (mascota_id, tipo_evento),
+                {
+                    "archivo": archivo,
+                    "mascota_id": mascota_id,
+                    "tipo_evento": tipo_evento,
+                    "total": 0,
+                    "costo_total": 0.0,
+                    "ultima_fecha": fecha,
+                },
+            )
+            c["total"] += 1
+            c["costo_total"] += costo
+            c["ultima_fecha"] = max(c["ultima_fecha"], fecha)
+    return list(conteos.values())
+
+
+async def _archivar_rango(
+    desde: datetime.date | None,
+    hasta: datetime.date,
+    particion: str | None = None,
+    entera: bool = False,
+) -> dict:
+    """
+    Exporta las filas de [desde, hasta) de `particion` (o de la tabla) y las
+    saca de la base en la misma transacción: con `entera` se desengancha y
+    borra la partición, si no se borra el rango. En PostgreSQL la transacción
+    es REPEATABLE READ y la partición se bloquea contra escrituras, así nada
+    que no esté en el archivo se borra.
+    """
+    condicion = f"fecha < '{hasta.isoformat()}'"
+    if desde is not None:
+        condicion += f" AND fecha >= '{desde.isoformat()}'"
+    origen = particion or TABLA
+    nombre = f"{TABLA}_{desde.isoformat() if desde else 'inicio'}_{hasta.isoformat()}_{uuid.uuid4().hex[:8]}.parquet"
+    ruta = _directorio() / nombre
+    temporal = ruta.with_suffix(".tmp")
+
+    async with db.async_session_maker() as session:
+        postgres = session.bind.dialect.name == "postgresql"
+        if postgres:
+            await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            if particion:
+                await session.execute(text(f"LOCK TABLE {particion} IN SHARE MODE"))
+
+        # Lectura sin cursor del servidor: un portal de asyncpg abierto hasta el fin
+        # de la transacción impediría borrar la partición. El mes entero se junta
+        # en memoria de todos modos antes de escribir el Parquet.
+        result = await session.execute(
+            text(
+                f"SELECT {', '.join(COLUMNAS)} FROM {origen} WHERE {condicion} "
+                "ORDER BY mascota_id, fecha DESC, id DESC"
+            ).columns(*(HistorialCuidado.__table__.c[c] for c in COLUMNAS))
+        )
+        lotes = [[tuple(fila) for fila in lote] for lote in result.partitions(_LOTE)]
+        filas = sum(len(lote) for lote in lotes)
+
+        if filas:
+            try:
+                escritas = await asyncio.to_thread(_escribir_parquet, temporal, lotes)
+                if escritas != filas:
+                    raise RuntimeError(f"{temporal}: {escritas} filas escritas de {filas}")
+                os.replace(temporal, ruta)
+            except BaseException:
+                temporal.unlink(missing_ok=True)
+                raise
+            session.add(
+                HistorialArchivo(
+                    archivo=nombre,
+                    desde=desde,
+                    hasta=hasta,
+                    filas=filas,
+                    creado=datetime.datetime.now(datetime.timezone.utc),
+                )
+            )
+            await session.flush()
+            await session.exec(insert(HistorialArchivoConteo), params=_conteos(nombre, lotes))
+
+        if entera:
+            await session.execute(text(f"ALTER TABLE {TABLA} DETACH PARTITION {particion}"))
+            await session.execute(text(f"DROP TABLE {particion}"))
+        else:
+            await session.execute(text(f"DELETE FROM {origen} WHERE {condicion}"))
+        if filas:
+            await registrar_cambio(session, "historial")
+        try:
+            await session.commit()
+        except BaseException:
+            ruta.unlink(missing_ok=True)
+            raise
+    if filas:
+        invalidate("historial")
+
+    logger.info("Archivado %s: %d filas (%s)", origen, filas, nombre if filas else "sin archivo")
+    return {"particion": particion, "desde": desde, "hasta": hasta, "filas": filas, "archivo": nombre if filas else None}
+
+
+async def _meses_a_archivar(conn: AsyncConnection, origen: str, corte: datetime.date) -> list[tuple]:
+    """Un rango por mes desde el evento más viejo de `origen` hasta `corte`."""
+    minimo = (
+        await conn.execute(text(f"SELECT min(fecha) FROM {origen} WHERE fecha < '{corte.isoformat()}'"))
+    ).scalar_one()
+    if minimo is None:
+        return []
+    if isinstance(minimo, str):  # SQLite devuelve texto en consultas crudas
+        minimo = datetime.date.fromisoformat(minimo)
+    particion = None if origen == TABLA else origen
+    rangos = []
+    mes = _mes(minimo)
+    while mes < corte:
+        rangos.append((mes, _sumar_meses(mes, 1), particion, False))
+        mes = _sumar_meses(mes, 1)
+    return rangos
+
+
+async def archivar(retencion_meses: int = HISTORIAL_RETENCION_MESES) -> list[dict]:
+    """Archiva todo lo anterior al mes actual menos `retencion_meses`."""
+    if not PYARROW_DISPONIBLE:
+        raise RuntimeError("El archivo del historial requiere pyarrow (pip install pyarrow)")
+    _directorio().mkdir(parents=True, exist_ok=True)
+    corte = _sumar_meses(_mes(datetime.date.today()), -retencion_meses)
+
+    async with db.engine.connect() as conn:
+        particionada = await esta_particionada(conn)
+        if particionada:
+            rangos = []
+            for p in await listar_particiones(conn):
+                if p.default:
+                    # Eventos cargados con fecha de un mes ya archivado (su partición
+                    # ya no existe) caen en la partición por defecto
+                    rangos += await _meses_a_archivar(conn, p.nombre, corte)
+                elif p.hasta <= corte:
+                    # La partición "antiguo" (desde MINVALUE) se vacía pero se conserva
+                    rangos.append((p.desde, p.hasta, p.nombre, p.desde is not None))
+        else:
+            rangos = await _meses_a_archivar(conn, TABLA, corte)
+
+    resultados = []
+    for desde, hasta, particion, entera in sorted(rangos, key=lambda r: r[1]):
+        resultado = await _archivar_rango(desde, hasta, particion, entera)
+        # Meses sin eventos (sin particiones) no se informan
+        if resultado["filas"] or entera:
+            resultados.append(resultado)
+    return resultados
+
+
+def _leer_archivos(
+    rutas: list[tuple[Path, datetime.date]],
+    mascota_id: int,
+    antes: tuple[datetime.date, int] | None,
+    limite: int | None,
+    piso: datetime.date | None,
+) -> list[FilaArchivada]:
+    import pyarrow.parquet as pq
+
+    filas: list[FilaArchivada] = []
+    for ruta, hasta in rutas:
+        # Archivos del más nuevo al más viejo: si ya hay `limite` filas posteriores
+        # a todo lo que puede tener este archivo, no hace falta leerlo
+        if limite is not None and len(filas) >= limite and filas[limite - 1].fecha >= hasta:
+            break
+        filtros = [("mascota_id", "=", mascota_id)]
+        if antes is not None:
+            filtros.append(("fecha", "<=", antes[0]))
+        if piso is not None:
+            filtros.append(("fecha", ">=", piso))
+        tabla = pq.read_table(ruta, columns=list(COLUMNAS), filters=filtros)
+        for fila in tabla.to_pylist():
+            fila = FilaArchivada(**fila)
+            if antes is None or (fila.fecha, fila.id) < antes:
+                filas.append(fila)
+        filas.sort(key=lambda f: (f.fecha, f.id), reverse=True)
+    return filas if limite is None else filas[:limite]
+
+
+async def hay_archivo(session: AsyncSession) -> bool:
+    result = await session.exec(select(func.count()).select_from(HistorialArchivo))
+    return bool(result.one())
+
+
+async def leer_archivados(
+    session: AsyncSession,
+    mascota_id: int,
+    antes: tuple[datetime.date, int] | None = None,
+    limite: int | None = None,
+    piso: datetime.date | None = None,
+) -> list[FilaArchivada]:
+    """
+    Eventos archivados de una mascota, del más reciente al más antiguo,
+    anteriores a `antes` (fecha, id) y desde `piso` si se indican. Solo se
+    abren los archivos cuyo rango puede tener esos eventos.
+    """
+    stmt = select(HistorialArchivo).order_by(HistorialArchivo.hasta.desc())
+    if antes is not None:
+        stmt = stmt.where(
+            (HistorialArchivo.desde == None) | (HistorialArchivo.desde <= antes[0])  # noqa: E711
+        )
+    if piso is not None:
+        stmt = stmt.where(HistorialArchivo.hasta > piso)
+    archivos = (await session.exec(stmt)).all()
+    if not archivos:
+        return []
+    if not PYARROW_DISPONIBLE:
+        raise HTTPException(status_code=503, detail="Falta pyarrow para leer el historial archivado")
+
+    rutas = [(_directorio() / a.archivo, a.hasta) for a in archivos]
+    faltantes = [ruta.name for ruta, _ in rutas if not ruta.exists()]
+    if faltantes:
+        logger.error("Archivos del historial no encontrados en %s: %s", _directorio(), faltantes)
+        raise HTTPException(
+            status_code=503, detail="El historial archivado no está disponible en este servidor"
+        )
+    return await asyncio.to_thread(_leer_archivos, rutas, mascota_id, antes, limite, piso)
+
+
+async def estado() -> dict:
+    async with db.engine.connect() as conn:
+        particionada = await esta_particionada(conn)
+        particiones = await listar_particiones(conn) if particionada else []
+    async with db.async_session_maker() as session:
+        archivos = (await session.exec(select(HistorialArchivo).order_by(HistorialArchivo.hasta))).all()
+    return {"particionada": particionada, "particiones": particiones, "archivos": archivos}
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Particiones y archivo del historial de cuidados")
+    accion = parser.add_mutually_exclusive_group()
+    accion.add_argument("--convertir", action="store_true", help="Particionar la tabla (PostgreSQL)")
+    accion.add_argument("--archivar", action="store_true", help="Archivar los meses fuera de la retención")
+    accion.add_argument("--estado", action="store_true", help="Mostrar particiones y archivos")
+    parser.add_argument(
+        "--retencion-meses",
+        type=int,
+        default=HISTORIAL_RETENCION_MESES,
+        help="Meses que quedan en la base al archivar",
+    )
+    args = parser.parse_args()
+
+    try:
+        if args.convertir:
+            print(f"{await convertir()} filas copiadas a la tabla particionada")
+        elif args.archivar:
+            for r in await archivar(args.retencion_meses):
+                print(f"{r['desde'] or '...'} - {r['hasta']}: {r['filas']} filas -> {r['archivo'] or '-'}")
+        elif args.estado:
+            datos = await estado()
+            print("Particionada" if datos["particionada"] else "Sin particionar")
+            for p in datos["particiones"]:
+                limites = "DEFAULT" if p.default else f"{p.desde or 'MINVALUE'} - {p.hasta}"
+                print(f"  {p.nombre}: {limites}")
+            for a in datos["archivos"]:
+                print(f"  [archivo] {a.desde or '...'} - {a.hasta}: {a.filas} filas ({a.archivo})")
+        else:
+            creadas = await crear_futuras()
+            print("\n".join(creadas) if creadas else "Sin particiones nuevas")
+    finally:
+        await db.dispose_engines()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
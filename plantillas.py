@@ -0,0 +1,146 @@
+# plantillas.py
+"""
+Renderizado de las vistas HTML (Jinja2).
+
+- Caché de bytecode en disco (TEMPLATES_BYTECODE_CACHE_DIR): las plantillas
+  compiladas sobreviven a los reinicios y a los workers nuevos.
+- Caché de fragmentos: `{% fragmento "nombre", clave... %}...{% endfragmento %}`
+  guarda el HTML de un bloque (p. ej. la tarjeta de una mascota) por clave.
+  La clave incluye `version_fila(obj)`, un hash de las columnas de la fila,
+  así que un cambio en la fila genera otra clave y nunca se sirve HTML viejo.
+- Modo streaming (TEMPLATES_STREAM=true): la página se envía en trozos a
+  medida que se renderiza, así el navegador recibe la cabecera y empieza a
+  pedir CSS/JS mientras se generan las filas.
+"""
+import hashlib
+import os
+from typing import Any, AsyncIterator
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from cache import MemoryCache
+
+TEMPLATES_DIR = "templates"
+# Vacío desactiva la caché de bytecode
+TEMPLATES_BYTECODE_CACHE_DIR = os.getenv("TEMPLATES_BYTECODE_CACHE_DIR", ".jinja_cache")
+# false evita revisar la fecha de cada plantilla en cada request (producción)
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "true").strip().lower() in (
+    "1", "true", "yes", "si", "on"
+)
+# Fragmentos en caché (0 desactiva)
+TEMPLATES_FRAGMENT_CACHE_SIZE = int(os.getenv("TEMPLATES_FRAGMENT_CACHE_SIZE", "5000"))
+TEMPLATES_STREAM = os.getenv("TEMPLATES_STREAM", "false").strip().lower() in (
+    "1", "true", "yes", "si", "on"
+)
+# Bytes mínimos por trozo enviado en modo streaming
+TEMPLATES_STREAM_CHUNK = int(os.getenv("TEMPLATES_STREAM_CHUNK", "4096"))
+
+# Las claves cambian con el contenido, así que no hace falta TTL ni invalidación
+_FRAGMENTO_TTL = 24 * 3600
+_fragmentos = MemoryCache(max_entries=max(TEMPLATES_FRAGMENT_CACHE_SIZE, 1))
+
+
+def version_fila(*objetos: Any) -> str:
+    """Hash corto de los valores de las columnas de cada fila (o del valor, si no es una fila)."""
+    valores = []
+    for obj in objetos:
+        tabla = getattr(obj, "__table__", None)
+        if tabla is None:
+            valores.append(obj)
+        else:
+            valores.append(tuple(getattr(obj, c.key, None) for c in tabla.columns))
+    return hashlib.blake2b(repr(valores).encode(), digest_size=8).hexdigest()
+
+
+class FragmentCacheExtension(Extension):
+    """`{% fragmento "tarjeta-mascota", m.id, version_fila(m) %}...{% endfragmento %}`"""
+
+    tags = {"fragmento"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        partes = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            partes.append(parser.parse_expression())
+        cuerpo = parser.parse_statements(("name:endfragmento",), drop_needle=True)
+        llamada = self.call_method("_renderizar", [nodes.List(partes)])
+        return nodes.CallBlock(llamada, [], [], cuerpo).set_lineno(lineno)
+
+    def _renderizar(self, partes: list, caller):
+        if not TEMPLATES_FRAGMENT_CACHE_SIZE:
+            return caller()
+        clave = repr(partes)
+        html = _fragmentos.get(clave)
+        if html is not None:
+            return html
+        if self.environment.is_async:
+            return self._renderizar_async(clave, caller)
+        html = caller()
+        _fragmentos.set(clave, html, ("fragmento",), _FRAGMENTO_TTL)
+        return html
+
+    async def _renderizar_async(self, clave: str, caller):
+        html = await caller()
+        _fragmentos.set(clave, html, ("fragmento",), _FRAGMENTO_TTL)
+        return html
+
+
+def _bytecode_cache(patron: str) -> FileSystemBytecodeCache | None:
+    if not TEMPLATES_BYTECODE_CACHE_DIR:
+        return None
+    os.makedirs(TEMPLATES_BYTECODE_CACHE_DIR, exist_ok=True)
+    return FileSystemBytecodeCache(TEMPLATES_BYTECODE_CACHE_DIR, patron)
+
+
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env.bytecode_cache = _bytecode_cache("__jinja2_%s.cache")
+templates.env.auto_reload = TEMPLATES_AUTO_RELOAD
+templates.env.add_extension(FragmentCacheExtension)
+templates.env.globals["version_fila"] = version_fila
+
+# Mismo loader, filtros y globales (url_for, ...), pero con render asíncrono.
+# El código compilado es distinto, así que va en otros archivos de caché.
+_env_async = templates.env.overlay(
+    enable_async=True, bytecode_cache=_bytecode_cache("__jinja2_async_%s.cache")
+)
+
+
+async def _generar(template, context: dict) -> AsyncIterator[bytes]:
+    trozos: list[str] = []
+    tamano = 0
+    async for trozo in template.generate_async(context):
+        trozos.append(trozo)
+        tamano += len(trozo)
+        if tamano >= TEMPLATES_STREAM_CHUNK:
+            yield "".join(trozos).encode()
+            trozos, tamano = [], 0
+    if trozos:
+        yield "".join(trozos).encode()
+
+
+def render(request: Request, name: str, context: dict, status_code: int = 200) -> Response:
+    """Como `templates.TemplateResponse`, pero en streaming si TEMPLATES_STREAM=true."""
+    if not TEMPLATES_STREAM:
+        return templates.TemplateResponse(request, name, context, status_code=status_code)
+    context.setdefault("request", request)
+    template = _env_async.get_template(name)
+    return StreamingResponse(
+        _generar(template, context), status_code=status_code, media_type="text/html; charset=utf-8"
+    )
+
+
+def fragmentos_stats() -> dict:
+    stats = _fragmentos.stats()
+    return {
+        "enabled": bool(TEMPLATES_FRAGMENT_CACHE_SIZE),
+        "entries": stats["entries"],
+        "max_entries": stats["max_entries"],
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_ratio": stats["hit_ratio"],
+        "evictions": stats["evictions"],
+    }
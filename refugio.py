@@ -1,12 +1,19 @@
 # refugio.py
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, Response, UploadFile, File
 from sqlmodel import select
 
-from db import SessionDep
+from busqueda import Buscador
+from cache import invalidate
+from db import ReadSessionDep, SessionDep
+from etag import condicional, registrar_cambio
+from fastjson import responder, seleccionar
+from loader import ReadLoaderDep, multi_get
 from models import Refugio, RefugioCreate, RefugioUpdate, Mascota
-from supa.supabase import upload_to_bucket
+from pagination import check_paging, decode_id_cursor, set_next_cursor
+from supa.supabase import UploadRejected, store_upload
+from thumbnails import generar_variantes_refugio
 
 
 router = APIRouter(prefix="/refugios", tags=["refugios"])
@@ -21,7 +28,9 @@ router = APIRouter(prefix="/refugios", tags=["refugios"])
 async def create_refugio(new_refugio: RefugioCreate, session: SessionDep):
     refugio = Refugio.model_validate(new_refugio)
     session.add(refugio)
+    await registrar_cambio(session, "refugio")
     await session.commit()
+    invalidate("refugio")
     await session.refresh(refugio)
     return refugio
 
@@ -31,31 +40,74 @@ async def create_refugio(new_refugio: RefugioCreate, session: SessionDep):
     response_model=List[Refugio],
     summary="Listar refugios",
 )
+@condicional("refugio")
 async def list_refugios(
-    session: SessionDep,
+    request: Request,
+    session: ReadSessionDep,
+    loader: ReadLoaderDep,
+    response: Response,
+    ids: str | None = Query(
+        None, description="IDs separados por coma (máx. 100); ignora filtros y paginación"
+    ),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: str | None = Query(None, description="Cursor devuelto en X-Next-Cursor"),
     solo_activos: bool = Query(True, description="Si True, solo refugios activos"),
 ):
+    if ids is not None:
+        return await multi_get(loader, Refugio, ids, response)
+
+    check_paging(skip, cursor)
+    after_id = decode_id_cursor(cursor, "refugios") if cursor is not None else None
+
     try:
-        stmt = select(Refugio)
+        stmt = seleccionar(Refugio).order_by(Refugio.id)
+        if after_id is not None:
+            stmt = stmt.where(Refugio.id > after_id)
         if solo_activos:
             stmt = stmt.where(Refugio.activo == True)
 
         stmt = stmt.offset(skip).limit(limit)
-        result = await session.execute(stmt)
-        return result.scalars().all()
+        result = await session.exec(stmt)
+        refugios = result.all()
     except Exception:
         # No exponemos detalles sensibles, solo indicamos que hubo un fallo.
         raise HTTPException(status_code=500, detail="Error al obtener refugios")
 
+    set_next_cursor(response, refugios, limit, "refugios", lambda r: (r.id,))
+    return responder(refugios, response)
+
+
+buscador = Buscador(Refugio, "refugio", "refugio_busqueda", ("nombre", "ubicacion"))
+
+
+@router.get(
+    "/buscar",
+    response_model=List[Refugio],
+    summary="Buscar refugios por nombre o ubicación (sin acentos, por prefijo y aproximada)",
+)
+@condicional("refugio")
+async def buscar_refugios(
+    request: Request,
+    session: ReadSessionDep,
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=100, description="Texto a buscar"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    solo_activos: bool = Query(True, description="Si True, solo refugios activos"),
+):
+    stmt = select(Refugio)
+    if solo_activos:
+        stmt = stmt.where(Refugio.activo == True)
+    return await buscador.buscar(session, stmt, q, skip, limit)
+
 
 @router.get(
     "/{refugio_id}",
     response_model=Refugio,
     summary="Obtener un refugio por ID",
 )
-async def get_refugio(refugio_id: int, session: SessionDep):
+async def get_refugio(refugio_id: int, session: ReadSessionDep):
     refugio_db = await session.get(Refugio, refugio_id)
     if not refugio_db:
         raise HTTPException(status_code=404, detail="Refugio no encontrado")
@@ -81,7 +133,9 @@ async def update_refugio(
         setattr(refugio_db, key, value)
 
     session.add(refugio_db)
+    await registrar_cambio(session, "refugio")
     await session.commit()
+    invalidate("refugio")
     await session.refresh(refugio_db)
     return refugio_db
 
@@ -98,7 +152,9 @@ async def delete_refugio(refugio_id: int, session: SessionDep):
 
     refugio_db.activo = False
     session.add(refugio_db)
+    await registrar_cambio(session, "refugio")
     await session.commit()
+    invalidate("refugio")
     await session.refresh(refugio_db)
     return refugio_db
 
@@ -113,7 +169,7 @@ async def delete_refugio(refugio_id: int, session: SessionDep):
 )
 async def list_mascotas_refugio(
     refugio_id: int,
-    session: SessionDep,
+    session: ReadSessionDep,
 ):
     refugio_db = await session.get(Refugio, refugio_id)
     if not refugio_db:
@@ -133,6 +189,7 @@ async def list_mascotas_refugio(
 )
 async def upload_refugio_image(
     refugio_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     session: SessionDep = None,
 ):
@@ -142,17 +199,25 @@ async def upload_refugio_image(
 
     # Subir archivo a Supabase
     try:
-        foto_url = await upload_to_bucket(file)
+        stored = await store_upload(file, keep_local=True)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error subiendo imagen: {e}")
 
-    refugio_db.foto_url = foto_url
+    # Las variantes anteriores ya no corresponden: se regeneran en segundo plano
+    refugio_db.foto_url = stored.url
+    refugio_db.foto_thumb_url = None
+    refugio_db.foto_web_url = None
     session.add(refugio_db)
+    await registrar_cambio(session, "refugio")
     await session.commit()
+    invalidate("refugio")
     await session.refresh(refugio_db)
+    background_tasks.add_task(generar_variantes_refugio, refugio_id, stored)
 
     return {
         "mensaje": "Imagen de refugio subida/actualizada correctamente",
         "refugio_id": refugio_id,
-        "foto_url": foto_url,
+        "foto_url": stored.url,
     }
@@ -0,0 +1,314 @@
+# rollups.py
+"""
+Tablas de resumen para los dashboards.
+
+- `adopcion_mensual`: adopciones por refugio y mes.
+- `mascota_conteo`: mascotas por refugio, especie y estado.
+- `historial_resumen`: eventos, costo total y última fecha de cuidado por mascota.
+- `historial_tipo_conteo`: eventos por mascota y tipo de evento.
+
+Las dos del historial también cuentan los eventos ya archivados en Parquet
+(tabla `historial_archivo_conteo`, ver particiones.py).
+
+Los routers llaman a `registrar_*` antes de su `commit()`, así el contador
+se actualiza en la misma transacción que la fila (y los dashboards abiertos
+reciben el cambio al hacer commit, ver envivo.py). Para comprobarlas o
+reconstruirlas desde cero (backfill o si se sospecha de una desviación):
+
+    python rollups.py --verificar
+    python rollups.py
+"""
+import argparse
+import asyncio
+import datetime
+from collections import defaultdict
+
+from sqlalchemy import case, delete, extract, func, insert, or_, union_all
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import envivo
+from db import dialect_insert
+from models import (
+    Adopcion,
+    AdopcionMensual,
+    HistorialArchivoConteo,
+    HistorialCuidado,
+    HistorialResumen,
+    HistorialTipoConteo,
+    Kind,
+    Mascota,
+    MascotaConteo,
+)
+
+
+def inicio_de_mes(fecha: datetime.date) -> datetime.date:
+    return fecha.replace(day=1)
+
+
+async def _sumar(session: AsyncSession, model, claves: dict, delta: int) -> None:
+    """
+    INSERT ... ON CONFLICT DO UPDATE SET total = total + delta.
+    El incremento es atómico aunque haya escrituras concurrentes.
+    """
+    stmt = dialect_insert(session, model).values(**claves, total=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(claves),
+        set_={"total": model.total + delta},
+    )
+    await session.exec(stmt)
+
+
+async def registrar_mascota(
+    session: AsyncSession, refugio_id: int, especie: Kind, estado: bool, delta: int = 1
+) -> None:
+    await _sumar(
+        session,
+        MascotaConteo,
+        {"refugio_id": refugio_id, "especie": especie, "estado": estado},
+        delta,
+    )
+    envivo.anotar(session, "mascotas", refugio_id, delta)
+
+
+async def mover_mascota(session: AsyncSession, antes: tuple, despues: tuple) -> None:
+    """Mueve una mascota entre claves (refugio_id, especie, estado) si cambió alguna."""
+    if antes == despues:
+        return
+    await registrar_mascota(session, *antes, delta=-1)
+    await registrar_mascota(session, *despues, delta=1)
+
+
+def clave_mascota(mascota: Mascota) -> tuple:
+    return mascota.refugio_id, mascota.especie, mascota.estado
+
+
+async def registrar_adopcion(
+    session: AsyncSession, refugio_id: int, fecha_adopcion: datetime.date, delta: int = 1
+) -> None:
+    await _sumar(
+        session,
+        AdopcionMensual,
+        {"refugio_id": refugio_id, "mes": inicio_de_mes(fecha_adopcion)},
+        delta,
+    )
+    envivo.anotar(session, "adopciones", f"{fecha_adopcion:%Y-%m}", delta)
+
+
+async def registrar_historial(session: AsyncSession, eventos: list) -> None:
+    """
+    Suma `eventos` (objetos con mascota_id, tipo_evento, costo y fecha) al
+    resumen de cada mascota. Agrupa en Python y hace un upsert multi-fila por
+    tabla, así la carga masiva no paga una sentencia por evento.
+    """
+    resumen: dict[int, dict] = {}
+    tipos: dict[tuple[int, str], int] = defaultdict(int)
+    for e in eventos:
+        r = resumen.setdefault(
+            e.mascota_id,
+            {
+                "mascota_id": e.mascota_id,
+                "total_eventos": 0,
+                "costo_total": 0.0,
+                "ultima_fecha": e.fecha,
+            },
+        )
+        r["total_eventos"] += 1
+        r["costo_total"] += e.costo
+        r["ultima_fecha"] = max(r["ultima_fecha"], e.fecha)
+        tipos[e.mascota_id, e.tipo_evento] += 1
+    if not resumen:
+        return
+
+    stmt = dialect_insert(session, HistorialResumen).values(list(resumen.values()))
+    nueva = stmt.excluded.ultima_fecha
+    actual = HistorialResumen.ultima_fecha
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["mascota_id"],
+        set_={
+            "total_eventos": HistorialResumen.total_eventos + stmt.excluded.total_eventos,
+            "costo_total": HistorialResumen.costo_total + stmt.excluded.costo_total,
+            "ultima_fecha": case((or_(actual.is_(None), actual < nueva), nueva), else_=actual),
+        },
+    )
+    await session.exec(stmt)
+
+    stmt = dialect_insert(session, HistorialTipoConteo).values(
+        [
+            {"mascota_id": mascota_id, "tipo_evento": tipo, "total": total}
+            for (mascota_id, tipo), total in tipos.items()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["mascota_id", "tipo_evento"],
+        set_={"total": HistorialTipoConteo.total + stmt.excluded.total},
+    )
+    await session.exec(stmt)
+
+
+# -----------------------------
+# Reconstrucción y verificación
+# -----------------------------
+
+def _conteo_mascotas():
+    return select(
+        Mascota.refugio_id, Mascota.especie, Mascota.estado, func.count()
+    ).group_by(Mascota.refugio_id, Mascota.especie, Mascota.estado)
+
+
+async def _adopciones_por_mes(session: AsyncSession) -> list[dict]:
+    anio = extract("year", Adopcion.fecha_adopcion).label("anio")
+    mes = extract("month", Adopcion.fecha_adopcion).label("mes")
+    result = await session.exec(
+        select(Adopcion.refugio_id, anio, mes, func.count()).group_by(
+            Adopcion.refugio_id, anio, mes
+        )
+    )
+    return [
+        {"refugio_id": refugio_id, "mes": datetime.date(int(y), int(m), 1), "total": total}
+        for refugio_id, y, m, total in result.all()
+    ]
+
+
+def _resumen_historial():
+    # Lo que sigue en historialcuidado más lo ya archivado (ver particiones.py)
+    vivos = select(
+        HistorialCuidado.mascota_id,
+        func.count().label("eventos"),
+        func.sum(HistorialCuidado.costo).label("costo"),
+        func.max(HistorialCuidado.fecha).label("ultima"),
+    ).group_by(HistorialCuidado.mascota_id)
+    archivados = select(
+        HistorialArchivoConteo.mascota_id,
+        func.sum(HistorialArchivoConteo.total),
+        func.sum(HistorialArchivoConteo.costo_total),
+        func.max(HistorialArchivoConteo.ultima_fecha),
+    ).group_by(HistorialArchivoConteo.mascota_id)
+    u = union_all(vivos, archivados).subquery()
+    return select(
+        u.c.mascota_id, func.sum(u.c.eventos), func.sum(u.c.costo), func.max(u.c.ultima)
+    ).group_by(u.c.mascota_id)
+
+
+def _conteo_tipos():
+    vivos = select(
+        HistorialCuidado.mascota_id, HistorialCuidado.tipo_evento, func.count().label("total")
+    ).group_by(HistorialCuidado.mascota_id, HistorialCuidado.tipo_evento)
+    archivados = select(
+        HistorialArchivoConteo.mascota_id,
+        HistorialArchivoConteo.tipo_evento,
+        func.sum(HistorialArchivoConteo.total),
+    ).group_by(HistorialArchivoConteo.mascota_id, HistorialArchivoConteo.tipo_evento)
+    u = union_all(vivos, archivados).subquery()
+    return select(u.c.mascota_id, u.c.tipo_evento, func.sum(u.c.total)).group_by(
+        u.c.mascota_id, u.c.tipo_evento
+    )
+
+
+async def reconstruir(session: AsyncSession) -> dict:
+    """Recalcula todas las tablas de resumen desde las tablas base (en una transacción)."""
+    await session.exec(delete(MascotaConteo))
+    conteos = await session.exec(
+        insert(MascotaConteo).from_select(
+            ["refugio_id", "especie", "estado", "total"], _conteo_mascotas()
+        )
+    )
+
+    await session.exec(delete(AdopcionMensual))
+    filas = await _adopciones_por_mes(session)
+    if filas:
+        await session.exec(insert(AdopcionMensual), params=filas)
+
+    await session.exec(delete(HistorialResumen))
+    resumenes = await session.exec(
+        insert(HistorialResumen).from_select(
+            ["mascota_id", "total_eventos", "costo_total", "ultima_fecha"], _resumen_historial()
+        )
+    )
+
+    await session.exec(delete(HistorialTipoConteo))
+    tipos = await session.exec(
+        insert(HistorialTipoConteo).from_select(
+            ["mascota_id", "tipo_evento", "total"], _conteo_tipos()
+        )
+    )
+
+    await session.commit()
+    return {
+        "mascota_conteo": conteos.rowcount,
+        "adopcion_mensual": len(filas),
+        "historial_resumen": resumenes.rowcount,
+        "historial_tipo_conteo": tipos.rowcount,
+    }
+
+
+def _diferencias(esperado: dict, guardado: dict) -> int:
+    return sum(1 for k in esperado.keys() | guardado.keys() if esperado.get(k) != guardado.get(k))
+
+
+async def verificar(session: AsyncSession) -> dict:
+    """
+    Compara cada tabla de resumen con lo que daría recalcularla y devuelve
+    cuántas claves difieren por tabla (0 = consistente). No modifica nada.
+    """
+    async def filas(stmt) -> list:
+        return (await session.exec(stmt)).all()
+
+    esperado = {(r, e, s): t for r, e, s, t in await filas(_conteo_mascotas())}
+    guardado = {
+        (c.refugio_id, c.especie, c.estado): c.total
+        for c in await filas(select(MascotaConteo).where(MascotaConteo.total != 0))
+    }
+    resultado = {"mascota_conteo": _diferencias(esperado, guardado)}
+
+    esperado = {(f["refugio_id"], f["mes"]): f["total"] for f in await _adopciones_por_mes(session)}
+    guardado = {
+        (a.refugio_id, a.mes): a.total
+        for a in await filas(select(AdopcionMensual).where(AdopcionMensual.total != 0))
+    }
+    resultado["adopcion_mensual"] = _diferencias(esperado, guardado)
+
+    # El costo es float: se compara redondeado a centavos
+    esperado = {m: (n, round(c, 2), f) for m, n, c, f in await filas(_resumen_historial())}
+    guardado = {
+        r.mascota_id: (r.total_eventos, round(r.costo_total, 2), r.ultima_fecha)
+        for r in await filas(select(HistorialResumen))
+    }
+    resultado["historial_resumen"] = _diferencias(esperado, guardado)
+
+    esperado = {(m, t): n for m, t, n in await filas(_conteo_tipos())}
+    guardado = {
+        (c.mascota_id, c.tipo_evento): c.total
+        for c in await filas(select(HistorialTipoConteo).where(HistorialTipoConteo.total != 0))
+    }
+    resultado["historial_tipo_conteo"] = _diferencias(esperado, guardado)
+    return resultado
+
+
+async def _main() -> int:
+    from db import async_session_maker, create_tables, engine
+
+    parser = argparse.ArgumentParser(description="Tablas de resumen")
+    parser.add_argument(
+        "--verificar",
+        action="store_true",
+        help="solo comprobar las tablas contra las tablas base (sale con 1 si hay diferencias)",
+    )
+    args = parser.parse_args()
+
+    try:
+        await create_tables()
+        async with async_session_maker() as session:
+            if args.verificar:
+                resultado = await verificar(session)
+                print(f"Diferencias por tabla: {resultado}")
+                return 1 if any(resultado.values()) else 0
+            resultado = await reconstruir(session)
+        print(f"Rollups reconstruidos: {resultado}")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(_main()))
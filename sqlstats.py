@@ -0,0 +1,176 @@
+# sqlstats.py
+"""
+Instrumentación de SQL por request.
+
+Los eventos de SQLAlchemy (`before/after_cursor_execute`) cuentan sentencias,
+filas y tiempo de base de datos en un objeto por request (ContextVar), y
+`SQLStatsMiddleware` los publica:
+
+- en la cabecera `Server-Timing` (visible en las DevTools del navegador),
+- en un log por request (logger "sql.request") con campos estructurados,
+- con un aviso si el request repitió la misma sentencia SQL_NPLUS1_THRESHOLD
+  veces o más (patrón N+1).
+
+Además, toda sentencia que tarde más de SQL_SLOW_MS se registra en el logger
+"sql.slow" con los parámetros ocultos (solo su tipo).
+"""
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SQL_STATS_ENABLED = os.getenv("SQL_STATS_ENABLED", "true").strip().lower() in (
+    "1", "true", "yes", "si", "on"
+)
+# 0 desactiva el log de consultas lentas
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "500"))
+SQL_NPLUS1_THRESHOLD = int(os.getenv("SQL_NPLUS1_THRESHOLD", "5"))
+
+logger_request = logging.getLogger("sql.request")
+logger_slow = logging.getLogger("sql.slow")
+
+
+class RequestStats:
+    __slots__ = ("sentencias", "filas", "db_tiempo", "repetidas")
+
+    def __init__(self):
+        self.sentencias = 0
+        self.filas = 0
+        self.db_tiempo = 0.0
+        self.repetidas: Counter = Counter()
+
+    def n_mas_uno(self) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.repetidas.most_common() if n >= SQL_NPLUS1_THRESHOLD]
+
+
+_stats: ContextVar[RequestStats | None] = ContextVar("sql_stats", default=None)
+
+
+def stats_actuales() -> RequestStats | None:
+    return _stats.get()
+
+
+def _resumir(sql: str, largo: int = 200) -> str:
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= largo else sql[:largo] + "..."
+
+
+def _redactar(parameters) -> str:
+    """Los valores pueden tener datos personales: solo se registra su tipo."""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: <{type(v).__name__}>" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"<{len(parameters)} filas>"
+        return "(" + ", ".join(f"<{type(v).__name__}>" for v in parameters) + ")"
+    return "<?>"
+
+
+# -----------------------------
+# Eventos de SQLAlchemy
+# -----------------------------
+# Se registran sobre la clase Engine: valen para cualquier engine del proceso
+# (el async engine usa por debajo uno síncrono).
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    context._sql_inicio = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_sql_inicio", None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+
+    stats = _stats.get()
+    if stats is not None:
+        stats.sentencias += 1
+        stats.db_tiempo += duracion
+        # asyncpg informa también las filas de un SELECT ("SELECT n"); SQLite
+        # y los cursores del lado del servidor dejan -1 y no suman
+        filas = cursor.rowcount
+        if filas is not None and filas >= 0:
+            stats.filas += filas
+        if not executemany:
+            stats.repetidas[statement] += 1
+
+    if SQL_SLOW_MS and duracion * 1000 >= SQL_SLOW_MS:
+        logger_slow.warning(
+            "consulta lenta %.1f ms: %s params=%s",
+            duracion * 1000,
+            _resumir(statement),
+            _redactar(parameters),
+            extra={"sql_ms": round(duracion * 1000, 3), "sql": _resumir(statement)},
+        )
+
+
+# -----------------------------
+# Middleware
+# -----------------------------
+
+class SQLStatsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not SQL_STATS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _stats.set(stats)
+        inicio = time.perf_counter()
+        status = 500
+
+        async def enviar(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total_ms = (time.perf_counter() - inicio) * 1000
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.db_tiempo * 1000:.1f};desc="{stats.sentencias} consultas", '
+                    f"app;dur={total_ms:.1f}",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _stats.reset(token)
+            self._registrar(scope, status, stats, time.perf_counter() - inicio)
+
+    def _registrar(self, scope: Scope, status: int, stats: RequestStats, total: float) -> None:
+        campos = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "sql_statements": stats.sentencias,
+            "sql_rows": stats.filas,
+            "sql_ms": round(stats.db_tiempo * 1000, 3),
+            "total_ms": round(total * 1000, 3),
+        }
+        repetidas = stats.n_mas_uno()
+        if repetidas:
+            campos["n_plus_one"] = [{"sql": _resumir(sql), "veces": n} for sql, n in repetidas]
+            logger_request.warning(
+                "posible N+1 en %s %s: %s",
+                scope["method"],
+                scope["path"],
+                "; ".join(f"{n}x {_resumir(sql, 120)}" for sql, n in repetidas),
+                extra=campos,
+            )
+        if logger_request.isEnabledFor(logging.INFO):
+            logger_request.info(
+                " ".join(f"{k}={v}" for k, v in campos.items() if k != "n_plus_one"),
+                extra=campos,
+            )
@@ -1,64 +1,119 @@
 # stats.py
-from collections import defaultdict
 from typing import Dict, List
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from sqlalchemy import extract, func
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from db import SessionDep
-from models import Refugio, Mascota, Adopcion, HistorialCuidado, Kind
+from cache import cached
+from db import ReadSessionDep
+from models import Refugio, Mascota, Adopcion, HistorialCuidado
 
 router = APIRouter(prefix="/stats", tags=["estadisticas"])
 
 
+# -----------------------------
+# Consultas agregadas
+# -----------------------------
+# Todas agrupan en la base de datos; a Python solo llegan unas pocas filas
+# (una por refugio/especie o por año), sin importar el tamaño de las tablas.
+
+def _anio_adopcion():
+    return extract("year", Adopcion.fecha_adopcion)
+
+
+async def _totales_escalares(session: AsyncSession):
+    """Totales de refugios (y activos) y de cuidados (cantidad y costo) en un único round trip."""
+    stmt = select(
+        select(func.count()).select_from(Refugio).scalar_subquery(),
+        select(func.count()).select_from(Refugio).where(Refugio.activo == True).scalar_subquery(),
+        select(func.count()).select_from(HistorialCuidado).scalar_subquery(),
+        select(func.coalesce(func.sum(HistorialCuidado.costo), 0)).scalar_subquery(),
+    )
+    result = await session.exec(stmt)
+    return result.one()
+
+
+async def _mascotas_por_refugio_especie(session: AsyncSession):
+    stmt = select(
+        Mascota.refugio_id,
+        Mascota.especie,
+        func.count(),
+        func.count().filter(Mascota.estado == True),
+    ).group_by(Mascota.refugio_id, Mascota.especie)
+    result = await session.exec(stmt)
+    return result.all()
+
+
+async def _adopciones_por_anio_refugio(session: AsyncSession):
+    anio = _anio_adopcion().label("anio")
+    stmt = (
+        select(anio, Adopcion.refugio_id, func.count())
+        .group_by(anio, Adopcion.refugio_id)
+        .order_by(anio)
+    )
+    result = await session.exec(stmt)
+    return result.all()
+
+
 @router.get(
     "/resumen-general",
     summary="Resumen general de la plataforma",
 )
-async def resumen_general(session: SessionDep) -> Dict:
-    # Refugios
-    ref_result = await session.exec(select(Refugio))
-    refugios = ref_result.all()
-    total_refugios = len(refugios)
-
-    # Mascotas
-    masc_result = await session.exec(select(Mascota))
-    mascotas = masc_result.all()
-    total_mascotas = len(mascotas)
-    mascotas_activas = sum(1 for m in mascotas if m.estado)
-    mascotas_inactivas = total_mascotas - mascotas_activas
-
-    # Adopciones
-    adop_result = await session.exec(select(Adopcion))
-    adopciones = adop_result.all()
-    total_adopciones = len(adopciones)
-
-    # Historial de cuidado
-    hist_result = await session.exec(select(HistorialCuidado))
-    eventos = hist_result.all()
-    costo_total_cuidados = sum(e.costo for e in eventos)
-
-    # Distribución de mascotas por especie
+@cached("refugio", "mascota", "adopcion", "historial")
+async def resumen_general(request: Request, session: ReadSessionDep) -> Dict:
+    (
+        total_refugios,
+        refugios_activos,
+        total_eventos,
+        costo_total_cuidados,
+    ) = await _totales_escalares(session)
+
+    # Mascotas: totales, por especie y por refugio salen del mismo GROUP BY
+    total_mascotas = 0
+    mascotas_activas = 0
     por_especie: dict[str, int] = {}
-    for m in mascotas:
-        por_especie[m.especie.value] = por_especie.get(m.especie.value, 0) + 1
+    mascotas_por_refugio: dict[int, dict[str, int]] = {}
+    for refugio_id, especie, total, activas in await _mascotas_por_refugio_especie(session):
+        especie = especie.value if hasattr(especie, "value") else especie
+        total_mascotas += total
+        mascotas_activas += activas
+        por_especie[especie] = por_especie.get(especie, 0) + total
+        grupo = mascotas_por_refugio.setdefault(refugio_id, {"total": 0, "activas": 0})
+        grupo["total"] += total
+        grupo["activas"] += activas
+
+    # Adopciones: total, por año y por refugio salen del mismo GROUP BY
+    total_adopciones = 0
+    adopciones_anio: dict[int, int] = {}
+    adopciones_refugio: dict[int, int] = {}
+    for anio, refugio_id, total in await _adopciones_por_anio_refugio(session):
+        total_adopciones += total
+        if anio is not None:
+            adopciones_anio[int(anio)] = adopciones_anio.get(int(anio), 0) + total
+        adopciones_refugio[refugio_id] = adopciones_refugio.get(refugio_id, 0) + total
 
     return {
         "refugios": {
             "total": total_refugios,
+            "activos": refugios_activos,
         },
         "mascotas": {
             "total": total_mascotas,
             "activas": mascotas_activas,
-            "inactivas": mascotas_inactivas,
+            "inactivas": total_mascotas - mascotas_activas,
             "por_especie": por_especie,
+            "por_refugio": mascotas_por_refugio,
         },
         "adopciones": {
             "total": total_adopciones,
+            "por_anio": adopciones_anio,
+            "por_refugio": adopciones_refugio,
         },
         "cuidados": {
-            "total_eventos": len(eventos),
-            "costo_total": costo_total_cuidados,
+            "total_eventos": total_eventos,
+            "costo_total": float(costo_total_cuidados),
         },
     }
 
@@ -67,16 +122,18 @@ async def resumen_general(session: SessionDep) -> Dict:
     "/adopciones-por-anio",
     summary="Adopciones agrupadas por año",
 )
-async def adopciones_por_anio(session: SessionDep) -> List[Dict]:
-    adop_result = await session.exec(select(Adopcion))
-    adopciones = adop_result.all()
-
-    conteo_por_anio: dict[int, int] = defaultdict(int)
-    for a in adopciones:
-        if a.fecha_adopcion:
-            conteo_por_anio[a.fecha_adopcion.year] += 1
+@cached("adopcion")
+async def adopciones_por_anio(request: Request, session: ReadSessionDep) -> List[Dict]:
+    anio = _anio_adopcion().label("anio")
+    stmt = (
+        select(anio, func.count())
+        .where(Adopcion.fecha_adopcion.is_not(None))
+        .group_by(anio)
+        .order_by(anio)
+    )
+    result = await session.exec(stmt)
 
     return [
-        {"anio": anio, "total_adopciones": total}
-        for anio, total in sorted(conteo_por_anio.items())
+        {"anio": int(anio), "total_adopciones": total}
+        for anio, total in result.all()
     ]
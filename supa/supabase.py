@@ -1,10 +1,21 @@
 # supa/supabase.py
+import asyncio
+import hashlib
 import os
-from typing import Optional
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 from dotenv import load_dotenv
-from fastapi import UploadFile
-from supabase import create_client, Client
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 load_dotenv()
 
@@ -12,34 +23,256 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET")
 
-_supabase_client: Optional[Client] = None
+# "supabase" (por defecto) o "local" (carpeta en disco, útil en desarrollo y pruebas)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").strip().lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "static/uploads")
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "/static/uploads")
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Cabeceras de cada parte, boundaries y otros campos del formulario multipart
+UPLOAD_MULTIPART_MARGIN = 64 * 1024
+
+# Tipos aceptados -> extensión del objeto guardado
+ALLOWED_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+_supabase_client: Optional["Client"] = None
+
+
+class UploadRejected(ValueError):
+    """Archivo rechazado antes de subirlo (tamaño o tipo)."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
 
 
-def get_supabase_client() -> Client:
+@dataclass
+class StoredObject:
+    path: str
+    url: str
+    sha256: str
+    content_type: str
+    size: int
+    # Copia local del archivo (solo con keep_local=True; la borra quien la pidió)
+    local_path: str | None = None
+
+
+def get_supabase_client() -> "Client":
     global _supabase_client
     if _supabase_client is None:
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise ValueError("No están configuradas las credenciales de Supabase")
+        # El cliente (httpx, storage3, postgrest, ...) tarda en importarse: se carga
+        # con la primera subida, no al arrancar cada worker
+        from supabase import create_client
+
         _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
     return _supabase_client
 
 
-async def upload_to_bucket(file: UploadFile) -> str:
+def _detectar_tipo(cabecera: bytes) -> str | None:
+    """Tipo real según los primeros bytes (no confiamos en el content-type del cliente)."""
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "image/webp"
+    if cabecera[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return None
+
+
+# -----------------------------
+# Backends de almacenamiento
+# -----------------------------
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def public_url(self, path: str) -> str:
+        ...
+
+    @abstractmethod
+    async def put(self, path: str, local_file: str, content_type: str) -> None:
+        """Sube `local_file` a `path`. Si el objeto ya existe no hace nada."""
+
+
+class SupabaseStorage(StorageBackend):
+    def __init__(self, bucket: str | None = SUPABASE_BUCKET):
+        self.bucket = bucket
+
+    def public_url(self, path: str) -> str:
+        return get_supabase_client().storage.from_(self.bucket).get_public_url(path)
+
+    def _put(self, path: str, local_file: str, content_type: str) -> None:
+        from storage3.exceptions import StorageApiError
+
+        bucket = get_supabase_client().storage.from_(self.bucket)
+        try:
+            # El archivo abierto se envía en streaming desde disco y se cierra
+            # aquí también si la subida falla
+            with open(local_file, "rb") as fh:
+                bucket.upload(path=path, file=fh, file_options={"content-type": content_type})
+        except StorageApiError as e:
+            # Mismo hash = mismo contenido: el objeto ya estaba subido
+            if str(e.status) != "409" and e.code != "Duplicate":
+                raise
+
+    async def put(self, path: str, local_file: str, content_type: str) -> None:
+        # El cliente de Supabase es síncrono: se ejecuta fuera del event loop
+        await asyncio.to_thread(self._put, path, local_file, content_type)
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, directory: str = LOCAL_STORAGE_DIR, base_url: str = LOCAL_STORAGE_URL):
+        self.directory = Path(directory)
+        self.base_url = base_url.rstrip("/")
+
+    def public_url(self, path: str) -> str:
+        return f"{self.base_url}/{path}"
+
+    def _put(self, path: str, local_file: str) -> None:
+        destino = self.directory / path
+        if destino.exists():
+            return
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_file, destino)
+
+    async def put(self, path: str, local_file: str, content_type: str) -> None:
+        await asyncio.to_thread(self._put, path, local_file)
+
+
+_storage: StorageBackend | None = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        _storage = LocalStorage() if STORAGE_BACKEND == "local" else SupabaseStorage()
+    return _storage
+
+
+def set_storage(storage: StorageBackend) -> None:
+    global _storage
+    _storage = storage
+
+
+# -----------------------------
+# Límite del cuerpo multipart
+# -----------------------------
+
+class UploadLimitMiddleware:
     """
-    Sube un archivo al bucket de Supabase y devuelve la URL pública.
+    Corta con 413 los cuerpos multipart de más de UPLOAD_MAX_BYTES (más el
+    margen del formulario) antes de que Starlette los copie a disco: por el
+    Content-Length sin leer nada o, si no viene, al pasar el límite.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope) if scope["type"] == "http" else None
+        if headers is None or not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        limite = UPLOAD_MAX_BYTES + UPLOAD_MULTIPART_MARGIN
+        try:
+            declarado = int(headers.get("content-length", "0"))
+        except ValueError:
+            declarado = 0
+        recibidos = 0
+
+        def rechazar() -> HTTPException:
+            return HTTPException(
+                status_code=413, detail=f"El archivo supera {UPLOAD_MAX_BYTES} bytes"
+            )
+
+        async def recibir() -> Message:
+            # Se lanza al leer el cuerpo (dentro del endpoint), así responde el
+            # manejador de HTTPException de la app
+            nonlocal recibidos
+            if declarado > limite:
+                raise rechazar()
+            message = await receive()
+            if message["type"] == "http.request":
+                recibidos += len(message.get("body", b""))
+                if recibidos > limite:
+                    raise rechazar()
+            return message
+
+        await self.app(scope, recibir, send)
+
+
+# -----------------------------
+# Subida
+# -----------------------------
+
+async def store_upload(file: UploadFile, keep_local: bool = False) -> StoredObject:
+    """
+    Lee el archivo por bloques a un temporal en disco (calculando el SHA-256 y
+    cortando en cuanto supera UPLOAD_MAX_BYTES), valida el tipo por su firma y
+    lo guarda como `public/<sha256>.<ext>`: imágenes idénticas comparten objeto.
+    Con `keep_local=True` el temporal no se borra y se devuelve en `local_path`.
+    El cuerpo demasiado grande ya lo cortó antes UploadLimitMiddleware.
     """
-    client = get_supabase_client()
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise UploadRejected(f"El archivo supera {UPLOAD_MAX_BYTES} bytes", status_code=413)
 
-    file_content = await file.read()
-    file_path = f"public/{file.filename}"
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    ok = False
+    try:
+        with tmp:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if content_type is None:
+                    content_type = _detectar_tipo(chunk[:16])
+                    if content_type not in ALLOWED_TYPES:
+                        raise UploadRejected(
+                            "Tipo de archivo no permitido (JPEG, PNG, WebP o GIF)",
+                            status_code=415,
+                        )
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise UploadRejected(
+                        f"El archivo supera {UPLOAD_MAX_BYTES} bytes", status_code=413
+                    )
+                digest.update(chunk)
+                await asyncio.to_thread(tmp.write, chunk)
 
-    client.storage.from_(SUPABASE_BUCKET).upload(
-        path=file_path,
-        file=file_content,
-        file_options={
-            "content-type": file.content_type
-        }
-    )
+        if size == 0:
+            raise UploadRejected("El archivo está vacío")
 
-    public_url = client.storage.from_(SUPABASE_BUCKET).get_public_url(file_path)
-    return public_url
+        sha256 = digest.hexdigest()
+        path = f"public/{sha256}.{ALLOWED_TYPES[content_type]}"
+        storage = get_storage()
+        await storage.put(path, tmp.name, content_type)
+        ok = True
+        return StoredObject(
+            path,
+            storage.public_url(path),
+            sha256,
+            content_type,
+            size,
+            local_path=tmp.name if keep_local else None,
+        )
+    finally:
+        if not (ok and keep_local):
+            os.unlink(tmp.name)
+
+
+async def upload_to_bucket(file: UploadFile) -> str:
+    """
+    Sube un archivo al bucket de Supabase y devuelve la URL pública.
+    """
+    stored = await store_upload(file)
+    return stored.url
@@ -0,0 +1,129 @@
+# thumbnails.py
+"""
+Generación en segundo plano de variantes de las fotos (miniatura y versión web).
+
+Después de subir una foto, el router agenda `generar_variantes_*` como
+BackgroundTask. La decodificación y el redimensionado (CPU) corren en un
+pool de procesos para no bloquear el event loop; las variantes se guardan
+junto al original (`public/<sha256>_thumb.webp`, `public/<sha256>_web.webp`)
+y sus URLs quedan en `foto_thumb_url` / `foto_web_url`.
+
+Requiere Pillow; si no está instalado, las fotos se siguen sirviendo a
+tamaño original.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import invalidate
+from db import async_session_maker
+from etag import registrar_cambio
+from models import Mascota, Refugio
+from supa.supabase import StoredObject, get_storage
+
+logger = logging.getLogger("thumbnails")
+
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# nombre -> ancho máximo en px
+VARIANTES = {
+    "thumb": 400,
+    "web": 960,
+}
+
+PILLOW_DISPONIBLE = importlib.util.find_spec("PIL") is not None
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def _redimensionar(origen: str, anchos: dict[str, int]) -> dict[str, str]:
+    """
+    Se ejecuta en un proceso del pool. Devuelve {variante: ruta_temporal.webp}.
+    """
+    from PIL import Image, ImageOps
+
+    salidas: dict[str, str] = {}
+    with Image.open(origen) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ("RGB", "RGBA"):
+            imagen = imagen.convert("RGBA" if "transparency" in imagen.info else "RGB")
+
+        for nombre, ancho in anchos.items():
+            variante = imagen.copy()
+            variante.thumbnail((ancho, ancho * 4))
+            fd, ruta = tempfile.mkstemp(suffix=".webp")
+            with os.fdopen(fd, "wb") as destino:
+                variante.save(destino, "WEBP", quality=80, method=4)
+            salidas[nombre] = ruta
+    return salidas
+
+
+async def _generar(stored: StoredObject) -> dict[str, str]:
+    """Genera y sube las variantes; devuelve {variante: url}."""
+    loop = asyncio.get_running_loop()
+    archivos = await loop.run_in_executor(
+        _get_pool(), _redimensionar, stored.local_path, VARIANTES
+    )
+
+    storage = get_storage()
+    base = stored.path.rsplit(".", 1)[0]
+    urls: dict[str, str] = {}
+    try:
+        for nombre, archivo in archivos.items():
+            path = f"{base}_{nombre}.webp"
+            await storage.put(path, archivo, "image/webp")
+            urls[nombre] = storage.public_url(path)
+    finally:
+        for archivo in archivos.values():
+            os.unlink(archivo)
+    return urls
+
+
+async def _generar_y_guardar(model, entidad: str, obj_id: int, stored: StoredObject):
+    try:
+        if not PILLOW_DISPONIBLE:
+            logger.warning("Pillow no está instalado: no se generan miniaturas")
+            return
+        urls = await _generar(stored)
+
+        async with async_session_maker() as session:
+            obj = await session.get(model, obj_id)
+            # Si mientras tanto se subió otra foto, no pisar sus variantes
+            if obj is None or obj.foto_url != stored.url:
+                return
+            obj.foto_thumb_url = urls["thumb"]
+            obj.foto_web_url = urls["web"]
+            session.add(obj)
+            await registrar_cambio(session, entidad)
+            await session.commit()
+        invalidate(entidad)
+    except Exception:
+        logger.exception("Error generando variantes de %s %s", entidad, obj_id)
+    finally:
+        # store_upload(keep_local=True) deja el temporal para nosotros
+        os.unlink(stored.local_path)
+
+
+async def generar_variantes_mascota(mascota_id: int, stored: StoredObject):
+    await _generar_y_guardar(Mascota, "mascota", mascota_id, stored)
+
+
+async def generar_variantes_refugio(refugio_id: int, stored: StoredObject):
+    await _generar_y_guardar(Refugio, "refugio", refugio_id, stored)
@@ -1,7 +1,7 @@
 # upload.py
 from fastapi import APIRouter, UploadFile, File, HTTPException
 
-from supa.supabase import upload_to_bucket
+from supa.supabase import UploadRejected, upload_to_bucket
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
@@ -11,5 +11,7 @@ async def upload_image(file: UploadFile = File(...)):
     try:
         url = await upload_to_bucket(file)
         return {"url": url}
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))